@@ -0,0 +1,244 @@
+"""
+Project: Analyzing food access and security in Chicago
+Team: food.get
+File Name: access.py
+
+Description:
+    This file computes how much of each Census tract lies within a grocery
+    store buffer. The buffers are indexed in an STRtree, so each tract is only
+    compared with the buffers that intersect it. Those buffers are unioned and
+    clipped to the tract, which counts overlapping buffers once. Coverage at
+    several radii reuses one index of the store locations, and the area each
+    buffer alone covers comes from one overlay arrangement of all buffers.
+"""
+
+import numpy as np
+import shapely
+
+# segments per quarter circle, the GeoPandas buffer default used by
+# generate_metric.create_buffers
+BUFFER_QUAD_SEGS = 16
+
+
+def geometry_array(geometries):
+    """
+    Returns the shapely geometries of a GeoSeries, GeoDataFrame or sequence as
+    a numpy object array.
+    """
+    geometries = getattr(geometries, "geometry", geometries)
+
+    return np.asarray(getattr(geometries, "values", geometries), dtype=object)
+
+
+def tract_buffer_pairs(tracts, tree, distance=None):
+    """
+    Finds every intersecting (tract, buffer) pair.
+
+    Args:
+        tracts (array): tract polygons
+        tree (STRtree): index of the buffer polygons, or of store points when
+            distance is given
+        distance (float): pair each tract with the points within this distance
+            instead
+
+    Returns:
+        two int arrays of tract and buffer positions, sorted by tract
+    """
+    if distance is None:
+        tract_positions, buffer_positions = tree.query(tracts, predicate="intersects")
+    else:
+        tract_positions, buffer_positions = tree.query(
+            tracts, predicate="dwithin", distance=distance
+        )
+    order = np.lexsort((buffer_positions, tract_positions))
+
+    return tract_positions[order], buffer_positions[order]
+
+
+def buffer_unions(buffers, tract_positions, buffer_positions):
+    """
+    Unions the buffers paired with each tract.
+
+    Returns:
+        the positions of the tracts with at least one buffer and the union of
+        their buffers
+    """
+    starts = np.flatnonzero(np.r_[True, np.diff(tract_positions) != 0])
+    ends = np.r_[starts[1:], len(tract_positions)]
+    unions = np.array(
+        [
+            shapely.union_all(buffers[buffer_positions[start:end]])
+            for start, end in zip(starts, ends)
+        ],
+        dtype=object,
+    )
+
+    return tract_positions[starts], unions
+
+
+def clip_to_tracts(unions, tracts):
+    """
+    Clips each union to its tract. Tracts the union covers entirely are
+    returned as they are.
+
+    Returns:
+        the clipped polygons and a boolean array of the fully covered tracts
+    """
+    full = shapely.covers(unions, tracts)
+    clipped = tracts.copy()
+    clipped[~full] = shapely.intersection(unions[~full], tracts[~full])
+
+    return clipped, full
+
+
+def covered_geometries(tracts, buffers, tree=None):
+    """
+    Returns the part of each tract that lies within at least one buffer.
+
+    Args:
+        tracts (GeoSeries or array): tract polygons
+        buffers (GeoSeries or array): buffer polygons in the same CRS
+        tree (STRtree): index of the buffers, built when not given
+
+    Returns:
+        numpy object array of polygons, empty for tracts no buffer reaches
+    """
+    tracts = geometry_array(tracts)
+    buffers = geometry_array(buffers)
+    if tree is None:
+        tree = shapely.STRtree(buffers)
+
+    covered = np.full(len(tracts), shapely.Polygon(), dtype=object)
+    tract_positions, buffer_positions = tract_buffer_pairs(tracts, tree)
+    if len(tract_positions) == 0:
+        return covered
+
+    reached, unions = buffer_unions(buffers, tract_positions, buffer_positions)
+    covered[reached] = clip_to_tracts(unions, tracts[reached])[0]
+
+    return covered
+
+
+def covered_areas(tracts, buffers, tree=None):
+    """
+    Returns the area of each tract that lies within at least one buffer.
+
+    Args:
+        tracts (GeoSeries or array): tract polygons in a projected CRS
+        buffers (GeoSeries or array): buffer polygons in the same CRS
+        tree (STRtree): index of the buffers, built when not given
+
+    Returns:
+        numpy float64 array aligned with tracts
+    """
+    return shapely.area(covered_geometries(tracts, buffers, tree)).astype(np.float64)
+
+
+def covered_areas_by_radius(tracts, points, radii, tree=None):
+    """
+    Returns the area of each tract within each of several distances of a
+    store. The stores are indexed once and the buffers for each radius are
+    paired with tracts by distance from that index. Radii are processed from
+    smallest to largest, and a tract fully covered at one radius is fully
+    covered at every larger one, so it is not computed again. Neither is a
+    tract that the buffer of its nearest store covers on its own.
+
+    Args:
+        tracts (GeoSeries or array): tract polygons in a projected CRS
+        points (GeoSeries or array): store locations in the same CRS
+        radii (list): buffer radii in the units of the CRS
+        tree (STRtree): index of the points, built when not given
+
+    Returns:
+        numpy float64 array with a row per tract and a column per radius, in
+        the order of radii
+    """
+    tracts = geometry_array(tracts)
+    points = geometry_array(points)
+    if tree is None:
+        tree = shapely.STRtree(points)
+
+    tract_areas = shapely.area(tracts)
+    areas = np.zeros((len(tracts), len(radii)), dtype=np.float64)
+    full = np.zeros(len(tracts), dtype=bool)
+    for column in np.argsort(radii, kind="stable"):
+        radius = radii[column]
+        remaining = np.flatnonzero(~full)
+        # a tract inside the buffer of its nearest store needs no union
+        tract_positions, point_positions = tree.query_nearest(
+            tracts[remaining], max_distance=radius
+        )
+        nearest, inverse = np.unique(point_positions, return_inverse=True)
+        nearest_buffers = shapely.buffer(
+            points[nearest], radius, quad_segs=BUFFER_QUAD_SEGS
+        )
+        inside = shapely.covers(
+            nearest_buffers[inverse], tracts[remaining[tract_positions]]
+        )
+        full[remaining[tract_positions[inside]]] = True
+        areas[full, column] = tract_areas[full]
+
+        remaining = np.flatnonzero(~full)
+        tract_positions, point_positions = tract_buffer_pairs(
+            tracts[remaining], tree, distance=radius
+        )
+        if len(tract_positions) == 0:
+            continue
+        # buffer only the stores within reach of a remaining tract
+        buffers = np.empty(len(points), dtype=object)
+        used = np.unique(point_positions)
+        buffers[used] = shapely.buffer(points[used], radius, quad_segs=BUFFER_QUAD_SEGS)
+
+        reached, unions = buffer_unions(buffers, tract_positions, point_positions)
+        reached = remaining[reached]
+        clipped, reached_full = clip_to_tracts(unions, tracts[reached])
+        areas[reached, column] = shapely.area(clipped)
+        full[reached[reached_full]] = True
+
+    return areas
+
+
+def unique_coverage(tracts, buffers):
+    """
+    Finds the area of each tract that one buffer covers alone, i.e. the area
+    that would lose coverage if that buffer were removed, for every buffer at
+    once. The buffer boundaries are noded and polygonized into the faces of
+    their overlay arrangement a single time. Each face lies in a fixed set of
+    buffers, and the faces inside exactly one buffer are clipped to the tracts.
+
+    Args:
+        tracts (GeoSeries or array): tract polygons in a projected CRS
+        buffers (GeoSeries or array): buffer polygons in the same CRS
+
+    Returns:
+        int arrays of tract and buffer positions and a float64 array of the
+        uniquely covered area of each (tract, buffer) pair with any
+    """
+    tracts = geometry_array(tracts)
+    buffers = geometry_array(buffers)
+    empty = np.array([], dtype=np.int64)
+    if len(tracts) == 0 or len(buffers) == 0:
+        return empty, empty, np.array([], dtype=np.float64)
+
+    edges = shapely.union_all(shapely.boundary(buffers))
+    faces = shapely.get_parts(shapely.polygonize(shapely.get_parts(edges)))
+    face_positions, buffer_positions = shapely.STRtree(buffers).query(
+        shapely.point_on_surface(faces), predicate="within"
+    )
+    counts = np.bincount(face_positions, minlength=len(faces))
+    owners = np.empty(len(faces), dtype=np.int64)
+    owners[face_positions] = buffer_positions
+    single = np.flatnonzero(counts == 1)
+
+    face_positions, tract_positions = shapely.STRtree(tracts).query(
+        faces[single], predicate="intersects"
+    )
+    areas = shapely.area(
+        shapely.intersection(faces[single][face_positions], tracts[tract_positions])
+    )
+    pairs = np.column_stack((tract_positions, owners[single][face_positions]))
+    pairs, inverse = np.unique(pairs, axis=0, return_inverse=True)
+    areas = np.bincount(inverse.reshape(-1), weights=areas, minlength=len(pairs))
+    keep = areas > 0
+
+    return pairs[keep, 0], pairs[keep, 1], areas[keep]
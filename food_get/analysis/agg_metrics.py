@@ -15,15 +15,15 @@ warnings.simplefilter(action="ignore", category=FutureWarning)
 
 import geopandas as gpd
 import numpy as np
-import pathlib
 from food_get.data.extract_tracts import (
+    clip_to_shore,
     full_chi_10_20_tracts_one_mapping,
+    load_shoreline,
     tracts_2010_key,
 )
 from food_get.analysis.generate_metric import create_buffers, find_intersections
-from food_get.data.cleanup_grocery import clean_grocery_stores, clean_snap_retailer_data
+from food_get.data.cleanup_grocery import merge_and_assign_ids
 from food_get.data.extract_atlas import filtered_atlas
-from food_get.data.match_groceries import match_grocery_stores
 
 
 def tracts_metrics_df():
@@ -109,14 +109,11 @@ def track_comparison_df():
     """
     # Import and prepare census tract geographic information
     geojson_data = gpd.GeoDataFrame(tracts_2010_key())
-    lake = gpd.read_file(
-        pathlib.Path(__file__).parent
-        / "../data/import_data/Lake_Michigan_Shoreline.geojson"
-    )
+    lake = load_shoreline()
 
     tracts_keep = geojson_data[geojson_data["relation"] == "one"]
     tracts_drop = geojson_data[geojson_data["relation"] == "many"]
-    tracts_keep_shore = tracts_keep.overlay(lake, how="difference")
+    tracts_keep_shore = clip_to_shore(tracts_keep, lake)
 
     return tracts_keep, tracts_drop, tracts_keep_shore, lake
 
@@ -131,14 +128,12 @@ def grocery_stores_df():
         groc_gdf (GeoDataFrame): locations of grocery stores across the given area
 
     """
-    clean_groc = clean_grocery_stores()
-    clean_snap = clean_snap_retailer_data()
-    groc_merge = match_grocery_stores(clean_groc, clean_snap)
+    groc_merge = merge_and_assign_ids()
     groc_merge["is_snap_map"] = np.where(groc_merge["is_snap"], "Yes", "No")
 
     groc_gdf = gpd.GeoDataFrame(
         groc_merge,
-        geometry=gpd.points_from_xy(clean_groc.longitude, clean_groc.latitude),
+        geometry=gpd.points_from_xy(groc_merge.longitude, groc_merge.latitude),
         crs="EPSG:4326",
     )
     groc_gdf = groc_gdf[groc_gdf["longitude"].notna()]
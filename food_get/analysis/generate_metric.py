@@ -14,27 +14,33 @@ import warnings
 
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
-from food_get.data.cleanup_grocery import clean_grocery_stores
+from food_get.analysis.access import covered_areas, covered_areas_by_radius
+from food_get.data.cleanup_grocery import grocery_stores_with_ids
+from food_get.data.extract_census import tract_geoids
 from food_get.data.extract_tracts import restrict_tract_to_shore
+from food_get.data.ingest import read_source
+from food_get.data.labels import rounded_percentage_labels, threshold_flags
 import geopandas as gpd
 import pandas as pd
-import pathlib
 
 M_TO_MILES = 1609.34
 COUNTY_HH_INCOME = 78304
+# buffer radii in miles of the Atlas lapophalf, lapop1, lapop10 and lapop20
+ACCESS_RADII = [0.5, 1, 10, 20]
 
 
-def create_buffers():
+def store_locations():
     """
-    This function takes in a dataframe of grocery store locations and produces
-    ½ mile buffers around each location.
+    This function reads the cleaned grocery store locations as points,
+    projected to the CRS used for buffering. Stores keep the stable store_id
+    assigned by merge_and_assign_ids, the ids the map's grocery stores use,
+    without rerunning the SNAP match.
 
     Returns:
-        GeoDataFrame of grocery store locations and the geometry of their buffers
+        GeoDataFrame of grocery store locations
     """
-    # pull in cleaned grocery store data with merged SNAP data
-    cleaned_grocery = clean_grocery_stores()
-    cleaned_grocery["store_id"] = range(1, len(cleaned_grocery.index) + 1)
+    # pull in cleaned grocery store data with their store ids
+    cleaned_grocery = grocery_stores_with_ids()
 
     # read in grocery store data as points
     stores_gdf = gpd.GeoDataFrame(
@@ -47,9 +53,25 @@ def create_buffers():
 
     stores_gdf = stores_gdf.to_crs({"init": "epsg:3174"})
 
-    # create ½ mile buffers around each grocery store
+    return stores_gdf
+
+
+def create_buffers(radius=0.5):
+    """
+    This function takes in a dataframe of grocery store locations and produces
+    buffers around each location, ½ mile by default.
+
+    Inputs:
+        radius (float): buffer radius in miles
+
+    Returns:
+        GeoDataFrame of grocery store locations and the geometry of their buffers
+    """
+    stores_gdf = store_locations()
+
+    # create buffers around each grocery store
     # geometry is now a column of buffer polygons
-    stores_gdf["geometry"] = stores_gdf["geometry"].buffer(0.5 * M_TO_MILES)
+    stores_gdf["geometry"] = stores_gdf["geometry"].buffer(radius * M_TO_MILES)
 
     return stores_gdf
 
@@ -76,15 +98,18 @@ def find_intersections(stores_gdf):
     tracts_2020 = gpd.GeoDataFrame(restrict_tract_to_shore())
     tracts_2020 = tracts_2020.to_crs(crs=3174)
 
-    # find difference of census tracts and buffers by tract
-    difference = tracts_2020.overlay(stores_gdf, how="difference")
-
-    # find area of tracts with difference
-    difference["difference_area"] = difference.area
-
     # find total area of all tracts
     tracts_2020["tract_area"] = tracts_2020.area
 
+    # find area of each tract outside the union of the buffers reaching it
+    covered = covered_areas(tracts_2020, stores_gdf.to_crs(tracts_2020.crs))
+    difference = pd.DataFrame(
+        {
+            "GEOID_TRACT_20": tracts_2020["GEOID_TRACT_20"],
+            "difference_area": tracts_2020["tract_area"] - covered,
+        }
+    )
+
     # find ratio of grocery store buffers to tract area
     tracts_with_ratios = find_ratio(difference, tracts_2020)
 
@@ -94,35 +119,87 @@ def find_intersections(stores_gdf):
     return tracts_with_all_labels
 
 
+def ratio_column(radius):
+    """
+    Returns the name of the access ratio column for a radius in miles, named
+    like the Atlas variables: ratio_half, ratio_1, ratio_10, ratio_20.
+    """
+    if radius == 0.5:
+        return "ratio_half"
+
+    return "ratio_{:g}".format(radius)
+
+
+def find_access_ratios(stores_gdf=None, radii=ACCESS_RADII):
+    """
+    This function finds, for several radii at once, the ratio of each 2020
+    Census tract's area within that distance of a grocery store. The store
+    points are projected and indexed once for all radii, and tracts fully
+    covered at a smaller radius are not computed again for larger ones.
+
+    Inputs:
+        stores_gdf (GeoDataFrame): grocery store locations as points, from
+            store_locations by default
+        radii (list): radii in miles
+
+    Returns:
+        A DataFrame of 2020 Census tracts (tract_id) with one ratio column per
+        radius
+    """
+    if stores_gdf is None:
+        stores_gdf = store_locations()
+
+    tracts_2020 = gpd.GeoDataFrame(restrict_tract_to_shore())
+    tracts_2020 = tracts_2020.to_crs(crs=3174)
+    tract_area = tracts_2020.area.to_numpy()
+
+    covered = covered_areas_by_radius(
+        tracts_2020,
+        stores_gdf.to_crs(tracts_2020.crs),
+        [radius * M_TO_MILES for radius in radii],
+    )
+
+    ratios_df = pd.DataFrame({"tract_id": tracts_2020["GEOID_TRACT_20"].to_numpy()})
+    for column, radius in enumerate(radii):
+        # same arithmetic as find_ratio, so the ½ mile ratio matches it exactly
+        difference_area = tract_area - covered[:, column]
+        ratios_df[ratio_column(radius)] = 1 - difference_area / tract_area
+
+    return ratios_df
+
+
 def find_ratio(difference, tracts):
     """
     This function calculates the ratio of a tract's area to grocery store
-    buffers inside of the tract. It first finds the tract area and total buffer
-    area. It also calculates the area of overlapping buffers to avoid
-    double-counting. The ratio is then added to the tract GeoDataFrame for the
-    particular tract.
+    buffers inside of the tract. The uncovered (difference) areas are summed
+    by tract, so a tract split into several difference pieces counts all of
+    them, and joined to the tract areas. Tracts with no uncovered area are
+    fully covered and get a ratio of 1.
 
     Inputs:
-        tracts_gdf (GeoDataFrame): contains all tract information and boundaries
+        difference (DataFrame): GEOID_TRACT_20 and difference_area of each
+            uncovered piece of a tract
+        tracts (GeoDataFrame): contains all tract information, boundaries and
+            tract_area
 
     Returns:
-        A GeoDataFrame of 2020 Census tracts with a new column of the ratio of
-        grocery stores to total area
+        A DataFrame of 2020 Census tracts (tract_id) with the ratio of the
+        tract's area covered by grocery store buffers
 
     """
-    diff_tracts = list(difference["GEOID_TRACT_20"])
-    ratios_dict = {}
-
-    for _, tract in tracts.iterrows():
-        if tract["GEOID_TRACT_20"] in diff_tracts:
-            index_ = difference["GEOID_TRACT_20"]
-            difference.index = index_
-            diff_area = difference.loc[tract["GEOID_TRACT_20"], "difference_area"]
-            ratios_dict[tract["GEOID_TRACT_20"]] = 1 - diff_area / tract["tract_area"]
-        else:
-            ratios_dict[tract["GEOID_TRACT_20"]] = 1
+    difference_area = difference.groupby("GEOID_TRACT_20", sort=False)[
+        "difference_area"
+    ].sum()
+    tract_ids = tracts["GEOID_TRACT_20"]
+    uncovered = tract_ids.map(difference_area).fillna(0).to_numpy(dtype="float64")
+    ratios = pd.Series(
+        1 - uncovered / tracts["tract_area"].to_numpy(dtype="float64"),
+        index=tract_ids.to_numpy(),
+    )
+    # a tract listed more than once keeps its first position and last ratio
+    ratios = ratios.groupby(level=0, sort=False).last()
 
-    ratios_df = pd.DataFrame(ratios_dict.items(), columns=["tract_id", "ratio"])
+    ratios_df = pd.DataFrame({"tract_id": ratios.index, "ratio": ratios.to_numpy()})
 
     return ratios_df
 
@@ -141,11 +218,8 @@ def identify_low_access(ratios_df):
         A GeoDataFrame of 2020 Census tracts with a low_access indicator column
 
     """
-    ratios_df["low_access"] = ratios_df.apply(
-        lambda x: 1 if x["ratio"] < 1 / 3 else 0, axis=1
-    )
-    ratios_df["2022_prop_label"] = (ratios_df["ratio"] * 100).round(1)
-    ratios_df["2022_prop_label"] = ratios_df["2022_prop_label"].astype(str) + "%"
+    ratios_df["low_access"] = threshold_flags(ratios_df["ratio"], 1 / 3)
+    ratios_df["2022_prop_label"] = rounded_percentage_labels(ratios_df["ratio"])
 
     return ratios_df
 
@@ -166,23 +240,11 @@ def identify_low_income(tracts_with_access_label):
 
     """
     # pull in census 2022 income data for the tract level
-    income_census = pd.read_csv(
-        pathlib.Path(__file__).parent / "../data/import_data/census_2022.csv"
-    )
+    income_census = read_source("census_2022")
 
     # create variable for tract id
-    income_census.loc[income_census["tract"] < 100000, "tract_id"] = (
-        income_census["state"].astype(str)
-        + "0"
-        + income_census["county"].astype(str)
-        + "0"
-        + income_census["tract"].astype(str)
-    )
-    income_census.loc[income_census["tract"] >= 100000, "tract_id"] = (
-        income_census["state"].astype(str)
-        + "0"
-        + income_census["county"].astype(str)
-        + income_census["tract"].astype(str)
+    income_census["tract_id"] = tract_geoids(
+        income_census["state"], income_census["county"], income_census["tract"]
     )
 
     # keep only necessary variables
@@ -195,8 +257,10 @@ def identify_low_income(tracts_with_access_label):
     )
 
     # if census tract median hh income <=80% county hh income then low-income
-    tracts_with_access_label["low_income"] = tracts_with_access_label.apply(
-        lambda x: 1 if x["median_hh_income"] <= 0.8 * COUNTY_HH_INCOME else 0, axis=1
+    tracts_with_access_label["low_income"] = threshold_flags(
+        tracts_with_access_label["median_hh_income"],
+        0.8 * COUNTY_HH_INCOME,
+        inclusive=True,
     )
 
     return tracts_with_access_label
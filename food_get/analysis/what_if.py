@@ -0,0 +1,268 @@
+"""
+Project: Analyzing food access and security in Chicago
+Team: food.get
+File Name: what_if.py
+
+Description:
+    This file answers "what if a store opens or closes" questions on the 2022
+    low-access metric without rebuilding it. AccessModel keeps the tract
+    geometries, the store buffers and the covered area of every tract. Opening
+    or closing a store recomputes only the tracts its buffer intersects and
+    returns their updated lapophalfshare_2022 and LATracts_half_2022. The
+    marginal coverage of every store, the area that only it covers, is
+    computed in one batch to rank which closures would hurt most.
+"""
+
+import warnings
+
+warnings.simplefilter(action="ignore", category=FutureWarning)
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from food_get.analysis.access import (
+    BUFFER_QUAD_SEGS,
+    buffer_unions,
+    clip_to_tracts,
+    covered_areas,
+    geometry_array,
+    unique_coverage,
+)
+from food_get.analysis.generate_metric import (
+    M_TO_MILES,
+    create_buffers,
+    identify_low_access,
+    store_locations,
+)
+from food_get.data.extract_census import tract_geoids
+from food_get.data.extract_tracts import restrict_tract_to_shore
+from food_get.data.ingest import read_source
+
+
+class AccessModel:
+    """
+    The 2022 access metric held in memory, with incremental updates for store
+    openings and closures.
+
+    Args:
+        tracts (GeoDataFrame): 2020 tracts with GEOID_TRACT_20, in a projected
+            CRS
+        stores (GeoDataFrame): store locations as points with store_id
+        radius (float): buffer radius in miles
+    """
+
+    def __init__(self, tracts, stores, radius=0.5):
+        self.crs = tracts.crs
+        self.radius = radius * M_TO_MILES
+        self.tract_ids = tracts["GEOID_TRACT_20"].to_numpy()
+        self.tracts = geometry_array(tracts)
+        self.tract_areas = shapely.area(self.tracts)
+        self.tract_tree = shapely.STRtree(self.tracts)
+
+        points = geometry_array(stores.to_crs(self.crs))
+        buffers = shapely.buffer(points, self.radius, quad_segs=BUFFER_QUAD_SEGS)
+        self.buffers = dict(zip(stores["store_id"].tolist(), buffers))
+        self.covered = covered_areas(self.tracts, buffers)
+
+        # the stores whose buffer reaches each tract
+        self.tract_stores = [set() for _ in range(len(self.tracts))]
+        store_positions, tract_positions = self.tract_tree.query(
+            buffers, predicate="intersects"
+        )
+        store_ids = stores["store_id"].to_numpy()
+        for store_position, tract_position in zip(store_positions, tract_positions):
+            self.tract_stores[tract_position].add(store_ids[store_position])
+
+    def metrics(self, positions=None):
+        """
+        Returns the access metric of the given tract positions, all tracts by
+        default.
+
+        Returns:
+            DataFrame with tract_id, lapophalfshare_2022 and LATracts_half_2022
+        """
+        if positions is None:
+            positions = np.arange(len(self.tracts))
+        # same arithmetic as find_ratio
+        difference_area = self.tract_areas[positions] - self.covered[positions]
+        ratios_df = pd.DataFrame(
+            {
+                "tract_id": self.tract_ids[positions],
+                "ratio": 1 - difference_area / self.tract_areas[positions],
+            }
+        )
+        ratios_df = identify_low_access(ratios_df)
+
+        return ratios_df[["tract_id", "ratio", "low_access"]].rename(
+            columns={
+                "ratio": "lapophalfshare_2022",
+                "low_access": "LATracts_half_2022",
+            }
+        )
+
+    def _recompute(self, positions):
+        """
+        Recomputes the covered area of the given tracts from their stores.
+        """
+        tract_positions = []
+        buffers = []
+        for position in positions:
+            for store_id in sorted(self.tract_stores[position]):
+                tract_positions.append(position)
+                buffers.append(self.buffers[store_id])
+
+        self.covered[positions] = 0.0
+        if buffers:
+            reached, unions = buffer_unions(
+                np.array(buffers, dtype=object),
+                np.array(tract_positions),
+                np.arange(len(buffers)),
+            )
+            self.covered[reached] = shapely.area(
+                clip_to_tracts(unions, self.tracts[reached])[0]
+            )
+
+        return self.metrics(positions)
+
+    def add_store(self, longitude, latitude, store_id=None):
+        """
+        Opens a store and updates the tracts its buffer reaches.
+
+        Args:
+            longitude (float): store longitude
+            latitude (float): store latitude
+            store_id: id of the new store, one more than the largest id by
+                default
+
+        Returns:
+            DataFrame of the updated tracts, see metrics
+        """
+        if store_id is None:
+            store_id = max(self.buffers, default=0) + 1
+        if store_id in self.buffers:
+            raise ValueError("Store {} already exists".format(store_id))
+
+        point = gpd.GeoSeries(
+            gpd.points_from_xy([longitude], [latitude]), crs="epsg:4326"
+        ).to_crs(self.crs)
+        buffer = shapely.buffer(
+            point.values[0], self.radius, quad_segs=BUFFER_QUAD_SEGS
+        )
+        self.buffers[store_id] = buffer
+
+        positions = np.sort(self.tract_tree.query(buffer, predicate="intersects"))
+        for position in positions:
+            self.tract_stores[position].add(store_id)
+
+        return self._recompute(positions)
+
+    def remove_store(self, store_id):
+        """
+        Closes a store and updates the tracts its buffer reached.
+
+        Args:
+            store_id: id of the store to close
+
+        Returns:
+            DataFrame of the updated tracts, see metrics
+        """
+        if store_id not in self.buffers:
+            raise KeyError("No store {}".format(store_id))
+
+        buffer = self.buffers.pop(store_id)
+        positions = np.sort(self.tract_tree.query(buffer, predicate="intersects"))
+        for position in positions:
+            self.tract_stores[position].discard(store_id)
+
+        return self._recompute(positions)
+
+
+def build_access_model(stores_gdf=None, radius=0.5):
+    """
+    Builds the access model for the 2020 tracts bounded by the shore.
+
+    Inputs:
+        stores_gdf (GeoDataFrame): grocery store locations as points, from
+            store_locations by default
+        radius (float): buffer radius in miles
+
+    Returns:
+        AccessModel
+    """
+    if stores_gdf is None:
+        stores_gdf = store_locations()
+
+    tracts_2020 = gpd.GeoDataFrame(restrict_tract_to_shore())
+    tracts_2020 = tracts_2020.to_crs(crs=3174)
+
+    return AccessModel(tracts_2020, stores_gdf, radius)
+
+
+def tract_population():
+    """
+    Returns the 2022 population of each tract, indexed by tract_id.
+    """
+    census = read_source("census_2022")
+    tract_ids = tract_geoids(census["state"], census["county"], census["tract"])
+
+    return pd.Series(census["DP05_0001E"].to_numpy(), index=tract_ids.to_numpy())
+
+
+def marginal_coverage(stores_gdf=None):
+    """
+    Finds, for every store, the area only its buffer covers: the coverage the
+    tracts would lose if it closed. All stores are computed from one overlay
+    arrangement of the buffers. The population losing coverage is estimated
+    from each tract's 2022 population, assuming it is spread evenly over the
+    tract.
+
+    Inputs:
+        stores_gdf (GeoDataFrame): grocery stores with buffers around their
+            locations, from create_buffers by default
+
+    Returns:
+        by_tract (DataFrame): store_id, tract_id, unique_area and
+            unique_population of every tract a store alone covers part of
+        by_store (DataFrame): store_id, unique_area, unique_population and
+            the number of tracts affected, for every store
+    """
+    if stores_gdf is None:
+        stores_gdf = create_buffers()
+
+    tracts_2020 = gpd.GeoDataFrame(restrict_tract_to_shore())
+    tracts_2020 = tracts_2020.to_crs(crs=3174)
+    tract_ids = tracts_2020["GEOID_TRACT_20"].to_numpy()
+    tract_area = tracts_2020.area.to_numpy()
+    population = (
+        tract_population().reindex(tract_ids).fillna(0).to_numpy(dtype="float64")
+    )
+
+    tract_positions, store_positions, unique_area = unique_coverage(
+        tracts_2020, stores_gdf.to_crs(tracts_2020.crs)
+    )
+    by_tract = pd.DataFrame(
+        {
+            "store_id": stores_gdf["store_id"].to_numpy()[store_positions],
+            "tract_id": tract_ids[tract_positions],
+            "unique_area": unique_area,
+            "unique_population": population[tract_positions]
+            * unique_area
+            / tract_area[tract_positions],
+        }
+    )
+    by_tract = by_tract.sort_values(["store_id", "tract_id"], ignore_index=True)
+
+    by_store = (
+        by_tract.groupby("store_id")
+        .agg(
+            unique_area=("unique_area", "sum"),
+            unique_population=("unique_population", "sum"),
+            tracts=("tract_id", "count"),
+        )
+        .reindex(stores_gdf["store_id"].to_numpy(), fill_value=0)
+        .rename_axis("store_id")
+        .reset_index()
+    )
+
+    return by_tract, by_store
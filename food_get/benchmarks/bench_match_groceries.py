@@ -0,0 +1,58 @@
+"""
+Project: Analyzing food access and security in Chicago
+Team: food.get
+File Name: bench_match_groceries.py
+
+Description:
+    This file benchmarks the grid blocked store matcher against the original
+    nested iterrows loop on synthetic store data.
+
+    Run with:
+        python -m food_get.benchmarks.bench_match_groceries
+"""
+
+import warnings
+
+warnings.simplefilter(action="ignore", category=FutureWarning)
+
+import time
+import pandas as pd
+from food_get.data.match_groceries import match_grocery_stores
+from food_get.tests.reference_matcher import (
+    legacy_match_grocery_stores,
+    synthetic_stores,
+)
+
+
+def run(n_stores=10_000, n_snap=100_000, legacy_stores=100, legacy_snap=1_000):
+    """
+    Times the matcher on the full synthetic data and the legacy loop on a
+    subsample, extrapolating the legacy time by the number of compared pairs.
+    """
+    stores_df, snap_df = synthetic_stores(n_stores, n_snap)
+
+    start = time.perf_counter()
+    matched = match_grocery_stores(stores_df, snap_df)
+    indexed_time = time.perf_counter() - start
+
+    sub_stores, sub_snap = synthetic_stores(legacy_stores, legacy_snap, seed=1)
+    start = time.perf_counter()
+    legacy = legacy_match_grocery_stores(sub_stores, sub_snap)
+    legacy_time = time.perf_counter() - start
+    pd.testing.assert_frame_equal(legacy, match_grocery_stores(sub_stores, sub_snap))
+
+    scale = (n_stores * n_snap) / (legacy_stores * legacy_snap)
+    legacy_estimate = legacy_time * scale
+
+    print(f"stores x snap: {n_stores:,} x {n_snap:,}")
+    print(f"matched stores: {int(matched['is_snap'].sum()):,}")
+    print(f"indexed matcher: {indexed_time:.2f}s")
+    print(
+        f"legacy loop: {legacy_time:.2f}s at {legacy_stores:,} x {legacy_snap:,}, "
+        f"~{legacy_estimate:,.0f}s extrapolated"
+    )
+    print(f"speedup: ~{legacy_estimate / indexed_time:,.0f}x")
+
+
+if __name__ == "__main__":
+    run()
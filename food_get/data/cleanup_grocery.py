@@ -12,20 +12,49 @@ import warnings
 
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
-import pandas as pd
-import pathlib
-from food_get.data.match_groceries import match_grocery_stores
-
-
-GROCERY_RAW = pd.read_csv(
-    pathlib.Path(__file__).parent
-    / "../data/import_data/Grocery_Store_Status_20240219.csv"
-)
-pathlib.Path(__file__).parent / "../data/import_data/snap_retailers_data.csv"
-SNAP_RAW = pd.read_csv(
-    pathlib.Path(__file__).parent / "../data/import_data/snap_retailers_data.csv"
+import numpy as np
+import shapely
+from food_get.data.ingest import read_source
+from food_get.data.match_groceries import (
+    match_grocery_stores_incremental,
+    stable_store_ids,
 )
+
 MEMBERSHIP_STORES = ["Costco", "Sam's Club", "BJ's Wholesale Club"]
+# maximum distance in feet between a grocery store and its SNAP retailer
+SNAP_MATCH_DIST = 1000
+
+
+def parse_point_locations(locations):
+    """
+    Parses a column of WKT points such as "POINT (-87.626243 41.736172)" into
+    float64 longitude and latitude arrays in one pass. Rows that are missing or
+    are not valid points are reported with a warning and get NaN coordinates.
+
+    Args:
+        locations (pandas Series): WKT point strings
+
+    Returns:
+        (longitude, latitude) numpy float64 arrays aligned with locations
+    """
+    missing = locations.isna().to_numpy()
+    points = shapely.from_wkt(
+        np.where(missing, None, locations.to_numpy(dtype=object)), on_invalid="ignore"
+    )
+    not_point = shapely.get_type_id(points) != shapely.GeometryType.POINT
+    bad = not_point & ~missing
+    points[not_point] = None
+
+    if missing.any() or bad.any():
+        warnings.warn(
+            "{} location(s) missing and {} not a valid WKT point (rows {})".format(
+                int(missing.sum()),
+                int(bad.sum()),
+                list(locations.index[missing | bad]),
+            )
+        )
+
+    return shapely.get_x(points), shapely.get_y(points)
 
 
 def clean_grocery_stores():
@@ -40,11 +69,11 @@ def clean_grocery_stores():
         A pandas dataframe of the businesses and all their cleaned data components from the portal
     """
 
-    no_membership = GROCERY_RAW[~GROCERY_RAW["Store Name"].isin(MEMBERSHIP_STORES)]
+    grocery_raw = read_source("grocery")
+    no_membership = grocery_raw[~grocery_raw["Store Name"].isin(MEMBERSHIP_STORES)]
     cleaned_stores_df = no_membership[no_membership["New status"] == "OPEN"]
-    cleaned_stores_df[["Longitude", "Latitude"]] = cleaned_stores_df[
-        "Location"
-    ].str.extract(r"POINT \(([-+]?\d*\.\d+) ([-+]?\d*\.\d+)\)")
+    longitude, latitude = parse_point_locations(cleaned_stores_df["Location"])
+    cleaned_stores_df = cleaned_stores_df.assign(Longitude=longitude, Latitude=latitude)
     cleaned_stores_df = cleaned_stores_df.loc[
         :, ["Store Name", "Latitude", "Longitude", "Address"]
     ]
@@ -67,7 +96,8 @@ def clean_snap_retailer_data():
         A pandas dataframe of the businesses and all their cleaned data components from the portal
     """
 
-    cleaned_snap_retailer_df = SNAP_RAW.loc[
+    snap_raw = read_source("snap")
+    cleaned_snap_retailer_df = snap_raw.loc[
         :, ["Store_Name", "Latitude", "Longitude", "Store_Street_Address"]
     ]
     cleaned_snap_retailer_df = cleaned_snap_retailer_df.rename(
@@ -81,9 +111,35 @@ def clean_snap_retailer_data():
 
 
 def merge_and_assign_ids():
+    """
+    Matches the cleaned grocery stores to the SNAP retailers. Matches and
+    store_id values from the previous run are reused, so only new or changed
+    stores are matched again and store ids stay stable across refreshes.
+
+    Returns:
+        A pandas dataframe of grocery stores with a store_id and is_snap flag
+    """
     stores1_df = clean_grocery_stores()
     stores2_df = clean_snap_retailer_data()
-    matched_stores_df = match_grocery_stores(stores1_df, stores2_df, max_dist=1000)
-    matched_stores_df.insert(0, "store_id", range(1, len(matched_stores_df) + 1))
+    matched_stores_df = match_grocery_stores_incremental(
+        stores1_df, stores2_df, max_dist=SNAP_MATCH_DIST
+    )
 
     return matched_stores_df
+
+
+def grocery_stores_with_ids():
+    """
+    Reads the cleaned grocery stores with the store_id merge_and_assign_ids
+    gives them. The ids are read from the match state, so the stores are not
+    matched to SNAP retailers and the state is not written.
+
+    Returns:
+        A pandas dataframe of grocery stores with a leading store_id
+    """
+    stores_df = clean_grocery_stores().reset_index(drop=True)
+    stores_df.insert(
+        0, "store_id", stable_store_ids(stores_df, max_dist=SNAP_MATCH_DIST)
+    )
+
+    return stores_df
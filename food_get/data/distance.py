@@ -0,0 +1,205 @@
+"""
+Project: Analyzing food access and security in Chicago
+Team: food.get
+File Name: distance.py
+
+Description:
+    This file computes great-circle (haversine) distances between arrays of
+    points. Many-to-many distances are produced in row chunks sized to a memory
+    budget so large comparisons never hold the full distance matrix.
+"""
+
+import numpy as np
+
+EARTH_R_MI = 3963
+DEFAULT_MAX_BYTES = 256 * 1024**2
+
+# float64 arrays alive at once while one chunk of the matrix is computed
+_CHUNK_TEMPORARIES = 4
+
+
+def _radians(values):
+    """
+    Converts scalars, lists, NumPy arrays or pandas Series of degrees to a
+    float64 array of radians.
+    """
+    return np.radians(np.asarray(values, dtype=np.float64))
+
+
+def _haversine_radians(rlat1, rlon1, rlat2, rlon2, radius):
+    """
+    Haversine distance for arrays already in radians. Inputs broadcast.
+    """
+    a = (
+        np.sin((rlat2 - rlat1) / 2) ** 2
+        + np.cos(rlat1) * np.cos(rlat2) * np.sin((rlon2 - rlon1) / 2) ** 2
+    )
+
+    return 2 * radius * np.arcsin(np.sqrt(a))
+
+
+def haversine(lat1, lon1, lat2, lon2, radius=EARTH_R_MI, dtype=np.float64):
+    """
+    Calculates the point-to-point distance between two sets of points. Inputs
+    may be scalars, NumPy arrays or pandas Series and broadcast against each
+    other, so one point against many points also works.
+
+    Args:
+        lat1, lon1: latitude and longitude of the first points in degrees
+        lat2, lon2: latitude and longitude of the second points in degrees
+        radius (float): radius of the sphere, miles by default
+        dtype: np.float64 or np.float32 for the returned distances
+
+    Returns:
+        numpy array of distances in the units of radius
+    """
+    dist = _haversine_radians(
+        _radians(lat1), _radians(lon1), _radians(lat2), _radians(lon2), radius
+    )
+
+    return dist.astype(dtype, copy=False)
+
+
+def haversine_one_to_many(lat, lon, lats, lons, radius=EARTH_R_MI, dtype=np.float64):
+    """
+    Calculates the distance from a single point to every point in lats / lons.
+
+    Args:
+        lat, lon (float): latitude and longitude of the point in degrees
+        lats, lons: latitudes and longitudes of the other points in degrees
+        radius (float): radius of the sphere, miles by default
+        dtype: np.float64 or np.float32 for the returned distances
+
+    Returns:
+        1D numpy array of distances, one per point in lats / lons
+    """
+    if np.ndim(lat) or np.ndim(lon):
+        raise ValueError("lat and lon must be scalars for one-to-many distances")
+
+    return haversine(lat, lon, lats, lons, radius=radius, dtype=dtype).reshape(-1)
+
+
+def chunk_rows(n_cols, dtype=np.float64, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Returns how many matrix rows of n_cols distances fit in max_bytes, counting
+    the float64 temporaries needed while a chunk is computed. At least one row
+    is always returned.
+    """
+    itemsize = np.dtype(dtype).itemsize + _CHUNK_TEMPORARIES * 8
+    per_row = max(n_cols, 1) * itemsize
+
+    return max(int(max_bytes // per_row), 1)
+
+
+def haversine_matrix_chunks(
+    lats1,
+    lons1,
+    lats2,
+    lons2,
+    radius=EARTH_R_MI,
+    dtype=np.float64,
+    max_bytes=DEFAULT_MAX_BYTES,
+):
+    """
+    Yields the many-to-many distance matrix between two sets of points in row
+    chunks so that no more than about max_bytes is held at once.
+
+    Args:
+        lats1, lons1: latitudes and longitudes of the row points in degrees
+        lats2, lons2: latitudes and longitudes of the column points in degrees
+        radius (float): radius of the sphere, miles by default
+        dtype: np.float64 or np.float32 for the yielded distances
+        max_bytes (int): memory budget for a single chunk
+
+    Yields:
+        (start, stop, block) where block is the (stop - start, len(lats2))
+        distance matrix for row points start to stop
+    """
+    rlat1, rlon1 = _radians(lats1).reshape(-1), _radians(lons1).reshape(-1)
+    rlat2, rlon2 = _radians(lats2).reshape(-1), _radians(lons2).reshape(-1)
+    step = chunk_rows(len(rlat2), dtype, max_bytes)
+
+    for start in range(0, len(rlat1), step):
+        stop = min(start + step, len(rlat1))
+        block = _haversine_radians(
+            rlat1[start:stop, None],
+            rlon1[start:stop, None],
+            rlat2[None, :],
+            rlon2[None, :],
+            radius,
+        )
+        yield start, stop, block.astype(dtype, copy=False)
+
+
+def haversine_matrix(
+    lats1,
+    lons1,
+    lats2,
+    lons2,
+    radius=EARTH_R_MI,
+    dtype=np.float64,
+    max_bytes=DEFAULT_MAX_BYTES,
+):
+    """
+    Returns the full many-to-many distance matrix. Raises a MemoryError rather
+    than allocating a result larger than max_bytes; use
+    haversine_matrix_chunks or nearest_points for larger comparisons.
+
+    Returns:
+        numpy array of shape (len(lats1), len(lats2))
+    """
+    n_rows, n_cols = np.size(lats1), np.size(lats2)
+    result_bytes = n_rows * n_cols * np.dtype(dtype).itemsize
+    if result_bytes > max_bytes:
+        raise MemoryError(
+            "A {} x {} distance matrix needs {:,} bytes, over the {:,} byte budget".format(
+                n_rows, n_cols, result_bytes, max_bytes
+            )
+        )
+
+    matrix = np.empty((n_rows, n_cols), dtype=dtype)
+    for start, stop, block in haversine_matrix_chunks(
+        lats1, lons1, lats2, lons2, radius, dtype, max_bytes
+    ):
+        matrix[start:stop] = block
+
+    return matrix
+
+
+def nearest_points(
+    lats1,
+    lons1,
+    lats2,
+    lons2,
+    radius=EARTH_R_MI,
+    dtype=np.float64,
+    max_bytes=DEFAULT_MAX_BYTES,
+):
+    """
+    Finds the nearest second point for every first point, e.g. the closest
+    grocery store to each tract centroid, without building the full matrix.
+
+    Returns:
+        (index, distance) numpy arrays with one entry per first point, where
+        index is the position of the nearest second point (-1 and NaN when
+        no point can be compared)
+    """
+    n_rows = np.size(lats1)
+    index = np.full(n_rows, -1, dtype=np.int64)
+    distance = np.full(n_rows, np.nan, dtype=dtype)
+    if np.size(lats2) == 0:
+        return index, distance
+
+    for start, stop, block in haversine_matrix_chunks(
+        lats1, lons1, lats2, lons2, radius, dtype, max_bytes
+    ):
+        # points with missing coordinates never count as nearest
+        block[np.isnan(block)] = np.inf
+        nearest = np.argmin(block, axis=1)
+        found = np.isfinite(block[np.arange(stop - start), nearest])
+        index[start:stop] = np.where(found, nearest, -1)
+        distance[start:stop] = np.where(
+            found, block[np.arange(stop - start), nearest], np.nan
+        )
+
+    return index, distance
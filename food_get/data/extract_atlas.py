@@ -9,16 +9,207 @@ Description:
     and combines them into one dataframe based on what is required for the map
     visualization.
 """
+
 import warnings
 
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
-import pathlib
+from food_get.data.ingest import cache_path, parquet_available
+from food_get.data.labels import percentage_labels
+from food_get.data.loader import load_dataset
+
+ATLAS_VARIABLES = ["LowIncomeTracts", "LATracts_half", "lapophalfshare", "lapophalf"]
+ATLAS_DTYPES = {
+    "CensusTract": "int64",
+    "LowIncomeTracts": "int8",
+    "LATracts_half": "int8",
+    "lapophalfshare": "float64",
+    "lapophalf": "float64",
+}
+# GEOID prefixes of the area to keep, Cook County for Chicago
+CHICAGO_REGION = ["17031"]
+ATLAS_CHUNKSIZE = 20000
+GEOID_LENGTH = 11
+
+
+def region_mask(tracts, region):
+    """
+    Flags the tracts whose 11-digit GEOID starts with one of the region
+    prefixes, e.g. "17" for Illinois or "17031" for Cook County.
+
+    Args:
+        tracts (numpy array): integer tract GEOIDs
+        region (list of strings): GEOID prefixes, None keeps every tract
+
+    Returns:
+        numpy boolean array
+    """
+    if not region:
+        return np.ones(len(tracts), dtype=bool)
+
+    mask = np.zeros(len(tracts), dtype=bool)
+    for prefix in region:
+        if len(prefix) < 2 or not prefix.isdigit():
+            raise ValueError(
+                "Region prefixes must be numeric GEOID prefixes of at least a state"
+            )
+        mask |= tracts // 10 ** (GEOID_LENGTH - len(prefix)) == int(prefix)
+
+    return mask
+
+
+def _atlas_columns(variables):
+    """
+    Column to dtype mapping for reading CensusTract and the given variables.
+    Variables without a declared dtype are left to pandas.
+    """
+    return {
+        column: ATLAS_DTYPES.get(column) for column in ["CensusTract"] + list(variables)
+    }
+
+
+def _read_atlas_csv(path, columns, chunksize):
+    """
+    Streams the requested Atlas columns in chunks of chunksize rows.
+    """
+    return pd.read_csv(
+        path,
+        usecols=list(columns),
+        dtype={column: dtype for column, dtype in columns.items() if dtype},
+        chunksize=chunksize,
+    )
+
+
+def _atlas_state_cache(path, columns, chunksize):
+    """
+    Returns a Parquet dataset of the requested Atlas columns partitioned by
+    state, building it chunk by chunk on first use or when the CSV changes.
+    """
+    cache_dir = cache_path(path, columns).with_suffix("")
+    if cache_dir.exists() and cache_dir.stat().st_mtime_ns >= path.stat().st_mtime_ns:
+        return cache_dir
+
+    build_dir = cache_dir.with_name(cache_dir.name + ".partial")
+    shutil.rmtree(build_dir, ignore_errors=True)
+    start = 0
+    for chunk in _read_atlas_csv(path, columns, chunksize):
+        chunk["row"] = np.arange(start, start + len(chunk))
+        chunk["state"] = chunk["CensusTract"] // 10 ** (GEOID_LENGTH - 2)
+        chunk.to_parquet(build_dir, partition_cols=["state"], index=False)
+        start += len(chunk)
+
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    build_dir.rename(cache_dir)
+
+    return cache_dir
+
+
+def _read_atlas_file(path, variables, region, chunksize):
+    """
+    load_dataset reader for one Atlas year. Reads the requested columns for
+    the region from the state partitioned Parquet cache when a Parquet engine
+    is installed, and otherwise streams the CSV and filters every chunk.
+    """
+    columns = _atlas_columns(variables)
+
+    if parquet_available():
+        try:
+            cache_dir = _atlas_state_cache(path, columns, chunksize)
+        except OSError:
+            cache_dir = None
+        if cache_dir is not None:
+            states = sorted({int(prefix[:2]) for prefix in region or []})
+            atlas = pd.read_parquet(
+                cache_dir,
+                columns=list(columns) + ["row"],
+                filters=[("state", "in", states)] if states else None,
+            )
+            atlas = atlas[region_mask(atlas["CensusTract"].to_numpy(), region)]
+            atlas = atlas.sort_values("row").drop(columns="row")
+            return atlas.reset_index(drop=True)
+
+    chunks = [
+        chunk[region_mask(chunk["CensusTract"].to_numpy(), region)]
+        for chunk in _read_atlas_csv(path, columns, chunksize)
+    ]
+
+    return pd.concat(chunks, ignore_index=True)
+
+
+def read_atlas_year(
+    year, variables=ATLAS_VARIABLES, region=CHICAGO_REGION, chunksize=ATLAS_CHUNKSIZE
+):
+    """
+    Reads CensusTract and the requested variables of one Food Atlas year for
+    the tracts in region, without holding the national file in memory.
+
+    Args:
+        year (str): Atlas release year, e.g. "2019"
+        variables (list of strings): Atlas variables such as "lapop1",
+            "lapop10" or "lalowihalf"
+        region (list of strings): GEOID prefixes of the states / counties to
+            keep, None for the whole country
+        chunksize (int): rows read at a time
+
+    Returns:
+        pandas DataFrame of the tracts in region
+    """
+    return load_dataset(
+        "Atlas{}.csv".format(year),
+        reader=_read_atlas_file,
+        variables=tuple(variables),
+        region=tuple(region) if region else None,
+        chunksize=chunksize,
+    )
 
 
-def import_atlas_data(export=False, years=["2010", "2015", "2019"]):
+def assemble_atlas_years(
+    years, variables=ATLAS_VARIABLES, region=CHICAGO_REGION, max_workers=None
+):
+    """
+    Reads every year concurrently and lines them up on CensusTract with a single
+    outer concat, so adding a year costs one more parallel read instead of
+    another merge over the whole frame.
+
+    Args:
+        years (list of strings): Atlas release years, any number of them
+        variables (list of strings): Atlas variables to keep for every year
+        region (list of strings): GEOID prefixes of the area to keep
+        max_workers (int): size of the thread pool, one thread per year by
+            default
+
+    Returns:
+        pandas DataFrame with CensusTract and one {variable}_{year} column per
+        variable and year
+    """
+    years = list(years)
+    if not years:
+        return pd.DataFrame(columns=["CensusTract"])
+
+    def read_year(year):
+        atlas = read_atlas_year(year, variables=variables, region=region)
+        return atlas.set_index("CensusTract").add_suffix("_{}".format(year))
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(years)) as pool:
+        frames = list(pool.map(read_year, years))
+
+    # sorted like an outer merge on CensusTract
+    atlas_sets = pd.concat(frames, axis=1, join="outer").sort_index()
+    atlas_sets.index.name = "CensusTract"
+
+    return atlas_sets.reset_index()
+
+
+def import_atlas_data(
+    export=False,
+    years=["2010", "2015", "2019"],
+    variables=ATLAS_VARIABLES,
+    region=CHICAGO_REGION,
+):
     """
     Imports dataframes for historical Food Atlas data and adds labels for each year.
         These files have been pre-filtered to meet file size restrictions, but the
@@ -27,36 +218,14 @@ def import_atlas_data(export=False, years=["2010", "2015", "2019"]):
     Args:
         export (bool): if True, saves a csv with the compiled dataframe
         years (list of strings): years we want to compile for
+        variables (list of strings): Atlas variables to keep for every year
+        region (list of strings): GEOID prefixes of the area to keep, Cook
+            County by default and None for the whole country
 
     Returns:
         atlas_sets (pandas DataFrame): pandas DataFrame of the compiled historical datasets
     """
-    atlas_sets = pd.DataFrame()
-
-    for year in years:
-        Atlas_Raw = pd.read_csv(
-            pathlib.Path(__file__).parent
-            / "../data/import_data/Atlas{}.csv".format(year)
-        )
-
-        Atlas_Filtered = Atlas_Raw[
-            [
-                "CensusTract",
-                "LowIncomeTracts",
-                "LATracts_half",
-                "lapophalfshare",
-                "lapophalf",
-            ]
-        ]
-        Atlas_Filtered = Atlas_Filtered.add_suffix("_{}".format(year))
-        Atlas_Filtered.rename(
-            columns={"CensusTract_{}".format(year): "CensusTract"}, inplace=True
-        )
-
-        if len(atlas_sets) == 0:
-            atlas_sets = Atlas_Filtered
-        else:
-            atlas_sets = atlas_sets.merge(Atlas_Filtered, on="CensusTract", how="outer")
+    atlas_sets = assemble_atlas_years(years, variables=variables, region=region)
 
     if export:
         atlas_sets.to_csv("atlas_historical.csv")
@@ -67,6 +236,7 @@ def import_atlas_data(export=False, years=["2010", "2015", "2019"]):
 def percentage_string_label(value):
     """
     Creates a clean string label of the proporton of low access households.
+        Use labels.percentage_labels to label a whole column at once.
 
     Args:
         value (int): the integer value we want to convert to a clean percent string
@@ -77,18 +247,19 @@ def percentage_string_label(value):
     return f"{value * 100:.1f}%"
 
 
-def filtered_atlas(export=False, years=["2010", "2015", "2019"]):
+def filtered_atlas(export=False, years=["2010", "2015", "2019"], region=CHICAGO_REGION):
     """
     Makes datatype and formatting edits to align historical Atlas datasets.
 
     Args:
         export (bool): if True, saves a csv with the compiled dataframe
         years (list of strings): years we want to compile for
+        region (list of strings): GEOID prefixes of the area to keep
 
     Returns:
         filtered_df (pandas DataFrame): pandas DataFrame of the compiled historical datasets
     """
-    filtered_df = import_atlas_data()
+    filtered_df = import_atlas_data(region=region)
 
     # Making some small adjustments to 2019 columns to account for changes to raw data structure
     filtered_df["LowIncomeTracts_2019"] = filtered_df[
@@ -104,9 +275,7 @@ def filtered_atlas(export=False, years=["2010", "2015", "2019"]):
         col_name = f"lapophalfshare_{year}"
         filtered_df[col_name] = 1 - filtered_df[col_name]
         label_column_name = f"{year}_prop_label"
-        filtered_df[label_column_name] = filtered_df[col_name].apply(
-            lambda x: percentage_string_label(x)
-        )
+        filtered_df[label_column_name] = percentage_labels(filtered_df[col_name])
 
     if export:
         filtered_df.to_csv("filtered_atlas_update.csv")
@@ -4,28 +4,67 @@ Team: food.get
 File Name: extract_census.py
 Author: Danielle Rosenthal
 
-Notes:
-    * In the current implementation we only support searching for Illinois counties
-
 Description:
     This file scrapes the US Census 2022 5-Year Estimate Data Profiles tables.
 """
+
 import warnings
 
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
-import requests
-import pandas as pd
-import pathlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import json
-
-illinois_counties = pd.read_csv(
-    pathlib.Path(__file__).parent / "../data/import_data/illinois_counties_guide.csv"
-)
-with open(
-    pathlib.Path(__file__).parent / "../data/import_data/state_fips.json"
-) as json_file:
-    state_name_fips_dict = json.load(json_file)
+import re
+import numpy as np
+import pandas as pd
+from food_get.data import fips
+from food_get.data.http_client import RateLimiter, cached_get
+
+# estimate codes such as DP05_0001E or DP03_0119PE, whose margins end in M
+ESTIMATE_VARIABLE = re.compile(r"[A-Z0-9]+(?:_[A-Z0-9]+)*_\d+P?E")
+# ACS 2022 5-year estimates are fixed, so cached responses are kept for 30 days
+CENSUS_CACHE_TTL = 30 * 24 * 60 * 60
+TRACT_METRICS = {
+    "DP05_0001E": "total_population",
+    "DP02_0001E": "total_households",
+    "DP03_0062E": "median_household_income",
+    "DP03_0063E": "mean_household_income",
+    "DP03_0119PE": "poverty_rate",
+}
+GEOGRAPHY_COLUMNS = ["state", "county", "tract"]
+# Chicago-Naperville-Elgin, IL-IN-WI MSA as (state, county) FIPS codes
+CHICAGO_MSA_COUNTIES = [
+    ("17", "031"),
+    ("17", "037"),
+    ("17", "043"),
+    ("17", "063"),
+    ("17", "089"),
+    ("17", "093"),
+    ("17", "097"),
+    ("17", "111"),
+    ("17", "197"),
+    ("18", "073"),
+    ("18", "089"),
+    ("18", "111"),
+    ("18", "127"),
+    ("55", "059"),
+]
+MAX_CENSUS_WORKERS = 8
+CENSUS_REQUESTS_PER_SECOND = 10
+# the Census API rejects requests for more than 50 variables
+MAX_CENSUS_VARIABLES = 50
+# ACS annotation values returned in place of an estimate or margin of error,
+# e.g. -666666666 when an estimate could not be computed
+ACS_SENTINELS = [
+    -999999999,
+    -888888888,
+    -666666666,
+    -555555555,
+    -333333333,
+    -222222222,
+]
+# columns of a response that stay strings, besides the geography columns
+TEXT_COLUMNS = ["NAME", "GEO_ID"]
 
 
 def json_to_df(response):
@@ -38,7 +77,79 @@ def json_to_df(response):
     Returns:
         df (pandas DataFrame): pandas DataFrame version of the json response object.
     """
-    return pd.DataFrame(response.json()[1:], columns=response.json()[0])
+    rows = response.json()
+
+    return pd.DataFrame(rows[1:], columns=rows[0])
+
+
+def tract_geoids(state, county, tract):
+    """
+    Builds 11 digit tract GEOIDs from state, county and tract codes given as
+        strings or integers, zero padding each part.
+    """
+    return (
+        state.astype(str).str.zfill(2)
+        + county.astype(str).str.zfill(3)
+        + tract.astype(str).str.zfill(6)
+    )
+
+
+def _typed_column(values):
+    """
+    Converts one column (an object array) of a Census response to numbers with ACS sentinels as
+        NA. Whole numbers become Int64 and others Float64. Columns that are not
+        numeric are returned as strings.
+    """
+    try:
+        # numpy parses numeric strings directly, much faster than to_numeric
+        numbers = values.astype(np.float64)
+    except (TypeError, ValueError):
+        # nulls or text in the column
+        numbers = pd.to_numeric(values, errors="coerce").astype(np.float64)
+        if np.any(np.isnan(numbers) & pd.notna(values)):
+            return values
+
+    missing = np.isnan(numbers) | np.isin(numbers, ACS_SENTINELS)
+    numbers = np.where(missing, 0, numbers)
+    if np.array_equal(numbers, np.round(numbers)) and np.all(np.abs(numbers) < 2**53):
+        return pd.arrays.IntegerArray(numbers.astype(np.int64), missing)
+
+    return pd.arrays.FloatingArray(numbers.astype(np.float64), missing)
+
+
+def census_json_to_df(response, geoid=True):
+    """
+    Converts a Census API response into a typed dataframe. The payload is
+        parsed once and each column is built directly from it: estimates
+        become nullable numbers with the ACS sentinel values as NA, while
+        geography codes, NAME and GEO_ID stay strings.
+
+    Args:
+        response (response object): the response object from the API pull
+        geoid (bool): if True and the response is at the tract level, adds a
+            GEOID column of 11 digit tract codes
+
+    Returns:
+        df (pandas DataFrame): typed DataFrame version of the response
+    """
+    rows = json.loads(response.content)
+    header = rows[0]
+    # one object array for the whole payload, sliced into columns
+    grid = np.empty((len(rows) - 1, len(header)), dtype=object)
+    grid[:] = rows[1:] if len(rows) > 1 else grid
+
+    data = {}
+    for position, name in enumerate(header):
+        if name in GEOGRAPHY_COLUMNS or name in TEXT_COLUMNS:
+            data[name] = grid[:, position]
+        else:
+            data[name] = _typed_column(grid[:, position])
+    df = pd.DataFrame(data, columns=header)
+
+    if geoid and set(GEOGRAPHY_COLUMNS) <= set(header):
+        df["GEOID"] = tract_geoids(df["state"], df["county"], df["tract"])
+
+    return df
 
 
 def tract_level_extract(
@@ -115,10 +226,124 @@ def tract_level_extract(
                 formatted_variables, state_fips_code, county_code
             )
 
-    response = requests.request("GET", link)
+    response = cached_get(link, ttl=CENSUS_CACHE_TTL)
     return response
 
 
+def plan_variable_chunks(variables, max_variables=MAX_CENSUS_VARIABLES):
+    """
+    Splits a variable list into chunks the Census API accepts in one request.
+        Duplicates are dropped and the original order is kept.
+
+    Args:
+        variables (list of strings): Data Profile variables
+        max_variables (int): the most variables allowed in one request
+
+    Returns:
+        list of lists of variables
+    """
+    unique_variables = list(dict.fromkeys(variables))
+
+    return [
+        unique_variables[start : start + max_variables]
+        for start in range(0, len(unique_variables), max_variables)
+    ]
+
+
+def margin_variables(variables):
+    """
+    Adds the margin of error variable after each estimate, e.g. DP05_0001E
+        is followed by DP05_0001M, DP03_0119PE by DP03_0119PM and
+        S1701_C01_001E by S1701_C01_001M. Other variables such as NAME have no
+        margin.
+    """
+    with_margins = []
+    for variable in variables:
+        with_margins.append(variable)
+        if ESTIMATE_VARIABLE.fullmatch(variable):
+            with_margins.append(variable[:-1] + "M")
+
+    return with_margins
+
+
+def merge_variable_chunks(frames, variables):
+    """
+    Joins the frames of a chunked pull on (state, county, tract). Every chunk
+        is indexed once and the columns are combined in a single concat.
+
+    Args:
+        frames (list of pandas DataFrames): one frame per chunk
+        variables (list of strings): the variables in output order
+
+    Returns:
+        pandas DataFrame with the variables followed by the geography columns
+    """
+    if len(frames) == 1:
+        return frames[0][variables + GEOGRAPHY_COLUMNS]
+
+    merged = pd.concat(
+        [frame.set_index(GEOGRAPHY_COLUMNS) for frame in frames],
+        axis=1,
+        join="outer",
+    )
+
+    return merged.reset_index()[variables + GEOGRAPHY_COLUMNS]
+
+
+def tract_variables_extract(
+    variables,
+    state_fips_code=None,
+    county_code=None,
+    margins=False,
+    max_workers=MAX_CENSUS_WORKERS,
+    requests_per_second=CENSUS_REQUESTS_PER_SECOND,
+):
+    """
+    Extracts any number of Data Profile variables at the census tract level.
+        Lists longer than the API limit are split into chunks that are
+        requested in parallel and joined on the tract.
+
+    Args:
+        variables (list of strings): Data Profile variables
+        state_fips_code (str): FIPS code for the state
+        county_code (str): FIPS code for the county
+        margins (bool): if True, also pulls the margin of error of every estimate
+        max_workers (int): maximum number of requests in flight
+        requests_per_second (float): rate limit on starting requests
+
+    Returns:
+        df_response (pandas DataFrame): one row per tract with the typed
+            variables, the state, county and tract codes, and the GEOID
+    """
+    if not isinstance(variables, list):
+        raise TypeError("Variables must be entered in list format")
+    if margins:
+        variables = margin_variables(variables)
+    chunks = plan_variable_chunks(variables)
+    limiter = RateLimiter(requests_per_second)
+
+    def fetch(chunk):
+        limiter.wait()
+        return tract_level_extract(
+            variables=chunk,
+            state_fips_code=state_fips_code,
+            county_code=county_code,
+        )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        frames = [
+            census_json_to_df(response, geoid=False)
+            for response in pool.map(fetch, chunks)
+        ]
+
+    df_response = merge_variable_chunks(frames, list(dict.fromkeys(variables)))
+    df_response["GEOID"] = tract_geoids(
+        df_response["state"], df_response["county"], df_response["tract"]
+    )
+
+    return df_response
+
+
 def census_tract_metrics(export=False, state="Illinois", county="Cook County"):
     """ "
     Returns dataframe with tract level information required for building the
@@ -130,7 +355,9 @@ def census_tract_metrics(export=False, state="Illinois", county="Cook County"):
         county (str): the name of the county
 
     Returns:
-        df_response (pandas DataFrame): a dataframe with tract level metrics
+        df_response (pandas DataFrame): a dataframe with typed tract level
+            metrics (missing-value codes as NA), the state, county and tract
+            codes, and the GEOID
     """
 
     # Getting state and county FIPS codes
@@ -140,17 +367,11 @@ def census_tract_metrics(export=False, state="Illinois", county="Cook County"):
         state_fips_code = None
 
     if county:
-        county_code = get_county_code(county)
+        county_code = get_county_code(county, state)
     else:
         county_code = None
 
-    col_name_mapping = {
-        "DP05_0001E": "total_population",
-        "DP02_0001E": "total_households",
-        "DP03_0062E": "median_household_income",
-        "DP03_0063E": "mean_household_income",
-        "DP03_0119PE": "poverty_rate",
-    }
+    col_name_mapping = TRACT_METRICS
 
     # Calling the Census API and transforming the result into a dataframe
     api_response = tract_level_extract(
@@ -158,7 +379,7 @@ def census_tract_metrics(export=False, state="Illinois", county="Cook County"):
         state_fips_code=state_fips_code,
         county_code=county_code,
     )
-    df_response = json_to_df(api_response)
+    df_response = census_json_to_df(api_response)
 
     # Renaming columns for legibility
     df_response.rename(columns=col_name_mapping, inplace=True)
@@ -169,46 +390,130 @@ def census_tract_metrics(export=False, state="Illinois", county="Cook County"):
     return df_response
 
 
+def _area_codes(state, county):
+    """
+    Returns the (state, county) FIPS codes for an area given by names or codes.
+    A county of None stands for the whole state.
+    """
+    state_fips_code = get_fips_code(state)
+    county_code = None if county is None else get_county_code(county, state)
+
+    return state_fips_code, county_code
+
+
+def bulk_tract_metrics(
+    areas=CHICAGO_MSA_COUNTIES,
+    variables=TRACT_METRICS,
+    max_workers=MAX_CENSUS_WORKERS,
+    requests_per_second=CENSUS_REQUESTS_PER_SECOND,
+    export=False,
+):
+    """
+    Pulls tract level metrics for many counties and / or whole states at once.
+        Requests run concurrently on a bounded thread pool, start no faster than
+        requests_per_second, and each area is converted as soon as it arrives.
+        Variable lists over the API limit are split into chunks per area.
+
+    Args:
+        areas (list of tuples): (state, county) pairs as names or FIPS codes,
+            with county None for every tract in the state. Defaults to the 14
+            counties of the Chicago MSA
+        variables (dict or list): Data Profile variables, a dict also renames
+            them
+        max_workers (int): maximum number of requests in flight
+        requests_per_second (float): rate limit on starting requests
+        export (bool): if True, saves a csv of the resulting dataframe
+
+    Returns:
+        df_response (pandas DataFrame): one row per tract with numeric metrics
+            (ACS sentinels as NA), string state, county and tract codes and
+            the GEOID
+    """
+    variable_names = list(dict.fromkeys(variables))
+    chunks = plan_variable_chunks(variable_names)
+    limiter = RateLimiter(requests_per_second)
+
+    def fetch(area_codes, chunk):
+        limiter.wait()
+        return tract_level_extract(
+            variables=chunk,
+            state_fips_code=area_codes[0],
+            county_code=area_codes[1],
+        )
+
+    frames = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # every chunk of every area is requested at once, an area is converted
+        # as soon as all of its chunks have arrived
+        area_chunks = {}
+        futures = {}
+        for position, area in enumerate(areas):
+            area_codes = _area_codes(*area)
+            area_chunks[position] = [None] * len(chunks)
+            for chunk_number, chunk in enumerate(chunks):
+                future = pool.submit(fetch, area_codes, chunk)
+                futures[future] = (position, chunk_number)
+
+        for future in as_completed(futures):
+            position, chunk_number = futures[future]
+            pieces = area_chunks[position]
+            pieces[chunk_number] = census_json_to_df(future.result(), geoid=False)
+            if all(piece is not None for piece in pieces):
+                frames.append(merge_variable_chunks(pieces, variable_names))
+                del area_chunks[position]
+
+    if not frames:
+        return pd.DataFrame(columns=variable_names + GEOGRAPHY_COLUMNS + ["GEOID"])
+
+    df_response = pd.concat(frames, ignore_index=True)
+    df_response["GEOID"] = tract_geoids(
+        df_response["state"], df_response["county"], df_response["tract"]
+    )
+    df_response = df_response.sort_values("GEOID", ignore_index=True)
+    if isinstance(variables, dict):
+        df_response.rename(columns=variables, inplace=True)
+
+    if export:
+        df_response.to_csv("census_tracts_2022.csv")
+
+    return df_response
+
+
 def get_fips_code(state):
     """ "
     Returns the FIPS code for a state.
 
     Args:
-        state (str): the name of the state
+        state (str): the name, postal abbreviation or FIPS code of the state
 
     Returns:
         state_code (str): the FIPS code for the given state
     """
-    if state not in state_name_fips_dict.keys():
+    state_code = fips.state_code(state)
+    if state_code is None:
         raise KeyError("Please enter a valid US state name")
-    return state_name_fips_dict[state]
+    return state_code
 
 
-def get_county_code(county):
+def get_county_code(county, state="Illinois"):
     """ "
-    Returns the FIPS code for a county.
+    Returns the FIPS code for a county, with or without its "County" (or
+        "Parish", "Borough", ...) suffix.
 
     Args:
         county (str): the name of the county
+        state (str): the name, postal abbreviation or FIPS code of its state
 
     Returns:
         county_code (str): the FIPS code for the given county
     """
-    if not county.endswith(" County"):
-        county = county + " County"
-
-    if county in illinois_counties["COUNTYNAME"].values:
-        county_info = illinois_counties[
-            illinois_counties["COUNTYNAME"] == county
-        ].reset_index()
-        county_code = county_info["COUNTYFP"][0]
-        county_code = str(county_code)
-        if len(county_code) == 1:
-            county_code = "00" + county_code
-        elif len(county_code) == 2:
-            county_code = "0" + county_code
-    else:
-        raise KeyError("You have not entered a correct Illinois county name")
+    county_code = fips.county_code(county, state)
+    if county_code is None:
+        raise KeyError(
+            "You have not entered a correct {} county name".format(
+                fips.state_name(get_fips_code(state))
+            )
+        )
 
     return county_code
 
@@ -230,7 +535,7 @@ def state_income(export=False, state="Illinois"):
     link = "https://api.census.gov/data/2022/acs/acs5/profile?get=DP03_0062E,DP03_0063E&for=state:{}".format(
         state_fips_code
     )
-    response = requests.request("GET", link)
+    response = cached_get(link, ttl=CENSUS_CACHE_TTL)
     df_response = json_to_df(response)
     column_renaming = {
         "DP03_0062E": "median_household_income",
@@ -248,8 +553,7 @@ def state_income(export=False, state="Illinois"):
 def county_income(export=False, state="Illinois", county="Cook County"):
     """ "
     Creates a one line dataframe with the county level median and mean household
-        incomes according to the 2022 ACS 5 Year Estimates. This function currently
-        only supports counties within the State of Illinois.
+        incomes according to the 2022 ACS 5 Year Estimates.
 
     Args:
         export (bool): If True, the function will generate a csv of the resulting dataframe
@@ -261,12 +565,12 @@ def county_income(export=False, state="Illinois", county="Cook County"):
             return the resulting dataframe.
     """
     state_fips_code = get_fips_code(state)
-    county_code = get_county_code(county)
+    county_code = get_county_code(county, state)
 
     link = "https://api.census.gov/data/2022/acs/acs5/profile?get=DP03_0062E,DP03_0063E&for=county:{}&in=state:{}".format(
         county_code, state_fips_code
     )
-    response = requests.request("GET", link)
+    response = cached_get(link, ttl=CENSUS_CACHE_TTL)
     df_response = json_to_df(response)
     column_renaming = {
         "DP03_0062E": "median_household_income",
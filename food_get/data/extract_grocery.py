@@ -12,104 +12,559 @@ import warnings
 
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
+from concurrent.futures import ThreadPoolExecutor
+import os
+import pathlib
 import pandas as pd
 import requests
 import json
-import time
-from urllib.parse import urlencode
+from food_get.data.http_client import DEFAULT_TIMEOUT, cached_get, get_session
+from food_get.data.ingest import SOURCES, refreshed_table_path
+from food_get.data.loader import import_data_path
 
+SNAP_LAYER_URL = "https://services1.arcgis.com/RLQu0rK7h4kbsBq5/arcgis/rest/services/snap_retailer_location_data/FeatureServer/0"
+SNAP_WHERE = "City = 'CHICAGO'"
+# the columns the project reads from the SNAP file, plus the id used to resume
+SNAP_FIELDS = list(SOURCES["snap"]["columns"]) + ["ObjectId"]
+SNAP_OUTPUT = import_data_path(SOURCES["snap"]["file"])
+# used when the service does not report its maxRecordCount
+DEFAULT_PAGE_SIZE = 1000
+MAX_SNAP_WORKERS = 4
 
-def make_api_request(url, params=None):
+# Socrata API of the City of Chicago "Grocery Store Status" dataset
+GROCERY_FEED_URL = "https://data.cityofchicago.org/resource/3e26-zek2.json"
+# API field names and the snapshot csv columns they correspond to
+GROCERY_FEED_FIELDS = {
+    "store_name": "Store Name",
+    "address": "Address",
+    "zip": "Zip",
+    "new_status": "New status",
+    "last_updated": "Last updated",
+    "location": "Location",
+}
+GROCERY_STORE_KEY = ["Store Name", "Address"]
+GROCERY_PAGE_SIZE = 1000
+GROCERY_SNAPSHOT = import_data_path(SOURCES["grocery"]["file"])
+
+
+def arcgis_query(layer_url, params):
     """
-    Make an API request and parse the JSON response.
+    Runs a query against an ArcGIS FeatureServer layer. The parameters are
+    POSTed, so long ObjectId lists never hit URL length limits.
 
     Args:
-        url (str): The URL for the API endpoint.
-        params (dict): Optional parameters for the API request (default is None).
+        layer_url (str): URL of the layer, e.g. .../FeatureServer/0
+        params (dict): query parameters
 
     Returns:
-        dict: Parsed JSON response.
+        dict: parsed JSON response
     """
-    response = requests.get(url)
+    response = get_session().post(
+        layer_url + "/query", data=dict(params, f="json"), timeout=DEFAULT_TIMEOUT
+    )
     response.raise_for_status()
-    return json.loads(response.text)
+    result = response.json()
+    # ArcGIS reports query errors in the body of a 200 response
+    if "error" in result:
+        raise requests.HTTPError("ArcGIS query failed: {}".format(result["error"]))
 
+    return result
 
-def import_snap_retailers_data():
+
+def layer_info(layer_url):
     """
-    This function loads the data from the USDA Food and Nutrition Service portal on the
-    location for currently authorized SNAP retailers.
+    Returns the metadata of a FeatureServer layer, e.g. its maxRecordCount and
+    editFieldsInfo.
+    """
+    response = get_session().get(
+        layer_url, params={"f": "json"}, timeout=DEFAULT_TIMEOUT
+    )
+    response.raise_for_status()
+
+    return response.json()
+
+
+def fetch_object_ids(layer_url, where):
+    """
+    Returns the sorted ObjectIds of the features matching a where clause.
+    """
+    result = arcgis_query(layer_url, {"where": where, "returnIdsOnly": "true"})
+
+    return sorted(result.get("objectIds") or [])
+
+
+def last_edit_date(layer_url, where, edit_field):
+    """
+    Returns the latest edit date (epoch milliseconds) of the features matching
+    a where clause, or None.
+    """
+    statistics = [
+        {
+            "statisticType": "max",
+            "onStatisticField": edit_field,
+            "outStatisticFieldName": "last_edit",
+        }
+    ]
+    result = arcgis_query(
+        layer_url, {"where": where, "outStatistics": json.dumps(statistics)}
+    )
+    features = result.get("features") or [{}]
+
+    return features[0].get("attributes", {}).get("last_edit")
+
+
+def edited_since(edit_field, edit_date):
+    """
+    Returns a where clause for features edited after edit_date (epoch
+    milliseconds). The timestamp is rounded down to the second, so a refresh
+    may fetch a few features again but never misses one.
+    """
+    timestamp = pd.Timestamp(edit_date, unit="ms").floor("s")
+
+    return "{} > TIMESTAMP '{}'".format(
+        edit_field, timestamp.strftime("%Y-%m-%d %H:%M:%S")
+    )
+
+
+def fetch_feature_pages(layer_url, object_ids, fields, page_size, max_workers):
+    """
+    Fetches the attributes of the given features in pages of page_size, up to
+    max_workers requests at a time.
+
+    Yields:
+        (page, frame) for every page in order, where page is the list of
+        requested ObjectIds and frame their attributes sorted by ObjectId
+    """
+    pages = [
+        object_ids[start : start + page_size]
+        for start in range(0, len(object_ids), page_size)
+    ]
+    out_fields = ",".join(fields)
+
+    def fetch(page):
+        result = arcgis_query(
+            layer_url,
+            {
+                "objectIds": ",".join(map(str, page)),
+                "outFields": out_fields,
+                "returnGeometry": "false",
+            },
+        )
+        attributes = [feature["attributes"] for feature in result["features"]]
+        return pd.DataFrame(attributes, columns=fields).sort_values("ObjectId")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # map yields pages in order
+        yield from zip(pages, pool.map(fetch, pages))
+
+
+def _state_path(output, kind):
+    """
+    Returns the path of the checkpoint or refresh state file for a csv.
+    """
+    return output.with_name("{}.{}.json".format(output.name, kind))
+
+
+def _read_state(path, where, fields):
+    """
+    Returns a saved checkpoint or refresh state for the same query, or None.
+    """
+    if not path.exists():
+        return None
+    state = json.loads(path.read_text())
+    if state["where"] != where or state["fields"] != fields:
+        return None
+
+    return state
+
+
+def _write_state(path, state):
+    """
+    Saves a checkpoint or refresh state.
+    """
+    path.write_text(json.dumps(state))
+
+
+def _layer_edit_state(layer_url, where):
+    """
+    Returns the page size, edit date field (or None) and latest edit date of a
+    layer, read before any features are fetched so no edit can slip through.
+    """
+    info = layer_info(layer_url)
+    edit_field = (info.get("editFieldsInfo") or {}).get("editDateField")
+    last_edit = last_edit_date(layer_url, where, edit_field) if edit_field else None
+
+    return info.get("maxRecordCount") or DEFAULT_PAGE_SIZE, edit_field, last_edit
+
+
+def download_snap_retailers(
+    output=SNAP_OUTPUT,
+    layer_url=SNAP_LAYER_URL,
+    where=SNAP_WHERE,
+    fields=SNAP_FIELDS,
+    page_size=None,
+    max_workers=MAX_SNAP_WORKERS,
+    resume=True,
+):
+    """
+    Downloads the SNAP retailers matching where into a csv. Features are
+    requested in pages of the service's maxRecordCount, up to max_workers at a
+    time, and each page is appended to the csv as soon as it (and every page
+    before it) arrives. After each page the last written ObjectId is saved to
+    a checkpoint file, so an interrupted download picks up where it stopped.
+
+    Args:
+        output (str or Path): csv to write
+        layer_url (str): URL of the FeatureServer layer
+        where (str): which features to download
+        fields (list of strings): attributes to request, in output order,
+            must include ObjectId
+        page_size (int): features per request, defaults to maxRecordCount
+        max_workers (int): maximum number of requests in flight
+        resume (bool): if False, always start over
 
     Returns:
-        A list of the retailer's features and associated raw data components from the portal
+        int: number of retailers in the csv
     """
-    base_url = "https://services1.arcgis.com/RLQu0rK7h4kbsBq5/arcgis/rest/services/snap_retailer_location_data/FeatureServer/0/query?"
+    if "ObjectId" not in fields:
+        raise ValueError("fields must include ObjectId to track progress")
+    output = pathlib.Path(output)
+    checkpoint_path = _state_path(output, "checkpoint")
+    checkpoint = _read_state(checkpoint_path, where, fields) if resume else None
 
-    # parameters for ObjectID retrieval
-    params_object_ids = {
-        "where": "City = 'CHICAGO'",
-        "outFields": "*",
-        "returnIdsOnly": True,
-        "outSR": 4326,
-        "f": "json",
-    }
+    max_records, _, last_edit = _layer_edit_state(layer_url, where)
+    object_ids = fetch_object_ids(layer_url, where)
+    if checkpoint is not None and output.exists():
+        # drop anything written after the last checkpoint
+        with open(output, "r+b") as output_file:
+            output_file.truncate(checkpoint["size"])
+        object_ids = [oid for oid in object_ids if oid > checkpoint["last_object_id"]]
+        written = checkpoint["rows"]
+        last_edit = checkpoint["last_edit"]
+    else:
+        pd.DataFrame(columns=fields).to_csv(output, index=False)
+        written = 0
 
-    # Parameters for detailed information retrieval
-    params_features = {"outFields": "*", "outSR": 4326, "f": "json"}
+    for page, batch in fetch_feature_pages(
+        layer_url, object_ids, fields, page_size or max_records, max_workers
+    ):
+        batch.to_csv(output, mode="a", header=False, index=False)
+        written += len(batch)
+        _write_state(
+            checkpoint_path,
+            {
+                "where": where,
+                "fields": fields,
+                "last_object_id": page[-1],
+                "size": os.path.getsize(output),
+                "rows": written,
+                "last_edit": last_edit,
+            },
+        )
 
-    # retrieve ObjectIDs for Chicago SNAP groceries
-    url_object_ids = base_url + urlencode(params_object_ids)
-    response_object_ids = make_api_request(url_object_ids)
-    object_id_lst = (
-        response_object_ids.get("objectIds", []) if response_object_ids else []
+    _write_state(
+        _state_path(output, "refresh"),
+        {"where": where, "fields": fields, "last_edit": last_edit},
     )
+    checkpoint_path.unlink(missing_ok=True)
+
+    return written
+
+
+def refresh_snap_retailers(
+    output=SNAP_OUTPUT,
+    layer_url=SNAP_LAYER_URL,
+    where=SNAP_WHERE,
+    fields=SNAP_FIELDS,
+    page_size=None,
+    max_workers=MAX_SNAP_WORKERS,
+):
+    """
+    Brings a csv written by download_snap_retailers up to date without pulling
+    every retailer again. The service's ObjectIds are compared with the csv:
+    new ids are fetched and ids no longer served are dropped. When the layer
+    tracks edit dates, retailers edited since the last download or refresh
+    are fetched again too. Without a csv holding the requested fields this
+    falls back to a full download.
+
+    The csv is replaced in one step, so read_source("snap") and the grocery
+    cleaning step pick up the refreshed retailers on their next read.
+
+    Args:
+        output (str or Path): csv to refresh
+        layer_url (str): URL of the FeatureServer layer
+        where (str): which features to keep
+        fields (list of strings): attributes to request, in output order,
+            must include ObjectId
+        page_size (int): features per request, defaults to maxRecordCount
+        max_workers (int): maximum number of requests in flight
+
+    Returns:
+        dict: number of retailers added, changed and removed, and whether a
+            full download was needed
+    """
+    output = pathlib.Path(output)
+    refresh_path = _state_path(output, "refresh")
+    try:
+        local = pd.read_csv(output, usecols=fields, dtype={"ObjectId": "int64"})
+    except (FileNotFoundError, ValueError):
+        # no snapshot, or one without the requested fields
+        download_snap_retailers(
+            output, layer_url, where, fields, page_size, max_workers, resume=False
+        )
+        return {"added": 0, "changed": 0, "removed": 0, "full": True}
+    state = _read_state(refresh_path, where, fields)
+
+    max_records, edit_field, last_edit = _layer_edit_state(layer_url, where)
+    remote_ids = set(fetch_object_ids(layer_url, where))
+    local_ids = set(local["ObjectId"])
+
+    added = remote_ids - local_ids
+    removed = local_ids - remote_ids
+    changed = set()
+    # edits can only be found relative to an earlier download or refresh
+    if edit_field and state is not None and state["last_edit"] is not None:
+        edited_where = "({}) AND {}".format(
+            where, edited_since(edit_field, state["last_edit"])
+        )
+        changed = set(fetch_object_ids(layer_url, edited_where)) & local_ids
 
-    snap_retailer_data_lst = []
-    batch_size = 10
-
-    # iterate over Chicago SNAP ObjectIDs in batches
-    for i in range(0, len(object_id_lst), batch_size):
-        batch_object_ids = object_id_lst[i : i + batch_size]
-        # construct URL for batch request
-        url_detail_batch = (
-            base_url
-            + urlencode(params_features)
-            + "&where=ObjectId IN ("
-            + ",".join(map(str, batch_object_ids))
-            + ")"
+    fetched = [
+        batch
+        for _, batch in fetch_feature_pages(
+            layer_url,
+            sorted(added | changed),
+            fields,
+            page_size or max_records,
+            max_workers,
         )
-        # get snap retailer data for the batch
-        response_detail_batch = make_api_request(url_detail_batch)
-        # append snap retailer data to the list
-        snap_retailer_data_lst.extend(response_detail_batch["features"])
-        # time delay between batches
-        time.sleep(0.1)
+    ]
+    kept = local[~local["ObjectId"].isin(removed | changed)]
+    refreshed = pd.concat([kept] + fetched, ignore_index=True)
+    refreshed = refreshed.sort_values("ObjectId")[fields]
+
+    temp_path = output.with_name(output.name + ".tmp")
+    refreshed.to_csv(temp_path, index=False)
+    os.replace(temp_path, output)
+    _write_state(
+        refresh_path, {"where": where, "fields": fields, "last_edit": last_edit}
+    )
+
+    return {
+        "added": len(added),
+        "changed": len(changed),
+        "removed": len(removed),
+        "full": False,
+    }
+
+
+def import_snap_retailers_data(refresh=False):
+    """
+    This function loads the data from the USDA Food and Nutrition Service portal on the
+    location for currently authorized SNAP retailers into snap_retailers_data.csv.
+
+    Args:
+        refresh (bool): if True, only fetch the changes since the last download
+
+    Returns:
+        int: number of retailers in snap_retailers_data.csv
+    """
+    if refresh:
+        refresh_snap_retailers()
+        return len(pd.read_csv(SNAP_OUTPUT, usecols=["ObjectId"]))
+
+    return download_snap_retailers()
+
+
+def grocery_store_path():
+    """
+    Returns the path of the local grocery store table: Parquet when an engine
+    is installed, csv otherwise.
+    """
+    return refreshed_table_path("grocery")
+
+
+def read_grocery_store(path):
+    """
+    Reads the local grocery store table written by refresh_grocery_stores.
+    """
+    path = pathlib.Path(path)
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path)
+
+    return pd.read_csv(path, dtype={"Zip": "string"}, parse_dates=["Last updated"])
+
+
+def _write_grocery_store(stores, path):
+    """
+    Replaces the local grocery store table in one step.
+    """
+    path = pathlib.Path(path)
+    temp_path = path.with_name(path.name + ".tmp")
+    if path.suffix == ".parquet":
+        stores.to_parquet(temp_path, index=False)
+    else:
+        stores.to_csv(temp_path, index=False)
+    os.replace(temp_path, path)
+
+
+def read_grocery_snapshot(path=GROCERY_SNAPSHOT):
+    """
+    Reads the data portal csv export in the layout of the local table.
+    """
+    snapshot = pd.read_csv(path, dtype={"Zip": "string"})
+    snapshot["Last updated"] = pd.to_datetime(
+        snapshot["Last updated"], format="%m/%d/%Y %I:%M:%S %p"
+    )
+
+    return snapshot[list(GROCERY_FEED_FIELDS.values())]
+
+
+def _feed_location(location):
+    """
+    Converts a Socrata point ({"type": "Point", "coordinates": [lon, lat]})
+    to the WKT used by the csv export.
+    """
+    if not isinstance(location, dict) or not location.get("coordinates"):
+        return None
 
-        # Initialize an empty list to store dictionaries
-        stored_snap_retailer_data = []
+    return "POINT ({} {})".format(*location["coordinates"])
 
-        for retailer_entry in snap_retailer_data_lst:
-            # Access the 'attributes' key within each entry
-            attributes = retailer_entry.get("attributes", {})
 
-            # Append the attributes dictionary to the result list
-            stored_snap_retailer_data.append(attributes)
+def fetch_grocery_updates(
+    since=None, url=GROCERY_FEED_URL, page_size=GROCERY_PAGE_SIZE
+):
+    """
+    Pages through the grocery store dataset with $limit / $offset, fetching only
+    the stores updated at or after since.
+
+    Args:
+        since (Timestamp): high-water mark, None to fetch every store
+        url (str): Socrata resource URL of the dataset
+        page_size (int): rows per request
 
-        # Convert the list of dictionaries to a Pandas DataFrame
-        stored_snap_retailer_df = pd.DataFrame(stored_snap_retailer_data)
+    Returns:
+        pandas DataFrame in the layout of the csv export
+    """
+    params = {
+        "$select": ",".join(GROCERY_FEED_FIELDS),
+        # a stable order keeps the pages from overlapping
+        "$order": "last_updated,:id",
+        "$limit": page_size,
+    }
+    if since is not None:
+        params["$where"] = "last_updated >= '{}'".format(
+            since.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+        )
 
-        stored_snap_retailer_df.to_csv(
-            "data/import_data/snap_retailers_data.csv", index=False
+    rows = []
+    offset = 0
+    while True:
+        response = cached_get(
+            url, params=dict(params, **{"$offset": offset}), cache_dir=None
         )
+        response.raise_for_status()
+        page = response.json()
+        rows.extend(page)
+        if len(page) < page_size:
+            break
+        offset += page_size
+
+    updates = pd.DataFrame(rows, columns=list(GROCERY_FEED_FIELDS))
+    updates["location"] = updates["location"].map(_feed_location)
+    updates["last_updated"] = pd.to_datetime(updates["last_updated"])
+    updates["zip"] = updates["zip"].astype("string")
+
+    return updates.rename(columns=GROCERY_FEED_FIELDS)
+
+
+def grocery_store_keys(stores):
+    """
+    Returns the identity of each store: its name and address, ignoring case
+    and extra whitespace.
+    """
+    return pd.MultiIndex.from_arrays(
+        [
+            stores[column].str.lower().str.split().str.join(" ")
+            for column in GROCERY_STORE_KEY
+        ]
+    )
+
+
+def upsert_grocery_stores(stores, updates):
+    """
+    Merges updates into stores. An updated store replaces the row with the
+    same identity, and new stores are added. When updates lists a store more
+    than once, its last row is kept.
+
+    Returns:
+        (merged, inserted, updated) where inserted counts new stores and
+        updated counts known stores whose values changed
+    """
+    updates = updates[~grocery_store_keys(updates).duplicated(keep="last")]
+    store_keys = grocery_store_keys(stores)
+    update_keys = grocery_store_keys(updates)
+    known = update_keys.isin(store_keys)
+
+    # the stored row of each known update, compared as objects so missing
+    # values of any dtype match each other
+    stored = stores[~store_keys.duplicated(keep="last")]
+    stored = stored.set_axis(store_keys[~store_keys.duplicated(keep="last")])
+    previous = stored.reindex(update_keys[known])[updates.columns].astype(object)
+    current = updates[known].set_axis(update_keys[known]).astype(object)
+    changed = (previous != current) & ~(previous.isna() & current.isna())
+
+    merged = pd.concat([stores, updates], ignore_index=True)
+    merged = merged[~grocery_store_keys(merged).duplicated(keep="last")]
+
+    return (
+        merged.reset_index(drop=True),
+        int((~known).sum()),
+        int(changed.any(axis=1).sum()),
+    )
+
+
+def refresh_grocery_stores(
+    path=None, url=GROCERY_FEED_URL, page_size=GROCERY_PAGE_SIZE
+):
+    """
+    Brings the local grocery store table up to date with the data portal. Only
+    stores updated since the latest "Last updated" in the table are
+    fetched and upserted. The first run starts from the csv snapshot in
+    import_data.
+
+    Args:
+        path (str or Path): local table, defaults to grocery_store_path()
+        url (str): Socrata resource URL of the dataset
+        page_size (int): rows per request
+
+    Returns:
+        dict: number of rows fetched, inserted and updated
+    """
+    path = pathlib.Path(path or grocery_store_path())
+    stores = read_grocery_store(path) if path.exists() else read_grocery_snapshot()
+    high_water_mark = stores["Last updated"].max()
+    if pd.isna(high_water_mark):
+        high_water_mark = None
+
+    updates = fetch_grocery_updates(high_water_mark, url, page_size)
+    stores, inserted, updated = upsert_grocery_stores(stores, updates)
+    _write_grocery_store(stores, path)
+
+    return {"fetched": len(updates), "inserted": inserted, "updated": updated}
 
 
 def import_grocery_store_data():
     """
-    This function loads the data from a Chicago data portal csv of Grocery stores from 2020.
+    This function loads the Chicago data portal grocery stores: the local table kept
+    by refresh_grocery_stores when there is one, the csv snapshot otherwise. Both
+    have the same columns and types.
 
     Returns:
         A pandas dataframe of Chicago grocery detail's features.
     """
-    grocery_store_df = pd.read_csv("data/import_data/Grocery_Store_Status_20240219.csv")
+    path = grocery_store_path()
+    if path.exists():
+        return read_grocery_store(path)
 
-    return grocery_store_df
+    return read_grocery_snapshot()
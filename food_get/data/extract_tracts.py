@@ -13,12 +13,51 @@ import warnings
 
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
-import requests
+import hashlib
 import io
+import json
+import shutil
+import threading
+from collections import OrderedDict
 import pandas as pd
 import numpy as np
 import geopandas as gpd
 import pathlib
+import shapely
+from food_get.data.geometry_store import read_geometry
+from food_get.data.http_client import cached_get
+from food_get.data.ingest import parquet_available, read_source
+
+RELATIONSHIP_URL = "https://www2.census.gov/geo/docs/maps-data/data/rel2020/tract/tab20_tract20_tract10_natl.txt"
+RELATIONSHIP_INDEX = pathlib.Path(__file__).parent / "cache" / "tract_relationships"
+RELATIONSHIP_MARKER = "_index.json"
+RELATIONSHIP_DTYPES = {
+    "GEOID_TRACT_20": "str",
+    "GEOID_TRACT_10": "str",
+    "AREALAND_TRACT_20": "Int64",
+    "AREAWATER_TRACT_20": "Int64",
+    "AREALAND_TRACT_10": "Int64",
+    "AREAWATER_TRACT_10": "Int64",
+    "AREALAND_PART": "Int64",
+    "AREAWATER_PART": "Int64",
+}
+TRACTS_2010_FILE = "census_tracts_2010.geojson"
+SHORELINE_FILE = "Lake_Michigan_Shoreline.geojson"
+# clipped geometries by (tract geometry hash, water hash), shared by every
+# caller; the least recently used are dropped beyond CLIP_CACHE_SIZE, which
+# holds the 2010 and 2020 Chicago tracts a few times over
+CLIP_CACHE_SIZE = 4096
+_CLIP_CACHE = OrderedDict()
+_CLIP_LOCK = threading.Lock()
+# land and water area of each 2020 / 2010 tract pair, for weighted crosswalks
+OVERLAP_COLUMNS = [
+    "AREALAND_PART",
+    "AREAWATER_PART",
+    "AREALAND_TRACT_20",
+    "AREALAND_TRACT_10",
+    "land_share_20",
+    "land_share_10",
+]
 
 
 def extract_chi_census_tracts_2010():
@@ -27,11 +66,8 @@ def extract_chi_census_tracts_2010():
     to filter by census track for chicago. Includes geometries.
 
     """
-    filename = (
-        pathlib.Path(__file__).parent / "../data/import_data/census_tracts_2010.geojson"
-    )
-    census = gpd.read_file(filename)
     columns = ["tractce10", "geoid10", "name10", "namelsad10", "geometry"]
+    census = read_geometry(TRACTS_2010_FILE, columns=columns)
     final_df = pd.DataFrame(census[columns])
 
     return final_df
@@ -42,30 +78,153 @@ def extract_chi_census_tracts_2020():
     Takes in census track data and returns shorted table to filter by
     census track for chicago
     """
-    filename = pathlib.Path(__file__).parent / "../data/import_data/chi_ct_2020.csv"
-
-    census = pd.read_csv(filename, dtype=str)
+    census = read_source("chi_ct_2020")
     final_df = census[["ct_chicago", "community_name"]].rename(
         columns={"ct_chicago": "geoid20"}
     )
+    final_df["geoid20"] = final_df["geoid20"].astype(str)
 
     return final_df
 
 
-def census_tracts_2020_2010_relationships():
+def _read_relationship_file():
     """
-    returns a mapping of only 1:1 census tracts from 2020 and 2010 with GEOID_TRACT
+    Parses the national 2020 to 2010 tract relationship file, downloaded once
+    and then served from the HTTP cache.
+    """
+    response = cached_get(RELATIONSHIP_URL)
+    response.raise_for_status()
+
+    return pd.read_csv(
+        io.BytesIO(response.content),
+        sep="|",
+        usecols=list(RELATIONSHIP_DTYPES),
+        dtype=RELATIONSHIP_DTYPES,
+    )
+
+
+def _index_complete(index_dir):
     """
-    url = "https://www2.census.gov/geo/docs/maps-data/data/rel2020/tract/tab20_tract20_tract10_natl.txt"
-    data = requests.get(url).content
-    relationships = pd.read_csv(io.StringIO(data.decode("utf-8")), sep="|", dtype=str)
+    Returns True when an index folder was fully written: its marker exists and
+    records as many rows as the dataset holds.
+    """
+    marker = index_dir / RELATIONSHIP_MARKER
+    if not marker.exists():
+        return False
+    rows = json.loads(marker.read_text())["rows"]
+    try:
+        import pyarrow.dataset
+    except ImportError:
+        return True
+
+    return pyarrow.dataset.dataset(index_dir, partitioning="hive").count_rows() == rows
+
+
+def build_relationship_index(index_dir=None):
+    """
+    Writes the relationship file as a Parquet dataset partitioned by the
+    state and county of the 2020 tract, unless a complete one already exists.
+    A marker with the source file's row count is written last, so an index
+    missing it (or holding a different number of rows) is rebuilt.
+
+    Args:
+        index_dir (str or Path): location of the index, RELATIONSHIP_INDEX by
+            default
+
+    Returns:
+        Path of the index
+    """
+    index_dir = pathlib.Path(RELATIONSHIP_INDEX if index_dir is None else index_dir)
+    if index_dir.exists():
+        if _index_complete(index_dir):
+            return index_dir
+        shutil.rmtree(index_dir)
+
+    relationships = _read_relationship_file()
+    relationships["state"] = relationships["GEOID_TRACT_20"].str[:2]
+    relationships["county"] = relationships["GEOID_TRACT_20"].str[2:5]
+
+    build_dir = index_dir.with_name(index_dir.name + ".partial")
+    shutil.rmtree(build_dir, ignore_errors=True)
+    # one state at a time keeps each write under the engine's partition limit
+    for _, state_relationships in relationships.groupby("state"):
+        state_relationships.to_parquet(
+            build_dir, partition_cols=["state", "county"], index=False
+        )
+    # the dataset reader skips files starting with "_"
+    (build_dir / RELATIONSHIP_MARKER).write_text(
+        json.dumps({"source": RELATIONSHIP_URL, "rows": len(relationships)})
+    )
+    build_dir.rename(index_dir)
+
+    return index_dir
+
+
+def tract_relationships(geoids, column="GEOID_TRACT_20", index_dir=None):
+    """
+    Returns the 2020 / 2010 tract relationship rows for the given GEOIDs, with
+    the area overlap of every pair. Only the partitions of the counties (for
+    2020 GEOIDs) or states (for 2010 GEOIDs) involved are read. Without a
+    Parquet engine the cached national file is parsed and filtered instead.
+
+    Args:
+        geoids (list of strings): 11 digit tract GEOIDs
+        column (str): "GEOID_TRACT_20" or "GEOID_TRACT_10", the vintage of geoids
+        index_dir (str or Path): location of the partitioned index,
+            RELATIONSHIP_INDEX by default
+
+    Returns:
+        pandas DataFrame with the relationship file's GEOID and area columns
+        plus land_share_20 and land_share_10, the share of each tract's land
+        area that falls in the pair
+    """
+    geoids = pd.unique(pd.Series(list(geoids), dtype=str))
+
+    if parquet_available():
+        index_dir = build_relationship_index(index_dir)
+        # partition values are read back as integers
+        if column == "GEOID_TRACT_20":
+            filters = [
+                [("state", "=", int(area[:2])), ("county", "=", int(area[2:]))]
+                for area in sorted({geoid[:5] for geoid in geoids})
+            ]
+        else:
+            # a 2010 tract can lie in another county than its 2020 tracts
+            # (e.g. after Alaska's 2019 county split), so read whole states
+            states = sorted({int(geoid[:2]) for geoid in geoids})
+            filters = [[("state", "in", states)]]
+        relationships = pd.read_parquet(
+            index_dir, columns=list(RELATIONSHIP_DTYPES), filters=filters or None
+        )
+    else:
+        relationships = _read_relationship_file()
+
+    relationships = relationships[relationships[column].isin(geoids)]
+    relationships = relationships.assign(
+        land_share_20=relationships["AREALAND_PART"]
+        / relationships["AREALAND_TRACT_20"],
+        land_share_10=relationships["AREALAND_PART"]
+        / relationships["AREALAND_TRACT_10"],
+    )
+
+    return relationships.reset_index(drop=True)
+
+
+def census_tracts_2020_2010_relationships(overlap=False, index_dir=None):
+    """
+    returns a mapping of only 1:1 census tracts from 2020 and 2010 with GEOID_TRACT
 
+    Args:
+        overlap (bool): if True, also returns the OVERLAP_COLUMNS so tract
+            values can be crosswalked by area
+        index_dir (str or Path): location of the relationship index,
+            RELATIONSHIP_INDEX by default
+    """
     chi_census_tracts_2020 = extract_chi_census_tracts_2020()
 
     # filter to just tracts in chicago, will need to be 2020
     chi_geoid20 = list(chi_census_tracts_2020["geoid20"].astype(str))
-    filter = relationships["GEOID_TRACT_20"].isin(chi_geoid20)
-    chi_relationships = relationships[filter]
+    chi_relationships = tract_relationships(chi_geoid20, index_dir=index_dir)
 
     dupe_count = chi_relationships["GEOID_TRACT_20"].value_counts().reset_index()
 
@@ -78,6 +237,8 @@ def census_tracts_2020_2010_relationships():
 
     # limit columns
     columns = ["GEOID_TRACT_20", "GEOID_TRACT_10", "relation"]
+    if overlap:
+        columns += OVERLAP_COLUMNS
 
     return chi_relationships_flag[columns].reset_index(drop=True)
 
@@ -115,6 +276,109 @@ def full_chi_10_20_tracts_one_mapping():
     return final_df
 
 
+def load_shoreline():
+    """
+    Returns the Lake Michigan shoreline polygons as a GeoDataFrame.
+    """
+    return read_geometry(SHORELINE_FILE)
+
+
+def _geometry_hashes(geometries):
+    """
+    Returns a SHA-1 digest of the WKB of every geometry.
+    """
+    return [hashlib.sha1(wkb).digest() for wkb in shapely.to_wkb(geometries)]
+
+
+def _valid_polygons(geometries):
+    """
+    Repairs invalid polygons with a zero buffer, as overlay does.
+    """
+    geometries = geometries.copy()
+    invalid = ~shapely.is_valid(geometries)
+    if invalid.any():
+        geometries[invalid] = shapely.buffer(geometries[invalid], 0)
+
+    return geometries
+
+
+def _polygonal(geometry):
+    """
+    Keeps only the polygon parts of a geometry collection.
+    """
+    if shapely.get_type_id(geometry) != shapely.GeometryType.GEOMETRYCOLLECTION:
+        return geometry
+    parts = shapely.get_parts(geometry)
+    polygons = [part for part in parts if part.geom_type in ("Polygon", "MultiPolygon")]
+
+    return shapely.union_all(polygons) if polygons else shapely.Polygon()
+
+
+def clip_to_shore(tracts, water=None):
+    """
+    Removes the water from tract geometries, with the same result as
+    tracts.overlay(water, how="difference"). A spatial index of the water
+    polygons picks out the tracts that touch water and only those are
+    clipped, while the others are returned as they are. Clipped geometries
+    are cached by the hashes of the tract and water geometries, so every
+    caller clipping the same tracts reuses one result. The cache keeps the
+    CLIP_CACHE_SIZE most recently used geometries.
+
+    Args:
+        tracts (GeoDataFrame): tract polygons
+        water (GeoDataFrame): water polygons, the Lake Michigan shoreline by
+            default
+
+    Returns:
+        GeoDataFrame of the tracts with water removed, dropping tracts that
+        lie entirely in water, with a new RangeIndex
+    """
+    if water is None:
+        water = load_shoreline()
+    water_geometries = _valid_polygons(np.asarray(water.geometry.values))
+    water_key = hashlib.sha1(b"".join(shapely.to_wkb(water_geometries))).digest()
+
+    geometries = np.asarray(tracts.geometry.values)
+    keys = [(key, water_key) for key in _geometry_hashes(geometries)]
+    result = np.empty(len(keys), dtype=object)
+    missing = np.ones(len(keys), dtype=bool)
+    with _CLIP_LOCK:
+        for position, key in enumerate(keys):
+            if key in _CLIP_CACHE:
+                _CLIP_CACHE.move_to_end(key)
+                result[position] = _CLIP_CACHE[key]
+                missing[position] = False
+
+    if missing.any():
+        clipped = _valid_polygons(geometries[missing])
+        tree = shapely.STRtree(water_geometries)
+        tract_positions, water_positions = tree.query(clipped, predicate="intersects")
+        # subtract each water polygon in turn from the tracts it touches
+        for position in np.unique(water_positions):
+            touching = np.unique(tract_positions[water_positions == position])
+            clipped[touching] = shapely.difference(
+                clipped[touching], water_geometries[position]
+            )
+        touched = np.unique(tract_positions)
+        clipped[touched] = [
+            _polygonal(geometry) for geometry in shapely.make_valid(clipped[touched])
+        ]
+        result[missing] = clipped
+        with _CLIP_LOCK:
+            for position, geometry in zip(np.flatnonzero(missing), clipped):
+                _CLIP_CACHE[keys[position]] = geometry
+            while len(_CLIP_CACHE) > CLIP_CACHE_SIZE:
+                _CLIP_CACHE.popitem(last=False)
+
+    on_land = ~shapely.is_empty(result)
+    clipped_tracts = tracts[on_land].copy()
+    clipped_tracts[tracts.geometry.name] = gpd.GeoSeries(
+        result[on_land], index=clipped_tracts.index, crs=tracts.crs
+    )
+
+    return clipped_tracts.reset_index(drop=True)
+
+
 def restrict_tract_to_shore():
     """
     Returns a pandas df with the census tracks bounded by shore for metric
@@ -124,12 +388,7 @@ def restrict_tract_to_shore():
     census_tracks = full_chi_10_20_tracts_one_mapping()
     census_tracks_geo = gpd.GeoDataFrame(census_tracks)
 
-    lake = gpd.read_file(
-        pathlib.Path(__file__).parent
-        / "../data/import_data/Lake_Michigan_Shoreline.geojson"
-    )
-
-    final_geo = census_tracks_geo.overlay(lake, how="difference")
+    final_geo = clip_to_shore(census_tracks_geo)
 
     final_df = pd.DataFrame(final_geo)
 
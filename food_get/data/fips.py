@@ -0,0 +1,194 @@
+"""
+Project: Analyzing food access and security in Chicago
+Team: food.get
+File Name: fips.py
+
+Description:
+    This file answers state and county FIPS lookups for the whole country. The
+    prebuilt us_counties_fips.csv (2020 Census county list with 2022
+    Connecticut planning regions and former names as aliases) is turned into
+    dictionaries the first time it is used, so every lookup after that is a
+    single dictionary access. County names match with or without their
+    "County", "Parish", "Borough", "Census Area", etc. suffix and ignoring case.
+"""
+
+import pandas as pd
+from food_get.data.loader import load_dataset
+
+FIPS_FILE = "us_counties_fips.csv"
+# longest first, so "City and Borough" is removed before "Borough"
+COUNTY_SUFFIXES = [
+    " city and borough",
+    " planning region",
+    " municipality",
+    " census area",
+    " municipio",
+    " district",
+    " borough",
+    " county",
+    " parish",
+]
+
+
+def normalize_name(name):
+    """
+    Lowercases a place name and collapses its whitespace.
+    """
+    return " ".join(str(name).lower().split())
+
+
+def strip_county_suffix(name):
+    """
+    Removes the county-equivalent suffix from a normalized county name, e.g.
+    "cook county" -> "cook". Independent cities keep their " city".
+    """
+    for suffix in COUNTY_SUFFIXES:
+        if name.endswith(suffix) and len(name) > len(suffix):
+            return name[: -len(suffix)]
+
+    return name
+
+
+def _build_index(path):
+    """
+    load_dataset reader that builds the lookup dictionaries from the FIPS csv.
+    """
+    counties = pd.read_csv(path, dtype=str)
+    index = {
+        "state_codes": {},
+        "state_names": {},
+        "county_codes": {},
+        "county_names": {},
+    }
+
+    for state, state_fips, state_name in (
+        counties[["STATE", "STATEFP", "STATENAME"]]
+        .drop_duplicates("STATEFP")
+        .itertuples(index=False)
+    ):
+        index["state_names"][state_fips] = state_name
+        for key in (state_fips, state.lower(), normalize_name(state_name)):
+            index["state_codes"][key] = state_fips
+
+    # full names first so a bare name never shadows another county's full
+    # name, then bare names with "County" taking precedence (Baltimore is
+    # Baltimore County, not Baltimore city)
+    rows = list(
+        counties[["STATEFP", "COUNTYFP", "COUNTYNAME", "OFFICIAL"]].itertuples(
+            index=False
+        )
+    )
+    county_codes = index["county_codes"]
+    for state_fips, county_fips, county_name, official in rows:
+        county_codes[(state_fips, normalize_name(county_name))] = county_fips
+        if official == "1":
+            index["county_names"][(state_fips, county_fips)] = county_name
+    rows.sort(key=lambda row: not row.COUNTYNAME.endswith(" County"))
+    for state_fips, county_fips, county_name, _ in rows:
+        bare_name = strip_county_suffix(normalize_name(county_name))
+        county_codes.setdefault((state_fips, bare_name), county_fips)
+
+    return index
+
+
+def fips_index():
+    """
+    Returns the lookup dictionaries, built on first use. The inner
+    dictionaries are shared, so callers must not modify them.
+    """
+    return load_dataset(FIPS_FILE, reader=_build_index)
+
+
+def state_code(state):
+    """
+    Returns the two digit FIPS code for a state name, postal abbreviation or
+    code, or None when it is not a state.
+    """
+    return fips_index()["state_codes"].get(normalize_name(state).zfill(2))
+
+
+def state_name(state_fips):
+    """
+    Returns the name of the state with the given FIPS code, or None.
+    """
+    return fips_index()["state_names"].get(str(state_fips).zfill(2))
+
+
+def _county_code(index, county, state_fips):
+    """
+    County code lookup against an already loaded index.
+    """
+    name = normalize_name(county)
+    if name.isdigit():
+        code = name.zfill(3)
+        return code if (state_fips, code) in index["county_names"] else None
+
+    county_codes = index["county_codes"]
+    code = county_codes.get((state_fips, name))
+    if code is None:
+        code = county_codes.get((state_fips, strip_county_suffix(name)))
+
+    return code
+
+
+def county_code(county, state):
+    """
+    Returns the three digit FIPS code for a county name (or code) within a
+    state given by name, postal abbreviation or code, or None when the state
+    has no such county.
+    """
+    index = fips_index()
+    state_fips = index["state_codes"].get(normalize_name(state).zfill(2))
+    if state_fips is None:
+        return None
+
+    return _county_code(index, county, state_fips)
+
+
+def county_name(county_fips, state_fips):
+    """
+    Returns the official name of a county from its state and county FIPS
+    codes, or None.
+    """
+    return fips_index()["county_names"].get(
+        (str(state_fips).zfill(2), str(county_fips).zfill(3))
+    )
+
+
+def county_codes(counties, states):
+    """
+    Looks up many counties at once.
+
+    Args:
+        counties (list or pandas Series): county names or codes
+        states (str, list or pandas Series): one state for every county, or a
+            single state name or code for all of them
+
+    Returns:
+        pandas Series of three digit county codes, None where a name is not
+        found
+    """
+    index = fips_index()
+    counties = pd.Series(counties)
+    if isinstance(states, str):
+        states = pd.Series(states, index=counties.index)
+    else:
+        states = pd.Series(list(states), index=counties.index)
+    # each distinct state is resolved once
+    state_codes = {
+        state: index["state_codes"].get(normalize_name(state).zfill(2))
+        for state in states.unique()
+    }
+
+    lookups = {}
+    codes = []
+    for county, state in zip(counties, states):
+        key = (county, state)
+        if key not in lookups:
+            state_fips = state_codes[state]
+            lookups[key] = (
+                None if state_fips is None else _county_code(index, county, state_fips)
+            )
+        codes.append(lookups[key])
+
+    return pd.Series(codes, index=counties.index, dtype=object)
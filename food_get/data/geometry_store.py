@@ -0,0 +1,135 @@
+"""
+Project: Analyzing food access and security in Chicago
+Team: food.get
+File Name: geometry_store.py
+
+Description:
+    This file reads the GeoJSON boundary files in import_data through a binary
+    cache. The first read of a GeoJSON file converts it to GeoParquet (WKB
+    geometries) next to the source, with each feature's bounding box stored in
+    extra columns so a bbox read only loads the features that can overlap it.
+    Later reads come from the Parquet file until the GeoJSON changes, and
+    repeated reads in a process are served from memory by load_dataset.
+    Without pyarrow every read parses the GeoJSON.
+"""
+
+import geopandas as gpd
+from food_get.data.ingest import parquet_available
+from food_get.data.loader import import_data_path, load_dataset
+
+BBOX_COLUMNS = ["bbox_minx", "bbox_miny", "bbox_maxx", "bbox_maxy"]
+
+
+def geometry_cache_path(path):
+    """
+    Returns the GeoParquet cache path for a GeoJSON file.
+    """
+    return path.with_name("{}.geo.parquet".format(path.stem))
+
+
+def convert_geometry_file(path):
+    """
+    Converts a GeoJSON file to its GeoParquet cache.
+
+    Args:
+        path (Path): the GeoJSON file
+
+    Returns:
+        GeoDataFrame read from the GeoJSON
+    """
+    geo_df = gpd.read_file(path)
+    bounds = geo_df.geometry.bounds
+    bounds.columns = BBOX_COLUMNS
+    try:
+        geo_df.join(bounds).to_parquet(geometry_cache_path(path), index=False)
+    except OSError:
+        # a read-only data folder only costs us the cache
+        pass
+
+    return geo_df
+
+
+def _bbox_mask(geo_df, bbox):
+    """
+    Flags the features whose bounding box intersects bbox.
+    """
+    minx, miny, maxx, maxy = bbox
+    bounds = geo_df.geometry.bounds
+
+    return (
+        (bounds["minx"] <= maxx)
+        & (bounds["maxx"] >= minx)
+        & (bounds["miny"] <= maxy)
+        & (bounds["maxy"] >= miny)
+    )
+
+
+def _select(geo_df, columns, bbox):
+    """
+    Applies the column and bbox filters to a fully read file.
+    """
+    if bbox is not None:
+        geo_df = geo_df[_bbox_mask(geo_df, bbox)].reset_index(drop=True)
+    if columns is not None:
+        geo_df = geo_df[columns]
+
+    return geo_df
+
+
+def _read_geometry_file(path, columns=None, bbox=None):
+    """
+    load_dataset reader for a GeoJSON file, through its GeoParquet cache when
+    possible.
+    """
+    if columns is not None:
+        columns = list(columns)
+        if "geometry" not in columns:
+            columns.append("geometry")
+    if not parquet_available():
+        return _select(gpd.read_file(path), columns, bbox)
+
+    parquet_path = geometry_cache_path(path)
+    if not (
+        parquet_path.exists()
+        and parquet_path.stat().st_mtime_ns >= path.stat().st_mtime_ns
+    ):
+        return _select(convert_geometry_file(path), columns, bbox)
+
+    filters = None
+    if bbox is not None:
+        minx, miny, maxx, maxy = bbox
+        filters = [
+            ("bbox_minx", "<=", maxx),
+            ("bbox_maxx", ">=", minx),
+            ("bbox_miny", "<=", maxy),
+            ("bbox_maxy", ">=", miny),
+        ]
+    geo_df = gpd.read_parquet(parquet_path, columns=columns, filters=filters)
+
+    return geo_df.drop(columns=BBOX_COLUMNS, errors="ignore")
+
+
+def read_geometry(filename, columns=None, bbox=None):
+    """
+    Reads a GeoJSON file in import_data through the binary geometry cache.
+
+    Args:
+        filename (str): file name in import_data or a full path
+        columns (list): columns to read, the geometry is always included
+        bbox (tuple): (minx, miny, maxx, maxy) in the file's CRS, to read only
+            the features whose bounding box intersects it
+
+    Returns:
+        GeoDataFrame
+    """
+    if columns is not None:
+        columns = tuple(columns)
+    if bbox is not None:
+        bbox = tuple(float(bound) for bound in bbox)
+
+    return load_dataset(
+        import_data_path(filename),
+        reader=_read_geometry_file,
+        columns=columns,
+        bbox=bbox,
+    )
@@ -0,0 +1,260 @@
+"""
+Project: Analyzing food access and security in Chicago
+Team: food.get
+File Name: http_client.py
+
+Description:
+    This file provides the shared HTTP client for the data APIs. It keeps one
+    pooled session with timeouts and exponential backoff retries, and an
+    on-disk response cache keyed by the normalized request URL. Cached
+    responses can expire after a TTL, and offline mode
+    (FOOD_GET_OFFLINE=1) serves only from the cache.
+"""
+
+import hashlib
+import json
+import os
+import pathlib
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+HTTP_CACHE_DIR = pathlib.Path(__file__).parent / "cache" / "http"
+DEFAULT_TIMEOUT = (5, 60)
+RETRY_TOTAL = 5
+# connection errors (DNS, refused) rarely clear up, so retry them less
+RETRY_CONNECT = 2
+RETRY_BACKOFF = 0.5
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+POOL_SIZE = 16
+
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+
+class OfflineCacheMiss(KeyError):
+    """
+    Raised in offline mode when a URL is not in the cache.
+    """
+
+
+class RateLimiter:
+    """
+    Spaces out calls to wait() so that no more than `rate` of them start per
+    second, across all threads sharing the limiter. A rate of None never waits.
+    """
+
+    def __init__(self, rate=None):
+        self.interval = 1 / rate if rate else 0
+        self.next_start = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def get_session():
+    """
+    Returns the shared requests Session, creating it on first use. The session
+    pools up to POOL_SIZE connections per host and retries failed GETs with
+    exponential backoff.
+    """
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            retry = Retry(
+                total=RETRY_TOTAL,
+                connect=RETRY_CONNECT,
+                backoff_factor=RETRY_BACKOFF,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=["GET"],
+            )
+            adapter = HTTPAdapter(
+                pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry
+            )
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _SESSION = session
+
+    return _SESSION
+
+
+def is_offline():
+    """
+    Returns True when FOOD_GET_OFFLINE is set to a true value.
+    """
+    return os.environ.get("FOOD_GET_OFFLINE", "").lower() in ("1", "true", "yes")
+
+
+def normalize_url(url, params=None):
+    """
+    Normalizes a URL so equivalent requests share a cache entry: the scheme
+    and host are lowercased and the query parameters (including params) are
+    sorted.
+    """
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        query += [(key, str(value)) for key, value in params.items()]
+
+    return urlunsplit(
+        (
+            parts.scheme.lower(),
+            parts.netloc.lower(),
+            parts.path,
+            urlencode(sorted(query), safe=",:*()'"),
+            "",
+        )
+    )
+
+
+def _cache_files(url, cache_dir):
+    """
+    Returns the metadata and body paths of the cache entry for a normalized URL.
+    """
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    cache_dir = pathlib.Path(cache_dir)
+
+    return cache_dir / "{}.json".format(key), cache_dir / "{}.body".format(key)
+
+
+def _write_atomic(path, content):
+    """
+    Writes bytes to path through a temporary file so readers never see a
+    partial entry.
+    """
+    temp_path = path.with_name("{}.{}.tmp".format(path.name, threading.get_ident()))
+    temp_path.write_bytes(content)
+    os.replace(temp_path, path)
+
+
+def _cached_response(url, meta, body_path):
+    """
+    Rebuilds a requests Response from a cache entry.
+    """
+    response = requests.Response()
+    response.status_code = meta["status_code"]
+    response.url = url
+    response.headers.update(meta.get("headers", {}))
+    response.encoding = meta.get("encoding")
+    response._content = body_path.read_bytes()
+
+    return response
+
+
+def cached_get(
+    url,
+    params=None,
+    ttl=None,
+    offline=None,
+    timeout=DEFAULT_TIMEOUT,
+    cache_dir=HTTP_CACHE_DIR,
+):
+    """
+    GETs a URL through the shared session and the on-disk cache. Only
+    successful (200) responses are cached.
+
+    Args:
+        url (str): the URL to request
+        params (dict): optional query parameters added to the URL
+        ttl (float): seconds a cached response stays fresh, None to never expire
+        offline (bool): serve only from the cache, defaults to is_offline()
+        timeout (tuple): connect and read timeouts in seconds
+        cache_dir (str or Path): cache folder, None to bypass the cache
+
+    Returns:
+        requests Response
+    """
+    if offline is None:
+        offline = is_offline()
+    key_url = normalize_url(url, params)
+
+    if cache_dir is not None:
+        meta_path, body_path = _cache_files(key_url, cache_dir)
+        if meta_path.exists() and body_path.exists():
+            meta = json.loads(meta_path.read_text())
+            fresh = ttl is None or time.time() - meta["fetched_at"] <= ttl
+            if fresh or offline:
+                return _cached_response(key_url, meta, body_path)
+
+    if offline:
+        raise OfflineCacheMiss("Offline and no cached response for {}".format(key_url))
+
+    # the request keeps the caller's parameter order, only the cache key is
+    # normalized
+    response = get_session().get(url, params=params, timeout=timeout)
+
+    if cache_dir is not None and response.status_code == 200:
+        meta_path.parent.mkdir(parents=True, exist_ok=True)
+        _write_atomic(body_path, response.content)
+        meta = {
+            "url": key_url,
+            "status_code": response.status_code,
+            "fetched_at": time.time(),
+            "encoding": response.encoding,
+            "headers": {"Content-Type": response.headers.get("Content-Type", "")},
+        }
+        _write_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+
+    return response
+
+
+def cache_entries(cache_dir=HTTP_CACHE_DIR):
+    """
+    Lists the cached responses.
+
+    Returns:
+        pandas DataFrame with url, fetched_at, age_seconds, size_bytes and
+        the entry's metadata path
+    """
+    entries = []
+    now = time.time()
+    for meta_path in sorted(pathlib.Path(cache_dir).glob("*.json")):
+        meta = json.loads(meta_path.read_text())
+        body_path = meta_path.with_suffix(".body")
+        entries.append(
+            {
+                "url": meta["url"],
+                "fetched_at": pd.Timestamp(meta["fetched_at"], unit="s"),
+                "age_seconds": now - meta["fetched_at"],
+                "size_bytes": body_path.stat().st_size if body_path.exists() else 0,
+                "path": meta_path,
+            }
+        )
+
+    return pd.DataFrame(
+        entries, columns=["url", "fetched_at", "age_seconds", "size_bytes", "path"]
+    )
+
+
+def prune_cache(max_age=None, url_contains=None, cache_dir=HTTP_CACHE_DIR):
+    """
+    Deletes cached responses older than max_age seconds and / or whose URL
+    contains url_contains. With neither given the whole cache is cleared.
+
+    Returns:
+        int number of entries removed
+    """
+    entries = cache_entries(cache_dir)
+    remove = pd.Series(True, index=entries.index)
+    if max_age is not None:
+        remove &= entries["age_seconds"] > max_age
+    if url_contains is not None:
+        remove &= entries["url"].str.contains(url_contains, regex=False)
+
+    for meta_path in entries.loc[remove, "path"]:
+        meta_path.with_suffix(".body").unlink(missing_ok=True)
+        meta_path.unlink(missing_ok=True)
+
+    return int(remove.sum())
@@ -0,0 +1,179 @@
+"""
+Project: Analyzing food access and security in Chicago
+Team: food.get
+File Name: ingest.py
+
+Description:
+    This file declares the columns and data types the project needs from each
+    CSV in import_data and reads only those. The first typed read of a CSV is
+    written to a Parquet cache next to it, and later reads come from that cache
+    until the CSV changes. Parquet needs pyarrow (or fastparquet). Without it
+    the typed CSV read is used on every run. A source refreshed from its API
+    is read from its refreshed table instead once that table exists. The
+    Atlas files have their own region-filtered reader in extract_atlas.py.
+"""
+
+import hashlib
+import importlib
+import json
+import pandas as pd
+from food_get.data.loader import import_data_path, load_dataset
+
+SOURCES = {
+    "grocery": {
+        "file": "Grocery_Store_Status_20240219.csv",
+        "columns": {
+            "Store Name": "str",
+            "Address": "str",
+            "New status": "category",
+            "Location": "str",
+        },
+        # kept up to date by extract_grocery.refresh_grocery_stores
+        "refreshed": "grocery_store_feed",
+    },
+    "snap": {
+        "file": "snap_retailers_data.csv",
+        "columns": {
+            "Store_Name": "category",
+            "Store_Street_Address": "str",
+            "Latitude": "float32",
+            "Longitude": "float32",
+        },
+    },
+    "census_2022": {
+        "file": "census_2022.csv",
+        "columns": {
+            "DP05_0001E": "int64",
+            "state": "int64",
+            "county": "int64",
+            "tract": "int64",
+            "DP02_0001E": "int64",
+            "DP03_0062E": "int64",
+            "DP03_0063E": "int64",
+        },
+    },
+    "chi_ct_2020": {
+        "file": "chi_ct_2020.csv",
+        "columns": {"ct_chicago": "int64", "community_name": "category"},
+    },
+}
+
+
+def parquet_available():
+    """
+    Returns True when pandas has a working Parquet engine to write the cache
+    with.
+    """
+    for engine in ("pyarrow", "fastparquet"):
+        try:
+            importlib.import_module(engine)
+        except ImportError:
+            continue
+        return True
+
+    return False
+
+
+def cache_path(csv_path, columns):
+    """
+    Returns the Parquet cache path for a CSV. The name includes a hash of the
+    column spec so changing the spec never serves a stale cache.
+    """
+    spec = json.dumps(columns, sort_keys=True).encode("utf-8")
+    spec_hash = hashlib.sha1(spec).hexdigest()[:8]
+
+    return csv_path.with_name("{}.{}.parquet".format(csv_path.stem, spec_hash))
+
+
+def read_typed_csv(csv_path, columns, use_cache=True):
+    """
+    Reads the given columns of a CSV with their declared types, through the
+    Parquet cache when possible.
+
+    Args:
+        csv_path (Path): path to the CSV
+        columns (dict): column name to pandas dtype
+        use_cache (bool): if False, always read the CSV and skip the cache
+
+    Returns:
+        pandas DataFrame with only the requested columns
+    """
+    if not (use_cache and parquet_available()):
+        return pd.read_csv(csv_path, usecols=list(columns), dtype=columns)
+
+    parquet_path = cache_path(csv_path, columns)
+    if (
+        parquet_path.exists()
+        and parquet_path.stat().st_mtime_ns >= csv_path.stat().st_mtime_ns
+    ):
+        return pd.read_parquet(parquet_path)
+
+    df = pd.read_csv(csv_path, usecols=list(columns), dtype=columns)
+    try:
+        df.to_parquet(parquet_path, index=False)
+    except OSError:
+        # a read-only data folder only costs us the cache
+        pass
+
+    return df
+
+
+def refreshed_table_path(source):
+    """
+    Returns the path of the table a source is refreshed into, Parquet when an
+    engine is installed and csv otherwise, or None for sources that are not
+    refreshed. The table may not exist yet.
+    """
+    name = SOURCES[source].get("refreshed")
+    if name is None:
+        return None
+    suffix = ".parquet" if parquet_available() else ".csv"
+
+    return import_data_path(name + suffix)
+
+
+def _read_refreshed_table(path, source):
+    """
+    load_dataset reader for a refreshed table, with the source's columns and
+    types.
+    """
+    columns = SOURCES[source]["columns"]
+    if path.suffix != ".parquet":
+        return pd.read_csv(path, usecols=list(columns), dtype=columns)
+
+    df = pd.read_parquet(path, columns=list(columns))
+    # casting to str would turn missing values into "nan"
+    return df.astype(
+        {column: dtype for column, dtype in columns.items() if dtype != "str"}
+    )
+
+
+def _read_source_file(path, source):
+    """
+    load_dataset reader for a named source.
+    """
+    return read_typed_csv(path, SOURCES[source]["columns"])
+
+
+def read_source(source):
+    """
+    Returns the typed, column-pruned DataFrame for one of the SOURCES, from
+    its refreshed table when there is one. The result is also memoized in
+    memory by load_dataset.
+
+    Args:
+        source (str): key of SOURCES, e.g. "snap" or "census_2022"
+
+    Returns:
+        pandas DataFrame
+    """
+    if source not in SOURCES:
+        raise KeyError("Unknown data source: {}".format(source))
+
+    refreshed = refreshed_table_path(source)
+    if refreshed is not None and refreshed.exists():
+        return load_dataset(refreshed, reader=_read_refreshed_table, source=source)
+
+    return load_dataset(
+        SOURCES[source]["file"], reader=_read_source_file, source=source
+    )
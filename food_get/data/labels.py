@@ -0,0 +1,60 @@
+"""
+Project: Analyzing food access and security in Chicago
+Team: food.get
+File Name: labels.py
+
+Description:
+    This file builds the percentage labels and low-access / low-income flags
+    used by the historical Atlas data and the 2022 metric as whole-column
+    operations.
+"""
+
+import numpy as np
+import pandas as pd
+
+def percentage_labels(values):
+    """
+    Formats proportions as percentages with one decimal, e.g. "50.0%".
+
+    Args:
+        values (pandas Series or array): proportions
+
+    Returns:
+        pandas Series of labels (aligned with values when it is a Series)
+    """
+    index = values.index if isinstance(values, pd.Series) else None
+    labels = [f"{value * 100:.1f}%" for value in values]
+
+    return pd.Series(labels, index=index, dtype=object)
+
+
+def rounded_percentage_labels(values):
+    """
+    Formats proportions the way the 2022 metric labels them: the percentage
+    rounded to one decimal with pandas, then converted with str, e.g. "50.0%".
+
+    Args:
+        values (pandas Series): proportions
+
+    Returns:
+        pandas Series of labels
+    """
+    return (values * 100).round(1).astype(str) + "%"
+
+
+def threshold_flags(values, threshold, inclusive=False):
+    """
+    Flags values below a threshold (or at it when inclusive) with 1 and all
+    other values, including missing ones, with 0.
+
+    Args:
+        values (pandas Series): values to compare
+        threshold (float): the cut off
+        inclusive (bool): if True, values equal to the threshold are flagged
+
+    Returns:
+        pandas Series of int64 flags
+    """
+    below = values <= threshold if inclusive else values < threshold
+
+    return below.astype(np.int64)
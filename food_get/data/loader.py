@@ -0,0 +1,82 @@
+"""
+Project: Analyzing food access and security in Chicago
+Team: food.get
+File Name: loader.py
+
+Description:
+    This file lazily loads the raw data sets in import_data. A file is read the
+    first time it is requested and the parsed result is kept in memory. The
+    cached copy is reused until the file's modification time or size changes
+    and its content hash no longer matches.
+"""
+
+import hashlib
+import json
+import pathlib
+import pandas as pd
+
+IMPORT_DATA = pathlib.Path(__file__).parent / "import_data"
+
+_CACHE = {}
+
+
+def import_data_path(filename):
+    """
+    Returns the path of a file in import_data. Absolute paths are returned as is.
+    """
+    return IMPORT_DATA / filename
+
+
+def file_hash(path):
+    """
+    Returns the SHA-1 hex digest of a file's content.
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as data_file:
+        for block in iter(lambda: data_file.read(1024 * 1024), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def read_json(path):
+    """
+    Reads a JSON file, for use as a load_dataset reader.
+    """
+    with open(path) as json_file:
+        return json.load(json_file)
+
+
+def load_dataset(filename, reader=pd.read_csv, **kwargs):
+    """
+    Reads a data set on first use and serves later calls from memory.
+
+    Args:
+        filename (str or Path): file name in import_data or a full path
+        reader (function): called as reader(path, **kwargs) to parse the file
+        kwargs: passed on to reader, each distinct set is cached separately
+
+    Returns:
+        A copy of the parsed data, so callers can modify it freely
+    """
+    path = import_data_path(filename)
+    stat = path.stat()
+    signature = (stat.st_mtime_ns, stat.st_size)
+    key = (str(path), reader, repr(sorted(kwargs.items())))
+
+    entry = _CACHE.get(key)
+    if entry is None or entry["signature"] != signature:
+        digest = file_hash(path)
+        if entry is None or entry["digest"] != digest:
+            entry = {"data": reader(path, **kwargs), "digest": digest}
+            _CACHE[key] = entry
+        entry["signature"] = signature
+
+    return entry["data"].copy()
+
+
+def clear_cache():
+    """
+    Drops every cached data set.
+    """
+    _CACHE.clear()
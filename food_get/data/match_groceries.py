@@ -12,17 +12,22 @@ import warnings
 
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
+import json
+import pathlib
 import pandas as pd
-from math import asin, sqrt, cos, sin, radians
 import numpy as np
+from food_get.data.distance import EARTH_R_MI, haversine
 
-EARTH_R_MI = 3963
+MATCH_STATE_PATH = pathlib.Path(__file__).parent / "cache" / "snap_match_state.json"
+# bumped when the layout of the match state changes
+MATCH_STATE_VERSION = 2
 
 
 def haversine_distance(lat1, lon1, lat2, lon2):
     """
     Calculate the distance between two points on a sphere (like Earth) in miles.
-    Used code from CAPP 122 PA3
+    Used code from CAPP 122 PA3. Scalar wrapper around distance.haversine, which
+    should be used directly for arrays.
 
     :param lat1: latitude of first point
     :param lon1: longitude of first point
@@ -32,25 +37,137 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     :return: distance in miles
     """
 
-    rlat1, rlon1, rlat2, rlon2 = (
-        radians(lat1),
-        radians(lon1),
-        radians(lat2),
-        radians(lon2),
+    return float(haversine(lat1, lon1, lat2, lon2))
+
+
+def address_numbers(addresses):
+    """
+    Returns the leading street number of each address, the value both data sets
+    are blocked on before any distance is computed.
+
+    Args:
+        addresses (pandas Series): street addresses
+
+    Returns:
+        pandas Series of the first whitespace separated token of each address
+    """
+    return addresses.str.split(" ").str[0]
+
+
+def _unit_vectors(latitudes, longitudes):
+    """
+    Converts latitude / longitude arrays in degrees to points on the unit sphere.
+    """
+    rlat = np.radians(latitudes)
+    rlon = np.radians(longitudes)
+    cos_lat = np.cos(rlat)
+
+    return np.column_stack(
+        (cos_lat * np.cos(rlon), cos_lat * np.sin(rlon), np.sin(rlat))
     )
 
-    d = (
-        2
-        * EARTH_R_MI
-        * asin(
-            sqrt(
-                sin((rlat2 - rlat1) / 2) ** 2
-                + cos(rlat1) * cos(rlat2) * sin((rlon2 - rlon1) / 2) ** 2
-            )
-        )
+
+def _grid_keys(stores_df, cell_size):
+    """
+    Creates a frame of address number and 3D grid cell for every store with a
+    usable address number and coordinates. The original row position is kept in
+    the "pos" column.
+    """
+    latitudes = pd.to_numeric(stores_df["latitude"], errors="coerce").to_numpy(float)
+    longitudes = pd.to_numeric(stores_df["longitude"], errors="coerce").to_numpy(float)
+    keys = pd.DataFrame(
+        {
+            "pos": np.arange(len(stores_df)),
+            "address_num": stores_df["address_num"].to_numpy(),
+            "latitude": latitudes,
+            "longitude": longitudes,
+        }
+    )
+    keys = keys[
+        keys["address_num"].notna()
+        & keys["latitude"].notna()
+        & keys["longitude"].notna()
+    ]
+    cells = np.floor(
+        _unit_vectors(keys["latitude"], keys["longitude"]) / cell_size
+    ).astype(np.int64)
+    keys["cell_x"], keys["cell_y"], keys["cell_z"] = cells.T
+
+    return keys
+
+
+def _candidate_pairs(stores1_df, stores2_df, max_dist):
+    """
+    Blocks the two data sets on address number and a grid over the unit sphere.
+    The grid cells are as wide as the straight line (chord) distance matching
+    max_dist, so every pair within max_dist lies in the same or a neighbouring
+    cell and only those 27 cells are compared.
+
+    Returns:
+        pandas DataFrame with one row per candidate pair and the positions and
+        coordinates of both stores
+    """
+    angle = max_dist / 5280 / EARTH_R_MI
+    cell_size = max(2 * np.sin(angle / 2) * (1 + 1e-6), 1e-12)
+
+    keys1 = _grid_keys(stores1_df, cell_size)
+    keys2 = _grid_keys(stores2_df, cell_size)
+
+    # expand each store in the first data set to its 27 neighbouring cells
+    offsets = np.array(np.meshgrid([-1, 0, 1], [-1, 0, 1], [-1, 0, 1])).reshape(3, -1)
+    neighbours = keys1.loc[keys1.index.repeat(offsets.shape[1])].reset_index(drop=True)
+    tiled = np.tile(offsets, len(keys1))
+    neighbours["cell_x"] += tiled[0]
+    neighbours["cell_y"] += tiled[1]
+    neighbours["cell_z"] += tiled[2]
+
+    return neighbours.merge(
+        keys2,
+        on=["address_num", "cell_x", "cell_y", "cell_z"],
+        suffixes=("_1", "_2"),
+    )
+
+
+def find_first_matches(stores1_df, stores2_df, max_dist=1000):
+    """
+    Finds, for every store in stores1_df, the first store in stores2_df (in row
+    order) that shares its address number and lies within max_dist feet. Only
+    candidate pairs from _candidate_pairs have their distance computed.
+
+    Args:
+        stores1_df (pandas DataFrame): stores with address_num, latitude and
+            longitude columns
+        stores2_df (pandas DataFrame): stores with the same columns
+        max_dist (int): maximum distance in feet
+
+    Returns:
+        numpy array with the row position of the matching store in stores2_df
+        for every row of stores1_df, or -1 where there is no match
+    """
+    matches = np.full(len(stores1_df), -1, dtype=np.int64)
+    if len(stores1_df) == 0 or len(stores2_df) == 0:
+        return matches
+
+    pairs = _candidate_pairs(stores1_df, stores2_df, max_dist)
+    dist = haversine(
+        pairs["latitude_1"].to_numpy(),
+        pairs["longitude_1"].to_numpy(),
+        pairs["latitude_2"].to_numpy(),
+        pairs["longitude_2"].to_numpy(),
     )
+    # dist is how many feet away
+    within = dist * 5280 <= max_dist
+    pos1 = pairs["pos_1"].to_numpy()[within]
+    pos2 = pairs["pos_2"].to_numpy()[within]
+
+    # keep the lowest stores2 position for each stores1 row
+    order = np.lexsort((pos2, pos1))
+    pos1, pos2 = pos1[order], pos2[order]
+    first = np.ones(len(pos1), dtype=bool)
+    first[1:] = pos1[1:] != pos1[:-1]
+    matches[pos1[first]] = pos2[first]
 
-    return d
+    return matches
 
 
 def match_grocery_stores(stores1_df, stores2_df, max_dist=1000):
@@ -58,37 +175,40 @@ def match_grocery_stores(stores1_df, stores2_df, max_dist=1000):
     Matches grocery stores from two data sets with address and lat/long given a
     max_dist. Matches on dist and the numbers of an address. Only uses the first match
     even if there are multiple. Default value for max_distance = 1000 feet.
+
+    Candidates are found with find_first_matches, so only stores sharing an
+    address number in neighbouring grid cells are ever compared.
+    """
+    stores1_df = stores1_df.copy()
+    stores2_df = stores2_df.copy()
+    stores1_df["address_num"] = address_numbers(stores1_df["address"])
+    stores2_df["address_num"] = address_numbers(stores2_df["address"])
+
+    matches = find_first_matches(stores1_df, stores2_df, max_dist)
+
+    return merge_matches(stores1_df, stores2_df, matches)
+
+
+def merge_matches(stores1_df, stores2_df, matches):
+    """
+    Merges stores2_df onto stores1_df given the stores2_df row position matched
+    to each row of stores1_df (-1 for no match) and flags matched rows with
+    is_snap.
     """
+    matched = np.flatnonzero(matches >= 0)
+    match_ids = np.arange(1, len(matched) + 1)
 
-    stores1_df["match_id"] = None
-    stores2_df["match_id"] = None
-    stores1_df["address_num"] = stores1_df["address"].str.split(" ").str[0]
-    stores2_df["address_num"] = stores2_df["address"].str.split(" ").str[0]
-    match_id = 1
-
-    for index1, store1 in stores1_df.iterrows():
-        for index2, store2 in stores2_df.iterrows():
-            # check that not already matched matched and numbers match
-            if (
-                stores1_df.loc[index1, "match_id"] is None
-                and store1["address_num"] == store2["address_num"]
-            ):
-                dist = haversine_distance(
-                    float(store1["latitude"]),
-                    float(store1["longitude"]),
-                    float(store2["latitude"]),
-                    float(store2["longitude"]),
-                )
-                # dist is how many feet away
-                if dist * 5280 <= max_dist:
-                    stores1_df.loc[index1, "match_id"] = match_id
-                    stores2_df.loc[index2, "match_id"] = match_id
-                    match_id += 1
+    ids1 = np.full(len(stores1_df), None, dtype=object)
+    ids1[matched] = match_ids
+    stores1_df = stores1_df.assign(match_id=ids1)
 
+    # a store in stores2_df keeps the id of the last store that matched it
     # change non matches so they dont get matched
-    mask = stores2_df["match_id"].isnull()
-    stores2_df["match_id"] = np.where(mask, "missing", stores2_df["match_id"])
-    stores2_df[stores2_df["match_id"].isnull()]["match_id"] = "missing"
+    ids2 = np.full(len(stores2_df), "missing", dtype=object)
+    last_ids = pd.Series(match_ids, index=matches[matched]).groupby(level=0).last()
+    ids2[last_ids.index.to_numpy()] = last_ids.to_numpy()
+    stores2_df = stores2_df.assign(match_id=ids2)
+
     merged_df = pd.merge(stores1_df, stores2_df, how="left", on="match_id")
     mask = merged_df["match_id"].notna()
     merged_df["is_snap"] = np.where(mask, True, False)
@@ -117,3 +237,254 @@ def match_grocery_stores(stores1_df, stores2_df, max_dist=1000):
     merged_df["address"] = merged_df["address"].str.title()
 
     return merged_df
+
+
+def _hash_keys(content, index):
+    """
+    Hashes each row of content to a string key. Identical rows are told apart
+    by an occurrence counter.
+    """
+    # object dtype keeps the keys strings even when there are no rows
+    hashes = (
+        pd.util.hash_pandas_object(content, index=False)
+        .astype(object)
+        .map("{:016x}".format)
+    )
+    occurrence = hashes.groupby(hashes).cumcount().astype(str)
+    keys = hashes + "-" + occurrence
+    keys.index = index
+
+    return keys
+
+
+def row_keys(stores_df):
+    """
+    Creates a content key for every store from its name, address and
+    coordinates. Coordinates are compared as numbers so text and float copies of
+    the same location share a key. Identical rows are told apart by an
+    occurrence counter.
+
+    Args:
+        stores_df (pandas DataFrame): stores with store_name, address,
+            latitude and longitude columns
+
+    Returns:
+        pandas Series of string keys aligned with stores_df
+    """
+    content = pd.DataFrame(
+        {
+            "store_name": stores_df["store_name"].astype(str).to_numpy(),
+            "address": stores_df["address"].astype(str).to_numpy(),
+            "latitude": pd.to_numeric(stores_df["latitude"], errors="coerce")
+            .round(7)
+            .to_numpy(),
+            "longitude": pd.to_numeric(stores_df["longitude"], errors="coerce")
+            .round(7)
+            .to_numpy(),
+        }
+    )
+
+    return _hash_keys(content, stores_df.index)
+
+
+def identity_keys(stores_df):
+    """
+    Creates an identity key for every store from its name and address,
+    ignoring case and extra whitespace, the store identity used by
+    extract_grocery.grocery_store_keys. A store keeps its key when its
+    coordinates or the casing of its name change. Stores with the same name
+    and address are told apart by an occurrence counter.
+
+    Args:
+        stores_df (pandas DataFrame): stores with store_name and address
+            columns
+
+    Returns:
+        pandas Series of string keys aligned with stores_df
+    """
+    content = pd.DataFrame(
+        {
+            column: stores_df[column]
+            .astype(str)
+            .str.lower()
+            .str.split()
+            .str.join(" ")
+            .to_numpy(dtype=object)
+            for column in ["store_name", "address"]
+        }
+    )
+
+    return _hash_keys(content, stores_df.index)
+
+
+def load_match_state(state_path=MATCH_STATE_PATH):
+    """
+    Loads the persisted match state, or None when there is none yet.
+    """
+    state_path = pathlib.Path(state_path)
+    if not state_path.exists():
+        return None
+    with open(state_path) as state_file:
+        return json.load(state_file)
+
+
+def save_match_state(state, state_path=MATCH_STATE_PATH):
+    """
+    Writes the match state to disk, creating its folder when needed.
+    """
+    state_path = pathlib.Path(state_path)
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(state_path, "w") as state_file:
+        json.dump(state, state_file)
+
+
+def _usable_state(state_path, max_dist):
+    """
+    Loads the match state when it was written by this version for max_dist.
+    """
+    state = load_match_state(state_path) if state_path is not None else None
+    if state is not None and (
+        state.get("version") != MATCH_STATE_VERSION or state["max_dist"] != max_dist
+    ):
+        return None
+
+    return state
+
+
+def _assign_store_ids(identities, state):
+    """
+    Gives known stores their persisted store_id and new stores the next unused
+    ids in row order. Without state stores are numbered 1 to n.
+
+    Returns:
+        (store_ids, next_store_id)
+    """
+    if state is None:
+        return np.arange(1, len(identities) + 1, dtype=np.int64), len(identities) + 1
+
+    store_ids = np.zeros(len(identities), dtype=np.int64)
+    next_store_id = state["next_store_id"]
+    for pos, identity in enumerate(identities):
+        previous = state["stores"].get(identity)
+        if previous is None:
+            store_ids[pos] = next_store_id
+            next_store_id += 1
+        else:
+            store_ids[pos] = previous["store_id"]
+
+    return store_ids, next_store_id
+
+
+def stable_store_ids(stores_df, max_dist=1000, state_path=MATCH_STATE_PATH):
+    """
+    Returns the store_id match_grocery_stores_incremental gives each store,
+    read from the match state without matching stores or writing the state.
+
+    Args:
+        stores_df (pandas DataFrame): cleaned grocery stores
+        max_dist (int): maximum distance in feet of the match state to read
+        state_path (str or Path): where the match state is kept
+
+    Returns:
+        numpy int64 array of store ids aligned with stores_df
+    """
+    state = _usable_state(state_path, max_dist)
+
+    return _assign_store_ids(identity_keys(stores_df).to_numpy(), state)[0]
+
+
+def match_grocery_stores_incremental(
+    stores1_df, stores2_df, max_dist=1000, state_path=MATCH_STATE_PATH
+):
+    """
+    Matches grocery stores like match_grocery_stores, but reuses the matches
+    persisted at state_path by a previous run. Stores are identified by
+    identity_keys and their content is compared by row_keys, so only new or
+    changed rows are matched again:
+
+    * new or changed stores are matched against every SNAP retailer
+    * stores whose previous SNAP match disappeared are matched again
+    * stores without a previous match are only compared to new SNAP retailers
+    * all other stores keep their previous match
+
+    store_id values follow the store identity, so a store keeps its id when
+    its coordinates or other details change, and new stores get ids that were
+    never used before. The first run (or a run with a different max_dist)
+    matches everything and numbers stores 1 to n in row order.
+
+    Args:
+        stores1_df (pandas DataFrame): cleaned grocery stores
+        stores2_df (pandas DataFrame): cleaned SNAP retailers
+        max_dist (int): maximum distance in feet
+        state_path (str or Path): where the match state is kept, None to run
+            without reading or writing state
+
+    Returns:
+        The merged DataFrame of match_grocery_stores with a leading store_id
+        column
+    """
+    stores1_df = stores1_df.copy()
+    stores2_df = stores2_df.copy()
+    stores1_df["address_num"] = address_numbers(stores1_df["address"])
+    stores2_df["address_num"] = address_numbers(stores2_df["address"])
+    identities = identity_keys(stores1_df).to_numpy()
+    keys1 = row_keys(stores1_df).to_numpy()
+    keys2 = row_keys(stores2_df).to_numpy()
+
+    state = _usable_state(state_path, max_dist)
+    store_ids, next_store_id = _assign_store_ids(identities, state)
+
+    if state is None:
+        matches = find_first_matches(stores1_df, stores2_df, max_dist)
+    else:
+        matches = np.full(len(stores1_df), -1, dtype=np.int64)
+        snap_positions = {key: pos for pos, key in enumerate(keys2)}
+        new_snap = np.flatnonzero(~pd.Series(keys2).isin(state["snap"]).to_numpy())
+        rematch_all, rematch_new = [], []
+
+        for pos, (identity, key) in enumerate(zip(identities, keys1)):
+            previous = state["stores"].get(identity)
+            if previous is None or previous["content"] != key:
+                rematch_all.append(pos)
+            elif previous["snap"] is None:
+                rematch_new.append(pos)
+            elif previous["snap"] in snap_positions:
+                matches[pos] = snap_positions[previous["snap"]]
+            else:
+                rematch_all.append(pos)
+
+        if rematch_all:
+            matches[rematch_all] = find_first_matches(
+                stores1_df.iloc[rematch_all], stores2_df, max_dist
+            )
+        if rematch_new and len(new_snap):
+            new_matches = find_first_matches(
+                stores1_df.iloc[rematch_new], stores2_df.iloc[new_snap], max_dist
+            )
+            matches[rematch_new] = np.where(new_matches >= 0, new_snap[new_matches], -1)
+
+    if state_path is not None:
+        save_match_state(
+            {
+                "version": MATCH_STATE_VERSION,
+                "max_dist": max_dist,
+                "next_store_id": int(next_store_id),
+                "stores": {
+                    identity: {
+                        "store_id": int(store_id),
+                        "content": key,
+                        "snap": keys2[match] if match >= 0 else None,
+                    }
+                    for identity, key, store_id, match in zip(
+                        identities, keys1, store_ids, matches
+                    )
+                },
+                "snap": list(keys2),
+            },
+            state_path,
+        )
+
+    merged_df = merge_matches(stores1_df, stores2_df, matches)
+    merged_df.insert(0, "store_id", store_ids)
+
+    return merged_df
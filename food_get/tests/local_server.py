@@ -0,0 +1,51 @@
+"""
+Project: Analyzing food access and security in Chicago
+Team: food.get
+File Name: local_server.py
+
+Description:
+    This file runs a local HTTP server that stands in for the remote APIs in
+    the tests.
+"""
+
+import contextlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class JSONHandler(BaseHTTPRequestHandler):
+    """
+    Request handler that replies with JSON and does not log requests.
+    """
+
+    def reply(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextlib.contextmanager
+def serve(handler):
+    """
+    Serves handler on a free local port in a background thread.
+
+    Args:
+        handler (class): a JSONHandler subclass
+
+    Returns:
+        context manager yielding the base URL of the server
+    """
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield "http://127.0.0.1:{}".format(httpd.server_address[1])
+    finally:
+        httpd.shutdown()
@@ -0,0 +1,117 @@
+"""
+Project: Analyzing food access and security in Chicago
+Team: food.get
+File Name: reference_matcher.py
+
+Description:
+    This file holds the original nested loop store matcher, the reference for
+    the match semantics of match_grocery_stores, and the synthetic grocery and
+    SNAP data the tests and the matcher benchmark run it on.
+"""
+
+import numpy as np
+import pandas as pd
+from food_get.data.match_groceries import address_numbers, haversine_distance
+
+
+def legacy_match_grocery_stores(stores1_df, stores2_df, max_dist=1000):
+    """
+    The original O(N*M) matcher, kept as the reference for match semantics.
+    """
+    stores1_df = stores1_df.copy()
+    stores2_df = stores2_df.copy()
+    stores1_df["match_id"] = None
+    stores2_df["match_id"] = None
+    stores1_df["address_num"] = address_numbers(stores1_df["address"])
+    stores2_df["address_num"] = address_numbers(stores2_df["address"])
+    match_id = 1
+
+    for index1, store1 in stores1_df.iterrows():
+        for index2, store2 in stores2_df.iterrows():
+            if (
+                stores1_df.loc[index1, "match_id"] is None
+                and store1["address_num"] == store2["address_num"]
+            ):
+                dist = haversine_distance(
+                    float(store1["latitude"]),
+                    float(store1["longitude"]),
+                    float(store2["latitude"]),
+                    float(store2["longitude"]),
+                )
+                if dist * 5280 <= max_dist:
+                    stores1_df.loc[index1, "match_id"] = match_id
+                    stores2_df.loc[index2, "match_id"] = match_id
+                    match_id += 1
+
+    mask = stores2_df["match_id"].isnull()
+    stores2_df["match_id"] = np.where(mask, "missing", stores2_df["match_id"])
+    merged_df = pd.merge(stores1_df, stores2_df, how="left", on="match_id")
+    merged_df["is_snap"] = np.where(merged_df["match_id"].notna(), True, False)
+    merged_df = merged_df.drop(
+        [
+            "store_name_y",
+            "address_num_x",
+            "address_num_y",
+            "latitude_y",
+            "longitude_y",
+            "address_y",
+            "match_id",
+        ],
+        axis=1,
+    )
+    merged_df.rename(
+        {
+            "store_name_x": "store_name",
+            "address_x": "address",
+            "latitude_x": "latitude",
+            "longitude_x": "longitude",
+        },
+        axis=1,
+        inplace=True,
+    )
+    merged_df["address"] = merged_df["address"].str.title()
+
+    return merged_df
+
+
+def synthetic_stores(n_stores, n_snap, seed=0):
+    """
+    Creates a grocery and a SNAP data set spread over Illinois where roughly
+    half of the grocery stores have a SNAP counterpart a few hundred feet away.
+
+    Args:
+        n_stores (int): number of grocery stores
+        n_snap (int): number of SNAP retailers
+        seed (int): random seed
+
+    Returns:
+        (stores_df, snap_df) pandas DataFrames shaped like the cleaned data
+    """
+    rng = np.random.default_rng(seed)
+
+    def stores(n, prefix):
+        numbers = rng.integers(1, 5000, n)
+        return pd.DataFrame(
+            {
+                "store_name": [f"{prefix} {i}" for i in range(n)],
+                "latitude": rng.uniform(37.0, 42.5, n),
+                "longitude": rng.uniform(-91.5, -87.5, n),
+                "address": [f"{num} W Main St" for num in numbers],
+            }
+        )
+
+    stores_df = stores(n_stores, "Grocery")
+    snap_df = stores(n_snap, "Retailer")
+
+    # copy half of the grocery stores into the SNAP data with some jitter
+    n_copy = min(n_stores // 2, n_snap)
+    rows = rng.choice(n_snap, n_copy, replace=False)
+    snap_df.loc[rows, "address"] = stores_df["address"].to_numpy()[:n_copy]
+    snap_df.loc[rows, "latitude"] = stores_df["latitude"].to_numpy()[
+        :n_copy
+    ] + rng.normal(0, 0.001, n_copy)
+    snap_df.loc[rows, "longitude"] = stores_df["longitude"].to_numpy()[
+        :n_copy
+    ] + rng.normal(0, 0.001, n_copy)
+
+    return stores_df, snap_df
@@ -0,0 +1,95 @@
+"""
+Project: Analyzing food access and security in Chicago
+Team: food.get
+File Name: test_access.py
+
+Description:
+    Tests for the per-tract buffer coverage, checked against GeoPandas overlay.
+"""
+
+import geopandas as gpd
+import numpy as np
+import pytest
+from shapely.geometry import Point, box
+
+from food_get.analysis.access import covered_areas, covered_areas_by_radius
+from food_get.analysis.generate_metric import (
+    find_access_ratios,
+    find_intersections,
+    find_ratio,
+)
+from food_get.tests.tract_grid import (
+    grid_tracts,
+    half_mile_buffers,
+    random_buffers,
+    random_stores,
+    use_tracts,
+)
+
+
+def overlay_ratios(tracts, buffers):
+    tracts = tracts.copy()
+    difference = tracts.overlay(buffers, how="difference")
+    difference["difference_area"] = difference.area
+    tracts["tract_area"] = tracts.area
+    return find_ratio(difference, tracts)
+
+
+def test_covered_areas_match_overlay():
+    tracts = grid_tracts()
+    # most tracts overlap several buffers, the last one none
+    buffers = random_buffers(30, extent=3000.0)
+
+    covered = covered_areas(tracts, buffers)
+
+    expected = overlay_ratios(tracts, buffers)
+    np.testing.assert_allclose(covered / tracts.area, expected["ratio"], atol=1e-12)
+    assert covered[-1] == 0
+    assert isinstance(covered, np.ndarray)
+
+
+def test_covered_areas_counts_overlaps_once():
+    tract = gpd.GeoSeries([box(-10, -10, 10, 10)])
+    buffers = gpd.GeoSeries([Point(0, 0).buffer(1)] * 3)
+
+    covered = covered_areas(tract, buffers)
+
+    assert covered[0] == pytest.approx(Point(0, 0).buffer(1).area)
+
+
+def test_find_intersections_matches_overlay(monkeypatch):
+    tracts = use_tracts(monkeypatch, grid_tracts())
+    buffers = random_buffers(40, seed=1)
+
+    metric = find_intersections(buffers)
+
+    expected = overlay_ratios(tracts.to_crs(4326).to_crs(3174), buffers)
+    assert metric["tract_id"].tolist() == tracts["GEOID_TRACT_20"].tolist()
+    np.testing.assert_allclose(metric["ratio"], expected["ratio"], atol=1e-9)
+
+
+def test_covered_areas_by_radius_match_each_radius():
+    tracts = grid_tracts(size=6)
+    stores = random_stores(12, seed=2, extent=3000.0)
+    radii = [1500.0, 200.0, 600.0, 10000.0]
+
+    areas = covered_areas_by_radius(tracts, stores, radii)
+
+    for column, radius in enumerate(radii):
+        expected = covered_areas(tracts, stores.buffer(radius))
+        np.testing.assert_allclose(areas[:, column], expected, rtol=1e-12)
+    # every tract is covered at the largest radius
+    np.testing.assert_allclose(areas[:, 3], tracts.area, rtol=1e-12)
+
+
+def test_find_access_ratios(monkeypatch):
+    use_tracts(monkeypatch, grid_tracts())
+    stores = random_stores(15, seed=3)
+
+    ratios = find_access_ratios(stores, radii=[0.5, 1, 10])
+
+    assert list(ratios.columns) == ["tract_id", "ratio_half", "ratio_1", "ratio_10"]
+    half_mile = find_intersections(half_mile_buffers(stores))
+    np.testing.assert_allclose(ratios["ratio_half"], half_mile["ratio"], atol=1e-12)
+    assert (ratios["ratio_half"] <= ratios["ratio_1"]).all()
+    assert (ratios["ratio_10"] == 1).all()
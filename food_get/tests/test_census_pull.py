@@ -10,9 +10,25 @@ Notes:
 Description:
     This file scrapes the US Census 2022 5-Year Estimate Data Profiles tables.
 """
+
+import json
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
 import pytest
+import requests
 
+from food_get.data import extract_census
 from food_get.data.extract_census import (
+    CHICAGO_MSA_COUNTIES,
+    TRACT_METRICS,
+    bulk_tract_metrics,
+    census_json_to_df,
+    census_tract_metrics,
+    margin_variables,
+    plan_variable_chunks,
+    tract_variables_extract,
     get_fips_code,
     get_county_code,
     state_income,
@@ -111,3 +127,182 @@ def test_one_variable():
     assert len(api_response_df) == 1332
     one_tract = api_response_df[api_response_df["tract"] == "010100"]
     assert one_tract["DP05_0001E"].iloc[0] == "4284"
+
+
+def fake_census_get(delay=0.0):
+    """
+    Stand-in for cached_get answering a tract request for the requested county
+    with one tract, after an optional delay.
+    """
+
+    def get(link, **kwargs):
+        time.sleep(delay)
+        query = parse_qs(urlsplit(link).query)
+        variables = query["get"][0].split(",")
+        geography = dict(part.split(":") for part in query["in"])
+        rows = [variables + ["state", "county", "tract"]]
+        rows.append(
+            [str(i + 1) for i in range(len(variables))]
+            + [geography["state"], geography.get("county", "001"), "010100"]
+        )
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps(rows).encode()
+        return response
+
+    return get
+
+
+def test_bulk_tract_metrics_runs_concurrently(monkeypatch):
+    monkeypatch.setattr(extract_census, "cached_get", fake_census_get(delay=0.3))
+    start = time.perf_counter()
+    df = bulk_tract_metrics(
+        CHICAGO_MSA_COUNTIES, max_workers=14, requests_per_second=None
+    )
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 1.5
+    assert len(df) == 14
+    assert list(df["state"].unique()) == ["17", "18", "55"]
+    assert df["total_population"].dtype.kind == "i"
+    assert df["poverty_rate"].eq(5).all()
+
+
+def test_census_tract_metrics_typed(monkeypatch):
+    monkeypatch.setattr(extract_census, "cached_get", fake_census_get())
+    df = census_tract_metrics()
+    assert list(df.columns) == list(TRACT_METRICS.values()) + [
+        "state",
+        "county",
+        "tract",
+        "GEOID",
+    ]
+    assert df["total_population"].dtype.kind == "i"
+    assert df["GEOID"].tolist() == ["17031010100"]
+
+
+def test_bulk_tract_metrics_accepts_names(monkeypatch):
+    monkeypatch.setattr(extract_census, "cached_get", fake_census_get())
+    df = bulk_tract_metrics([("Illinois", "Cook"), ("Indiana", None)])
+    assert list(zip(df["state"], df["county"])) == [("17", "031"), ("18", "001")]
+
+
+def test_plan_variable_chunks():
+    variables = ["DP02_{:04d}E".format(i) for i in range(120)]
+    chunks = plan_variable_chunks(variables + variables[:10])
+    assert [len(chunk) for chunk in chunks] == [50, 50, 20]
+    assert sum(chunks, []) == variables
+
+
+def test_margin_variables():
+    variables = [
+        "NAME",
+        "DP05_0001E",
+        "DP03_0119PE",
+        "B19013_001E",
+        "S1701_C01_001E",
+        "S0101_C02_030PE",
+        "GEO_ID",
+    ]
+    assert margin_variables(variables) == [
+        "NAME",
+        "DP05_0001E",
+        "DP05_0001M",
+        "DP03_0119PE",
+        "DP03_0119PM",
+        "B19013_001E",
+        "B19013_001M",
+        "S1701_C01_001E",
+        "S1701_C01_001M",
+        "S0101_C02_030PE",
+        "S0101_C02_030PM",
+        "GEO_ID",
+    ]
+
+
+def test_tract_variables_extract_chunks_and_joins(monkeypatch):
+    requested = []
+    fake_get = fake_census_get()
+
+    def get(link, **kwargs):
+        requested.append(link)
+        return fake_get(link, **kwargs)
+
+    monkeypatch.setattr(extract_census, "cached_get", get)
+    variables = ["DP02_{:04d}E".format(i) for i in range(60)]
+    df = tract_variables_extract(
+        variables, state_fips_code="17", county_code="031", margins=True
+    )
+
+    assert len(requested) == 3
+    assert len(df) == 1
+    assert list(df.columns) == margin_variables(variables) + [
+        "state",
+        "county",
+        "tract",
+        "GEOID",
+    ]
+    # the fake numbers each chunk's variables from 1
+    assert df["DP02_0000E"].iloc[0] == 1
+    assert df["DP02_0025E"].iloc[0] == 1
+    assert df["GEOID"].iloc[0] == "17031010100"
+
+
+def test_bulk_tract_metrics_chunks_variables(monkeypatch):
+    monkeypatch.setattr(extract_census, "cached_get", fake_census_get())
+    variables = ["DP02_{:04d}E".format(i) for i in range(75)]
+    df = bulk_tract_metrics(CHICAGO_MSA_COUNTIES[:3], variables=variables)
+    assert df.shape == (3, 79)
+    assert df["DP02_0050E"].eq(1).all()
+
+
+def json_response(rows):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = json.dumps(rows).encode()
+    return response
+
+
+def test_census_json_to_df_types_and_sentinels():
+    response = json_response(
+        [
+            [
+                "NAME",
+                "DP05_0001E",
+                "DP03_0062E",
+                "DP03_0119PE",
+                "state",
+                "county",
+                "tract",
+            ],
+            ["Tract 1", "4284", "68196", "12.5", "17", "031", "010100"],
+            ["Tract 2", "0", "-666666666", None, "17", "031", "010201"],
+            ["Tract 3", "8210", "61071", "-888888888", "17", "031", "843900"],
+        ]
+    )
+    df = census_json_to_df(response)
+
+    assert str(df["DP05_0001E"].dtype) == "Int64"
+    assert str(df["DP03_0119PE"].dtype) == "Float64"
+    assert df["DP03_0062E"].isna().tolist() == [False, True, False]
+    assert df["DP03_0119PE"].isna().tolist() == [False, True, True]
+    assert df["NAME"].tolist() == ["Tract 1", "Tract 2", "Tract 3"]
+    assert df["county"].tolist() == ["031"] * 3
+    assert df["GEOID"].tolist() == ["17031010100", "17031010201", "17031843900"]
+
+
+def test_census_json_to_df_matches_json_to_df():
+    rows = [["DP05_0001E", "state", "county", "tract"]]
+    rows += [[str(i * 7), "17", "031", "{:06d}".format(i)] for i in range(100)]
+    response = json_response(rows)
+
+    typed = census_json_to_df(response, geoid=False)
+    untyped = json_to_df(response)
+    untyped["DP05_0001E"] = pd.to_numeric(untyped["DP05_0001E"]).astype("Int64")
+    pd.testing.assert_frame_equal(typed, untyped)
+
+
+def test_census_json_to_df_no_rows():
+    df = census_json_to_df(json_response([["DP05_0001E", "state", "county", "tract"]]))
+    assert len(df) == 0
+    assert list(df.columns) == ["DP05_0001E", "state", "county", "tract", "GEOID"]
@@ -0,0 +1,35 @@
+"""
+Project: Analyzing food access and security in Chicago
+Team: food.get
+File Name: test_cleanup_grocery.py
+
+Description:
+    Tests for cleaning the grocery store data.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from food_get.data.cleanup_grocery import parse_point_locations
+
+
+def test_parse_point_locations():
+    locations = pd.Series(
+        ["POINT (-87.626243 41.736172)", "POINT (-87.71437 41.854608)"]
+    )
+    longitude, latitude = parse_point_locations(locations)
+    assert longitude.dtype == np.float64
+    np.testing.assert_array_equal(longitude, [-87.626243, -87.71437])
+    np.testing.assert_array_equal(latitude, [41.736172, 41.854608])
+
+
+def test_parse_point_locations_reports_bad_rows():
+    locations = pd.Series(
+        ["POINT (-87.6 41.7)", None, "POINT (-87.6", "LINESTRING (0 0, 1 1)"],
+        index=[10, 11, 12, 13],
+    )
+    with pytest.warns(UserWarning, match=r"1 location\(s\) missing and 2 not"):
+        longitude, latitude = parse_point_locations(locations)
+    assert longitude[0] == -87.6
+    assert np.isnan(latitude[1:]).all()
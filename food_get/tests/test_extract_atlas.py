@@ -0,0 +1,50 @@
+"""
+Project: Analyzing food access and security in Chicago
+Team: food.get
+File Name: test_extract_atlas.py
+
+Description:
+    Tests for reading and combining the historical Food Atlas data.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from food_get.data.extract_atlas import (
+    assemble_atlas_years,
+    read_atlas_year,
+    region_mask,
+)
+
+
+def test_region_mask():
+    tracts = np.array([1001020100, 17031010100, 17043840000, 18089010100])
+    assert list(region_mask(tracts, ["17"])) == [False, True, True, False]
+    assert list(region_mask(tracts, ["17031", "01"])) == [True, True, False, False]
+    assert region_mask(tracts, None).all()
+    with pytest.raises(ValueError):
+        region_mask(tracts, ["1"])
+
+
+def test_read_atlas_year_projects_and_filters():
+    cook = read_atlas_year("2015", variables=["lapophalf"], region=["17031"])
+    assert list(cook.columns) == ["CensusTract", "lapophalf"]
+    assert len(cook) == 1318
+    assert (cook["CensusTract"] // 10**6 == 17031).all()
+
+
+def test_assemble_matches_sequential_merges():
+    years = ["2019", "2010", "2015"]
+    expected = None
+    for year in years:
+        atlas = read_atlas_year(year, region=["17031"]).add_suffix(f"_{year}")
+        atlas = atlas.rename(columns={f"CensusTract_{year}": "CensusTract"})
+        expected = (
+            atlas
+            if expected is None
+            else expected.merge(atlas, on="CensusTract", how="outer")
+        )
+
+    assembled = assemble_atlas_years(years, region=["17031"], max_workers=2)
+    pd.testing.assert_frame_equal(assembled, expected)
@@ -0,0 +1,332 @@
+"""
+Project: Analyzing food access and security in Chicago
+Team: food.get
+File Name: test_extract_grocery.py
+
+Description:
+    Tests for the SNAP retailer download and refresh, run against a local
+    stand-in for the USDA ArcGIS FeatureServer.
+"""
+
+import json
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+import pytest
+import requests
+
+from food_get.data import extract_grocery, ingest, loader
+from food_get.data.cleanup_grocery import clean_grocery_stores
+from food_get.data.extract_grocery import (
+    SNAP_FIELDS,
+    download_snap_retailers,
+    import_grocery_store_data,
+    read_grocery_snapshot,
+    read_grocery_store,
+    refresh_grocery_stores,
+    refresh_snap_retailers,
+)
+from food_get.tests.local_server import JSONHandler, serve
+
+# 2024-02-19 12:00:00 UTC in epoch milliseconds
+EDIT_DATE = 1708344000000
+
+
+def make_retailers():
+    return [
+        {
+            "ObjectId": object_id,
+            "Store_Name": "Store {}".format(object_id),
+            "Store_Street_Address": "{} W Madison St".format(object_id),
+            "City": "CHICAGO" if object_id % 4 else "EVANSTON",
+            "Latitude": 41.88 + object_id / 1000,
+            "Longitude": -87.63,
+            "Store_Type": "Grocery Store",
+            "EditDate": EDIT_DATE,
+        }
+        for object_id in range(3, 120, 3)
+    ]
+
+
+@pytest.fixture
+def feature_server():
+    state = {
+        "retailers": make_retailers(),
+        "edit_tracking": False,
+        "queries": [],
+        "in_flight": 0,
+        "max_in_flight": 0,
+        "fail_after": None,
+    }
+    lock = threading.Lock()
+
+    class Handler(JSONHandler):
+        def do_GET(self):
+            info = {"name": "snap", "maxRecordCount": 5}
+            if state["edit_tracking"]:
+                info["editFieldsInfo"] = {"editDateField": "EditDate"}
+            self.reply(info)
+
+        def matching(self, where):
+            retailers = [r for r in state["retailers"] if r["City"] == "CHICAGO"]
+            edited = re.search(r"EditDate > TIMESTAMP '(.+)'", where)
+            if edited:
+                since = pd.Timestamp(edited.group(1)).value // 10**6
+                retailers = [r for r in retailers if r["EditDate"] > since]
+            return retailers
+
+        def do_POST(self):
+            length = int(self.headers["Content-Length"])
+            query = {
+                key: values[0]
+                for key, values in parse_qs(self.rfile.read(length).decode()).items()
+            }
+            if query.get("returnIdsOnly") == "true":
+                ids = [r["ObjectId"] for r in self.matching(query["where"])]
+                self.reply({"objectIdFieldName": "ObjectId", "objectIds": ids[::-1]})
+                return
+            if "outStatistics" in query:
+                last_edit = max(r["EditDate"] for r in self.matching(query["where"]))
+                self.reply({"features": [{"attributes": {"last_edit": last_edit}}]})
+                return
+
+            with lock:
+                state["queries"].append(query)
+                failing = (
+                    state["fail_after"] is not None
+                    and len(state["queries"]) > state["fail_after"]
+                )
+                state["in_flight"] += 1
+                state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+            time.sleep(0.05)
+            with lock:
+                state["in_flight"] -= 1
+            if failing:
+                self.reply({"error": "unavailable"}, status=503)
+                return
+
+            ids = {int(oid) for oid in query["objectIds"].split(",")}
+            fields = query["outFields"].split(",")
+            features = [
+                {"attributes": {field: r[field] for field in fields}}
+                for r in state["retailers"]
+                if r["ObjectId"] in ids
+            ]
+            self.reply({"features": features[::-1]})
+
+    with serve(Handler) as url:
+        yield url + "/FeatureServer/0", state
+
+
+def expected_retailers(state):
+    chicago = [r for r in state["retailers"] if r["City"] == "CHICAGO"]
+    return pd.DataFrame(chicago)[SNAP_FIELDS]
+
+
+def test_download_snap_retailers(feature_server, tmp_path):
+    layer_url, state = feature_server
+    output = tmp_path / "snap.csv"
+
+    written = download_snap_retailers(output, layer_url=layer_url, max_workers=3)
+
+    expected = expected_retailers(state)
+    assert written == len(expected)
+    pd.testing.assert_frame_equal(pd.read_csv(output), expected)
+    # pages of maxRecordCount, only the requested fields, bounded concurrency
+    assert len(state["queries"]) == -(-len(expected) // 5)
+    assert {query["outFields"] for query in state["queries"]} == {",".join(SNAP_FIELDS)}
+    assert 1 < state["max_in_flight"] <= 3
+    assert not (tmp_path / "snap.csv.checkpoint.json").exists()
+
+
+def test_download_snap_retailers_resumes(feature_server, tmp_path):
+    layer_url, state = feature_server
+    output = tmp_path / "snap.csv"
+
+    state["fail_after"] = 3
+    with pytest.raises(requests.HTTPError):
+        download_snap_retailers(output, layer_url=layer_url, max_workers=1)
+    checkpoint = json.loads((tmp_path / "snap.csv.checkpoint.json").read_text())
+    assert checkpoint["rows"] == 15
+
+    state["fail_after"] = None
+    state["queries"].clear()
+    written = download_snap_retailers(output, layer_url=layer_url, max_workers=2)
+
+    expected = expected_retailers(state)
+    assert written == len(expected)
+    assert len(state["queries"]) == -(-(len(expected) - 15) // 5)
+    pd.testing.assert_frame_equal(pd.read_csv(output), expected)
+
+
+def test_refresh_snap_retailers(feature_server, tmp_path):
+    layer_url, state = feature_server
+    state["edit_tracking"] = True
+    output = tmp_path / "snap.csv"
+    download_snap_retailers(output, layer_url=layer_url)
+
+    # one retailer closes, one opens and one moves
+    retailers = state["retailers"]
+    retailers[:] = [r for r in retailers if r["ObjectId"] != 9]
+    retailers.append(dict(retailers[0], ObjectId=301, Store_Name="New Store"))
+    moved = next(r for r in retailers if r["ObjectId"] == 30)
+    moved.update(Store_Street_Address="1 N State St", EditDate=EDIT_DATE + 60000)
+    retailers[-1]["EditDate"] = EDIT_DATE + 60000
+    state["queries"].clear()
+
+    counts = refresh_snap_retailers(output, layer_url=layer_url)
+
+    assert counts == {"added": 1, "changed": 1, "removed": 1, "full": False}
+    # only the new and the edited retailer were fetched
+    assert [query["objectIds"] for query in state["queries"]] == ["30,301"]
+    pd.testing.assert_frame_equal(
+        pd.read_csv(output),
+        expected_retailers(state).sort_values("ObjectId", ignore_index=True),
+    )
+
+
+def test_refresh_snap_retailers_without_state(feature_server, tmp_path):
+    layer_url, state = feature_server
+    output = tmp_path / "snap.csv"
+    snapshot = expected_retailers(state).iloc[2:]
+    snapshot.assign(Extra="kept out").to_csv(output, index=False)
+
+    counts = refresh_snap_retailers(output, layer_url=layer_url)
+
+    assert counts == {"added": 2, "changed": 0, "removed": 0, "full": False}
+    pd.testing.assert_frame_equal(pd.read_csv(output), expected_retailers(state))
+
+
+@pytest.fixture
+def grocery_portal():
+    state = {"rows": [], "requests": []}
+
+    class Handler(JSONHandler):
+        def do_GET(self):
+            query = {
+                key: values[0]
+                for key, values in parse_qs(urlsplit(self.path).query).items()
+            }
+            state["requests"].append(query)
+            rows = sorted(
+                state["rows"], key=lambda row: (row["last_updated"], row[":id"])
+            )
+            since = re.search(r"last_updated >= '(.+)'", query.get("$where", ""))
+            if since:
+                rows = [row for row in rows if row["last_updated"] >= since.group(1)]
+            offset, limit = int(query["$offset"]), int(query["$limit"])
+            fields = query["$select"].split(",")
+            page = [
+                {field: row[field] for field in fields if field in row}
+                for row in rows[offset : offset + limit]
+            ]
+            self.reply(page)
+
+    with serve(Handler) as url:
+        yield url + "/resource/grocery.json", state
+
+
+def portal_row(row_id, name, address, status, updated):
+    return {
+        ":id": row_id,
+        "store_name": name,
+        "address": address,
+        "zip": "60620",
+        "new_status": status,
+        "last_updated": updated,
+        "location": {"type": "Point", "coordinates": [-87.6 - row_id / 100, 41.7]},
+    }
+
+
+def test_refresh_grocery_stores(grocery_portal, tmp_path):
+    url, state = grocery_portal
+    state["rows"] = [
+        portal_row(
+            i,
+            "Store {}".format(i),
+            "{} W 87th St".format(i),
+            "OPEN",
+            "2024-02-20T08:00:00.000",
+        )
+        for i in range(7)
+    ]
+    # older than the csv snapshot the first refresh starts from
+    state["rows"].append(
+        portal_row(20, "Old", "1 N State St", "OPEN", "2020-01-01T00:00:00.000")
+    )
+    path = tmp_path / "stores.csv"
+
+    counts = refresh_grocery_stores(path, url=url, page_size=3)
+    stores = read_grocery_store(path)
+    assert len(state["requests"]) == 3
+    assert counts == {"fetched": 7, "inserted": 7, "updated": 0}
+    assert len(stores) == len(read_grocery_snapshot()) + 7
+    assert stores["Location"].iloc[-1] == "POINT (-87.66 41.7)"
+
+    # one store closes and one opens, listed twice; only rows at or after the
+    # high-water mark are requested
+    state["rows"][3] = portal_row(
+        3, "store 3", "3 w 87th  st", "CLOSED", "2024-03-01T09:30:00.000"
+    )
+    state["rows"].append(
+        portal_row(8, "Store 8", "8 W 87th St", "OPEN", "2024-03-02T10:00:00.000")
+    )
+    state["rows"].append(
+        portal_row(9, "STORE 8", "8 W 87th St", "OPEN", "2024-03-02T11:00:00.000")
+    )
+    state["requests"].clear()
+
+    counts = refresh_grocery_stores(path, url=url, page_size=3)
+    stores = read_grocery_store(path)
+    assert state["requests"][0]["$where"] == (
+        "last_updated >= '2024-02-20T08:00:00.000'"
+    )
+    # the unchanged stores at the high-water mark are fetched again but not
+    # counted as updated
+    assert counts == {"fetched": 9, "inserted": 1, "updated": 1}
+    assert len(stores) == len(read_grocery_snapshot()) + 8
+    store_3 = stores[stores["Store Name"].str.lower() == "store 3"]
+    assert store_3["New status"].tolist() == ["CLOSED"]
+    assert stores["Store Name"].iloc[-1] == "STORE 8"
+
+    counts = refresh_grocery_stores(path, url=url, page_size=3)
+    assert counts == {"fetched": 1, "inserted": 0, "updated": 0}
+    pd.testing.assert_frame_equal(read_grocery_store(path), stores)
+
+
+def test_refreshed_grocery_stores_reach_the_metric(
+    grocery_portal, tmp_path, monkeypatch
+):
+    url, state = grocery_portal
+    state["rows"] = [
+        portal_row(1, "Fresh Market", "1 W 87th St", "OPEN", "2024-02-20T08:00:00.000")
+    ]
+    path = tmp_path / "grocery_store_feed.parquet"
+    monkeypatch.setattr(ingest, "refreshed_table_path", lambda source: path)
+    monkeypatch.setattr(extract_grocery, "refreshed_table_path", lambda source: path)
+    snapshot_stores = clean_grocery_stores()
+
+    refresh_grocery_stores(url=url)
+    loader.clear_cache()
+    stores = clean_grocery_stores()
+
+    assert len(stores) == len(snapshot_stores) + 1
+    assert stores["store_name"].iloc[-1] == "Fresh Market"
+    assert stores["longitude"].iloc[-1] == pytest.approx(-87.61)
+    assert ingest.read_source("grocery")["New status"].dtype == "category"
+
+
+def test_import_grocery_store_data_layout(grocery_portal, tmp_path, monkeypatch):
+    url, _ = grocery_portal
+    path = tmp_path / "grocery_store_feed.csv"
+    monkeypatch.setattr(extract_grocery, "refreshed_table_path", lambda source: path)
+
+    snapshot = import_grocery_store_data()
+    refresh_grocery_stores(url=url)
+    table = import_grocery_store_data()
+
+    pd.testing.assert_series_equal(snapshot.dtypes, table.dtypes)
+    assert snapshot["Last updated"].dtype == "datetime64[ns]"
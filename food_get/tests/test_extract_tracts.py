@@ -0,0 +1,206 @@
+"""
+Project: Analyzing food access and security in Chicago
+Team: food.get
+File Name: test_extract_tracts.py
+
+Description:
+    Tests for the partitioned 2020 / 2010 tract relationship index, built from
+    a small stand-in for the national relationship file, and for clipping
+    tracts to the shoreline.
+"""
+
+import json
+from collections import OrderedDict
+
+import geopandas as gpd
+import pandas as pd
+import pytest
+import requests
+
+from food_get.data import extract_tracts
+from food_get.data.extract_tracts import (
+    census_tracts_2020_2010_relationships,
+    clip_to_shore,
+    extract_chi_census_tracts_2010,
+    load_shoreline,
+    tract_relationships,
+)
+
+COLUMNS = [
+    "OID_TRACT_20",
+    "GEOID_TRACT_20",
+    "NAMELSAD_TRACT_20",
+    "AREALAND_TRACT_20",
+    "AREAWATER_TRACT_20",
+    "MTFCC_TRACT_20",
+    "FUNCSTAT_TRACT_20",
+    "OID_TRACT_10",
+    "GEOID_TRACT_10",
+    "NAMELSAD_TRACT_10",
+    "AREALAND_TRACT_10",
+    "AREAWATER_TRACT_10",
+    "MTFCC_TRACT_10",
+    "FUNCSTAT_TRACT_10",
+    "AREALAND_PART",
+    "AREAWATER_PART",
+]
+
+# (2020 tract, 2010 tract, land of 2020 tract, land of 2010 tract, land part)
+PAIRS = [
+    ("17031010100", "17031010100", 1000, 1000, 1000),
+    ("17031010201", "17031010200", 600, 1500, 600),
+    ("17031010202", "17031010200", 900, 1500, 900),
+    ("17031010300", "17031010300", 800, 700, 700),
+    ("17031010300", "17031010400", 800, 900, 100),
+    ("17043840000", "17043840000", 5000, 5000, 5000),
+    ("02063000100", "02261000100", 4000, 9000, 4000),
+]
+
+
+@pytest.fixture
+def relationship_file(monkeypatch, tmp_path):
+    rows = ["|".join(COLUMNS)]
+    for geoid20, geoid10, land20, land10, part in PAIRS:
+        values = dict.fromkeys(COLUMNS, "")
+        values.update(
+            GEOID_TRACT_20=geoid20,
+            GEOID_TRACT_10=geoid10,
+            AREALAND_TRACT_20=land20,
+            AREAWATER_TRACT_20=0,
+            AREALAND_TRACT_10=land10,
+            AREAWATER_TRACT_10=0,
+            AREALAND_PART=part,
+            AREAWATER_PART=0,
+        )
+        rows.append("|".join(str(values[column]) for column in COLUMNS))
+    downloads = []
+
+    def fake_get(url, **kwargs):
+        downloads.append(url)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = "\n".join(rows).encode()
+        return response
+
+    monkeypatch.setattr(extract_tracts, "cached_get", fake_get)
+    monkeypatch.setattr(extract_tracts, "RELATIONSHIP_INDEX", tmp_path / "index")
+    return tmp_path / "index", downloads
+
+
+def test_tract_relationships_reads_only_requested_counties(relationship_file):
+    index_dir, downloads = relationship_file
+    relationships = tract_relationships(
+        ["17031010300", "17031010201"], index_dir=index_dir
+    )
+    assert sorted(relationships["GEOID_TRACT_10"]) == [
+        "17031010200",
+        "17031010300",
+        "17031010400",
+    ]
+    assert relationships["land_share_20"].sum() == pytest.approx(2)
+    assert (index_dir / "state=17" / "county=031").is_dir()
+
+    # the index is built once
+    tract_relationships(["17043840000"], index_dir=index_dir)
+    assert len(downloads) == 1
+
+
+def test_tract_relationships_by_2010_geoid(relationship_file):
+    index_dir, _ = relationship_file
+    relationships = tract_relationships(
+        ["02261000100", "17031010200"], column="GEOID_TRACT_10", index_dir=index_dir
+    )
+    assert sorted(relationships["GEOID_TRACT_20"]) == [
+        "02063000100",
+        "17031010201",
+        "17031010202",
+    ]
+    assert relationships["land_share_10"].sum() == pytest.approx(4000 / 9000 + 1)
+
+
+def test_tract_relationships_rebuilds_incomplete_index(relationship_file):
+    index_dir, downloads = relationship_file
+    # a build that stopped before its marker was written
+    (index_dir / "state=17" / "county=031").mkdir(parents=True)
+
+    relationships = tract_relationships(["17031010100"], index_dir=index_dir)
+
+    assert relationships["GEOID_TRACT_10"].tolist() == ["17031010100"]
+    assert len(downloads) == 1
+    marker = json.loads((index_dir / "_index.json").read_text())
+    assert marker["rows"] == len(PAIRS)
+
+
+def test_chicago_relationships(relationship_file, monkeypatch):
+    chicago = pd.DataFrame(
+        {
+            "geoid20": ["17031010100", "17031010201", "17031010202", "17031010300"],
+            "community_name": "ROGERS PARK",
+        }
+    )
+    monkeypatch.setattr(
+        extract_tracts, "extract_chi_census_tracts_2020", lambda: chicago
+    )
+
+    relationships = census_tracts_2020_2010_relationships()
+    # the default index location is resolved when called
+    assert (relationship_file[0] / "_index.json").exists()
+    assert list(relationships.columns) == [
+        "GEOID_TRACT_20",
+        "GEOID_TRACT_10",
+        "relation",
+    ]
+    assert relationships["relation"].tolist() == ["one", "one", "one", "many", "many"]
+
+    overlap = census_tracts_2020_2010_relationships(overlap=True)
+    assert overlap["land_share_10"].round(3).tolist() == [1, 0.4, 0.6, 1, 0.111]
+
+
+def test_clip_to_shore_matches_overlay(monkeypatch):
+    monkeypatch.setattr(extract_tracts, "_CLIP_CACHE", OrderedDict())
+    tracts = gpd.GeoDataFrame(extract_chi_census_tracts_2010())
+    lake = load_shoreline()
+
+    clipped = clip_to_shore(tracts, lake)
+
+    expected = tracts.overlay(lake, how="difference")
+    pd.testing.assert_frame_equal(
+        pd.DataFrame(clipped.drop(columns="geometry")),
+        pd.DataFrame(expected.drop(columns="geometry")),
+    )
+    assert clipped.geometry.geom_equals_exact(expected.geometry, 0).all()
+    assert clipped.crs == tracts.crs
+    # only the tracts along the lake were clipped
+    changed = ~clipped.geometry.geom_equals_exact(tracts.geometry, 0)
+    assert 0 < changed.sum() < len(tracts) / 4
+
+
+def test_clip_to_shore_reuses_clipped_tracts(monkeypatch):
+    monkeypatch.setattr(extract_tracts, "_CLIP_CACHE", OrderedDict())
+    tracts = gpd.GeoDataFrame(extract_chi_census_tracts_2010())
+    lake = load_shoreline()
+    clip_to_shore(tracts.iloc[:100], lake)
+    cached = len(extract_tracts._CLIP_CACHE)
+
+    first = clip_to_shore(tracts.iloc[50:150], lake)
+    second = clip_to_shore(tracts.iloc[50:150], lake)
+
+    assert cached == 100
+    assert len(extract_tracts._CLIP_CACHE) == 150
+    assert first.geometry.geom_equals_exact(second.geometry, 0).all()
+
+
+def test_clip_to_shore_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(extract_tracts, "_CLIP_CACHE", OrderedDict())
+    monkeypatch.setattr(extract_tracts, "CLIP_CACHE_SIZE", 60)
+    tracts = gpd.GeoDataFrame(extract_chi_census_tracts_2010()).iloc[:150]
+    lake = load_shoreline()
+    expected = tracts.overlay(lake, how="difference")
+
+    clipped = clip_to_shore(tracts, lake)
+    again = clip_to_shore(tracts.iloc[100:], lake)
+
+    assert len(extract_tracts._CLIP_CACHE) == 60
+    assert clipped.geometry.geom_equals_exact(expected.geometry, 0).all()
+    later = clipped.geometry.iloc[100:].reset_index(drop=True)
+    assert again.geometry.geom_equals_exact(later, 0).all()
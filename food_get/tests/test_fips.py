@@ -0,0 +1,83 @@
+"""
+Project: Analyzing food access and security in Chicago
+Team: food.get
+File Name: test_fips.py
+
+Description:
+    Tests for the FIPS lookup index and the census helpers that resolve state
+    and county codes through it.
+"""
+
+import pandas as pd
+import pytest
+
+from food_get.data import fips
+from food_get.data.extract_census import get_county_code, get_fips_code
+from food_get.data.loader import IMPORT_DATA
+
+
+@pytest.mark.parametrize("state", ["Illinois", "illinois", "IL", "17", 17])
+def test_state_code(state):
+    assert fips.state_code(state) == "17"
+
+
+def test_state_code_unknown():
+    assert fips.state_code("Narnia") is None
+    assert fips.state_name("17") == "Illinois"
+
+
+@pytest.mark.parametrize(
+    "county,state,code",
+    [
+        ("Cook", "IL", "031"),
+        ("cook county", "Illinois", "031"),
+        ("DuPage County", "17", "043"),
+        ("Orleans", "Louisiana", "071"),
+        ("Orleans Parish", "LA", "071"),
+        ("Juneau", "AK", "110"),
+        ("Kings", "NY", "047"),
+        ("Brooklyn Borough", "NY", "047"),
+        ("Baltimore", "MD", "005"),
+        ("Baltimore city", "MD", "510"),
+        ("Lake", "IN", "089"),
+        ("031", "IL", "031"),
+    ],
+)
+def test_county_code(county, state, code):
+    assert fips.county_code(county, state) == code
+
+
+def test_county_code_unknown():
+    assert fips.county_code("Cook", "Indiana") is None
+    assert fips.county_code("999", "IL") is None
+    assert fips.county_code("Cook", "Narnia") is None
+
+
+def test_county_name_uses_official_name():
+    assert fips.county_name("031", "17") == "Cook County"
+    assert fips.county_name("158", "02") == "Kusilvak Census Area"
+
+
+def test_county_codes_batch():
+    counties = pd.Series(
+        ["Cook", "Lake", "Lake", "Narnia", "Milwaukee"], index=[5, 4, 3, 2, 1]
+    )
+    codes = fips.county_codes(counties, ["IL", "IL", "Indiana", "IL", "WI"])
+    assert codes.index.tolist() == [5, 4, 3, 2, 1]
+    assert codes.tolist() == ["031", "097", "089", None, "079"]
+
+
+def test_county_codes_match_illinois_counties():
+    counties = pd.read_csv(IMPORT_DATA / fips.FIPS_FILE, dtype=str)
+    illinois = counties[(counties["STATE"] == "IL") & (counties["OFFICIAL"] == "1")]
+    codes = fips.county_codes(illinois["COUNTYNAME"], "Illinois")
+    assert len(illinois) == 102
+    assert codes.tolist() == illinois["COUNTYFP"].tolist()
+
+
+def test_census_lookups_outside_illinois():
+    assert get_fips_code("WI") == "55"
+    assert get_county_code("Lake", state="Indiana") == "089"
+    with pytest.raises(KeyError) as info:
+        get_county_code("Cook", state="Indiana")
+    assert "You have not entered a correct Indiana county name" in str(info.value)
@@ -0,0 +1,74 @@
+"""
+Project: Analyzing food access and security in Chicago
+Team: food.get
+File Name: test_generate_metric.py
+
+Description:
+    Tests for generating the 2022 low-access and low-income metrics.
+"""
+
+import numpy as np
+import pandas as pd
+
+from food_get.analysis.generate_metric import (
+    COUNTY_HH_INCOME,
+    find_ratio,
+    identify_low_access,
+    identify_low_income,
+)
+from food_get.data.labels import percentage_labels
+
+
+def test_percentage_labels_match_string_formatting():
+    rng = np.random.default_rng(0)
+    values = np.concatenate(
+        [
+            rng.random(20000),
+            np.arange(2001) / 2000,
+            [np.nan, 0.0, -0.0, -0.0004, 0.0025, 0.0005, 1.0005, np.inf],
+        ]
+    )
+    expected = [f"{value * 100:.1f}%" for value in values]
+    assert list(percentage_labels(pd.Series(values))) == expected
+
+
+def test_find_ratio():
+    tracts = pd.DataFrame(
+        {
+            "GEOID_TRACT_20": ["17031010100", "17031010201", "17031010202"],
+            "tract_area": [100.0, 200.0, 50.0],
+        }
+    )
+    # the second tract is split into two uncovered pieces, the third is fully
+    # covered
+    difference = pd.DataFrame(
+        {
+            "GEOID_TRACT_20": ["17031010201", "17031010100", "17031010201"],
+            "difference_area": [30.0, 25.0, 20.0],
+        }
+    )
+
+    ratios = find_ratio(difference, tracts)
+
+    assert ratios["tract_id"].tolist() == tracts["GEOID_TRACT_20"].tolist()
+    assert ratios["ratio"].tolist() == [0.75, 0.75, 1.0]
+
+
+def test_identify_low_access():
+    ratios = pd.DataFrame(
+        {"tract_id": ["1", "2", "3", "4"], "ratio": [0.2, 1 / 3, 0.98765, np.nan]}
+    )
+    labelled = identify_low_access(ratios)
+    assert list(labelled["low_access"]) == [1, 0, 0, 0]
+    assert list(labelled["2022_prop_label"]) == ["20.0%", "33.3%", "98.8%", "nan%"]
+
+
+def test_identify_low_income():
+    tracts = pd.DataFrame({"tract_id": ["17031010100", "17031010201", "99"]})
+    labelled = identify_low_income(tracts)
+    expected = [
+        1 if income <= 0.8 * COUNTY_HH_INCOME else 0
+        for income in labelled["median_hh_income"]
+    ]
+    assert list(labelled["low_income"]) == expected
+    assert labelled["low_income"].iloc[2] == 0
@@ -0,0 +1,76 @@
+"""
+Project: Analyzing food access and security in Chicago
+Team: food.get
+File Name: test_geometry_store.py
+
+Description:
+    Tests for the GeoParquet cache of the GeoJSON boundary files.
+"""
+
+import json
+
+import geopandas as gpd
+import pandas as pd
+import pytest
+from shapely.geometry import box
+
+from food_get.data import geometry_store, loader
+from food_get.data.geometry_store import geometry_cache_path, read_geometry
+
+
+@pytest.fixture
+def boundaries(tmp_path):
+    features = [
+        {
+            "type": "Feature",
+            "properties": {"name": "tract {}".format(i), "row": i, "extra": "x"},
+            "geometry": box(i, 0, i + 1, 1).__geo_interface__,
+        }
+        for i in range(10)
+    ]
+    path = tmp_path / "boundaries.geojson"
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": features}))
+    loader.clear_cache()
+    yield path
+    loader.clear_cache()
+
+
+def test_read_geometry_matches_geojson(boundaries):
+    expected = gpd.read_file(boundaries)
+
+    first = read_geometry(boundaries)
+    assert geometry_cache_path(boundaries).exists()
+    loader.clear_cache()
+    second = read_geometry(boundaries)
+
+    pd.testing.assert_frame_equal(first, expected)
+    pd.testing.assert_frame_equal(second, expected)
+    assert second.crs == expected.crs
+
+
+def test_read_geometry_filters(boundaries):
+    read_geometry(boundaries)
+    loader.clear_cache()
+
+    subset = read_geometry(boundaries, columns=["name"], bbox=(2.5, 0.2, 4.5, 0.8))
+
+    assert list(subset.columns) == ["name", "geometry"]
+    assert subset["name"].tolist() == ["tract 2", "tract 3", "tract 4"]
+
+
+def test_read_geometry_without_parquet(boundaries, monkeypatch):
+    monkeypatch.setattr(geometry_store, "parquet_available", lambda: False)
+
+    subset = read_geometry(boundaries, columns=["row"], bbox=(8.5, 0, 20, 1))
+
+    assert not geometry_cache_path(boundaries).exists()
+    assert subset["row"].tolist() == [8, 9]
+
+
+def test_read_geometry_refreshes_stale_cache(boundaries):
+    read_geometry(boundaries)
+    geo_df = gpd.read_file(boundaries).iloc[:3]
+    boundaries.write_text(geo_df.to_json())
+    loader.clear_cache()
+
+    assert read_geometry(boundaries)["row"].tolist() == [0, 1, 2]
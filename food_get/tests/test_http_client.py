@@ -0,0 +1,66 @@
+"""
+Project: Analyzing food access and security in Chicago
+Team: food.get
+File Name: test_http_client.py
+
+Description:
+    Tests for the shared HTTP client and its on-disk response cache, run
+    against a local server.
+"""
+
+import pytest
+
+from food_get.data.http_client import (
+    OfflineCacheMiss,
+    cache_entries,
+    cached_get,
+    normalize_url,
+    prune_cache,
+)
+from food_get.tests.local_server import JSONHandler, serve
+
+
+@pytest.fixture
+def server():
+    hits = []
+
+    class Handler(JSONHandler):
+        def do_GET(self):
+            hits.append(self.path)
+            self.reply([["NAME", "value"], ["x", str(len(hits))]])
+
+    with serve(Handler) as url:
+        yield url, hits
+
+
+def test_normalize_url():
+    assert normalize_url("HTTPS://Api.Census.gov/data?b=2&a=1") == normalize_url(
+        "https://api.census.gov/data?a=1", params={"b": 2}
+    )
+
+
+def test_responses_are_cached(server, tmp_path):
+    url, hits = server
+    first = cached_get(url + "/data?get=A,B&for=tract:*", cache_dir=tmp_path)
+    second = cached_get(url + "/data?for=tract:*&get=A,B", cache_dir=tmp_path)
+    assert len(hits) == 1
+    assert first.json() == second.json() == [["NAME", "value"], ["x", "1"]]
+
+    cached_get(url + "/data?get=A,B&for=tract:*", ttl=0, cache_dir=tmp_path)
+    assert len(hits) == 2
+
+
+def test_offline_mode_and_pruning(server, tmp_path, monkeypatch):
+    url, hits = server
+    cached_get(url + "/one", cache_dir=tmp_path)
+    cached_get(url + "/two", cache_dir=tmp_path)
+
+    monkeypatch.setenv("FOOD_GET_OFFLINE", "1")
+    assert cached_get(url + "/one", ttl=0, cache_dir=tmp_path).json()[1][1] == "1"
+    with pytest.raises(OfflineCacheMiss):
+        cached_get(url + "/three", cache_dir=tmp_path)
+    assert len(hits) == 2
+
+    assert len(cache_entries(tmp_path)) == 2
+    assert prune_cache(url_contains="/two", cache_dir=tmp_path) == 1
+    assert list(cache_entries(tmp_path)["url"]) == [url + "/one"]
@@ -0,0 +1,63 @@
+"""
+Project: Analyzing food access and security in Chicago
+Team: food.get
+File Name: test_loader.py
+
+Description:
+    Tests for lazily loading, typing and caching the raw data sets.
+"""
+
+import os
+
+import pandas as pd
+
+from food_get.data import loader
+from food_get.data.ingest import cache_path, parquet_available, read_typed_csv
+from food_get.data.loader import load_dataset
+
+
+def test_dataset_is_cached_until_file_changes(tmp_path, monkeypatch):
+    calls = []
+
+    def reader(path):
+        calls.append(path)
+        return {"content": path.read_text()}
+
+    data_file = tmp_path / "data.txt"
+    data_file.write_text("first")
+    monkeypatch.setattr(loader, "_CACHE", {})
+
+    assert load_dataset(data_file, reader=reader) == {"content": "first"}
+    assert load_dataset(data_file, reader=reader) == {"content": "first"}
+    assert len(calls) == 1
+
+    # touching the file without changing it keeps the cached copy
+    stat = data_file.stat()
+    os.utime(data_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    load_dataset(data_file, reader=reader)
+    assert len(calls) == 1
+
+    data_file.write_text("second")
+    assert load_dataset(data_file, reader=reader) == {"content": "second"}
+    assert len(calls) == 2
+
+
+def test_cached_frame_is_copied():
+    first = load_dataset("us_counties_fips.csv")
+    first["COUNTYNAME"] = None
+    assert load_dataset("us_counties_fips.csv")["COUNTYNAME"].notna().all()
+
+
+def test_typed_csv_cache(tmp_path):
+    csv_path = tmp_path / "stores.csv"
+    csv_path.write_text("name,lat,extra\nA,41.5,x\nB,41.6,y\n")
+    columns = {"name": "category", "lat": "float32"}
+
+    df = read_typed_csv(csv_path, columns)
+    assert list(df.columns) == ["name", "lat"]
+    assert df["lat"].dtype == "float32"
+    assert df["name"].dtype == "category"
+
+    if parquet_available():
+        assert cache_path(csv_path, columns).exists()
+        pd.testing.assert_frame_equal(read_typed_csv(csv_path, columns), df)
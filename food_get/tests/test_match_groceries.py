@@ -0,0 +1,216 @@
+"""
+Project: Analyzing food access and security in Chicago
+Team: food.get
+File Name: test_match_groceries.py
+
+Description:
+    Tests for matching Chicago grocery stores to SNAP retailers.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from food_get.data.distance import (
+    haversine,
+    haversine_matrix,
+    haversine_matrix_chunks,
+    haversine_one_to_many,
+    nearest_points,
+)
+from food_get.data.match_groceries import (
+    haversine_distance,
+    match_grocery_stores,
+    match_grocery_stores_incremental,
+    row_keys,
+    stable_store_ids,
+)
+from food_get.tests.reference_matcher import (
+    legacy_match_grocery_stores,
+    synthetic_stores,
+)
+
+
+def small_stores():
+    stores1 = pd.DataFrame(
+        {
+            "store_name": ["Jewel", "Aldi", "Mariano's", "Corner", "Jewel Express"],
+            "latitude": ["41.736172", "41.854608", "41.900000", None, "41.7362"],
+            "longitude": ["-87.626243", "-87.714370", "-87.650000", None, "-87.6262"],
+            "address": [
+                "87 W 87th St",
+                "3555 W OGDEN AVE",
+                "10 N State",
+                "5 Elm",
+                "87 W",
+            ],
+        }
+    )
+    stores2 = pd.DataFrame(
+        {
+            "store_name": ["Far Jewel", "Jewel", "Jewel Dup", "Aldi", "Other"],
+            "latitude": [41.80, 41.7362, 41.7361, 41.8546, 41.9],
+            "longitude": [-87.62, -87.6262, -87.6263, -87.7143, -87.65],
+            "address": ["87 W 87th", "87 W 87th", "87 W 87th", "3555 Ogden", "11 N"],
+        }
+    )
+    return stores1, stores2
+
+
+def test_first_match_semantics():
+    stores1, stores2 = small_stores()
+    matched = match_grocery_stores(stores1, stores2)
+    assert list(matched["is_snap"]) == [True, True, False, False, True]
+    assert list(matched["address"])[0] == "87 W 87Th St"
+    pd.testing.assert_frame_equal(
+        matched, legacy_match_grocery_stores(stores1, stores2)
+    )
+
+
+def test_inputs_not_modified():
+    stores1, stores2 = small_stores()
+    match_grocery_stores(stores1, stores2)
+    assert "match_id" not in stores1.columns
+    assert "address_num" not in stores2.columns
+
+
+@pytest.mark.parametrize("max_dist", [0, 300, 1000, 5000])
+def test_matches_legacy_loop(max_dist):
+    stores1, stores2 = synthetic_stores(60, 400, seed=3)
+    pd.testing.assert_frame_equal(
+        match_grocery_stores(stores1, stores2, max_dist=max_dist),
+        legacy_match_grocery_stores(stores1, stores2, max_dist=max_dist),
+    )
+
+
+def test_haversine_scalar_matches_array():
+    lats = np.array([41.8, 41.9, 40.7])
+    lons = np.array([-87.6, -87.7, -74.0])
+    dists = haversine_one_to_many(41.736172, -87.626243, lats, lons)
+    for i in range(3):
+        assert dists[i] == pytest.approx(
+            haversine_distance(41.736172, -87.626243, lats[i], lons[i])
+        )
+    assert haversine(pd.Series(lats), pd.Series(lons), lats, lons).max() == 0
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_chunked_matrix(dtype):
+    rng = np.random.default_rng(0)
+    lats1, lons1 = rng.uniform(41, 42, 50), rng.uniform(-88, -87, 50)
+    lats2, lons2 = rng.uniform(41, 42, 70), rng.uniform(-88, -87, 70)
+    full = haversine(lats1[:, None], lons1[:, None], lats2, lons2)
+
+    chunks = list(haversine_matrix_chunks(lats1, lons1, lats2, lons2, max_bytes=1))
+    assert len(chunks) == 50
+    matrix = haversine_matrix(lats1, lons1, lats2, lons2, dtype=dtype)
+    assert matrix.dtype == dtype
+    np.testing.assert_allclose(matrix, full, rtol=1e-6)
+
+    index, dist = nearest_points(lats1, lons1, lats2, lons2, max_bytes=4096)
+    np.testing.assert_array_equal(index, full.argmin(axis=1))
+    np.testing.assert_allclose(dist, full.min(axis=1))
+
+    with pytest.raises(MemoryError):
+        haversine_matrix(lats1, lons1, lats2, lons2, max_bytes=1024)
+
+
+def test_incremental_matches_full_run(tmp_path):
+    stores1, stores2 = synthetic_stores(80, 500, seed=4)
+    state_path = tmp_path / "state.json"
+    full = match_grocery_stores(stores1, stores2)
+
+    first = match_grocery_stores_incremental(stores1, stores2, state_path=state_path)
+    assert list(first["store_id"]) == list(range(1, 81))
+    pd.testing.assert_frame_equal(first.drop(columns="store_id"), full)
+
+    again = match_grocery_stores_incremental(stores1, stores2, state_path=state_path)
+    pd.testing.assert_frame_equal(again, first)
+
+
+def test_incremental_refresh(tmp_path):
+    stores1, stores2 = synthetic_stores(80, 500, seed=5)
+    state_path = tmp_path / "state.json"
+    first = match_grocery_stores_incremental(stores1, stores2, state_path=state_path)
+
+    # drop a store, change another and add a SNAP retailer next to a store
+    # that had no match
+    unmatched = first.index[~first["is_snap"]][0]
+    new_snap = stores1.loc[[unmatched]].rename(index={unmatched: len(stores2)})
+    stores2 = pd.concat([stores2, new_snap])
+    stores1 = stores1.drop(index=0)
+    stores1.loc[1, "store_name"] = "Renamed"
+
+    refreshed = match_grocery_stores_incremental(
+        stores1, stores2, state_path=state_path
+    )
+    assert refreshed.loc[refreshed["store_name"] == "Renamed", "store_id"].item() == 81
+    kept = refreshed["store_name"] != "Renamed"
+    assert list(refreshed.loc[kept, "store_id"]) == list(first["store_id"][2:])
+    assert refreshed.loc[unmatched - 1, "is_snap"]
+    pd.testing.assert_frame_equal(
+        refreshed.drop(columns="store_id"), match_grocery_stores(stores1, stores2)
+    )
+
+
+def test_incremental_keeps_store_ids_of_edited_stores(tmp_path):
+    stores1, stores2 = synthetic_stores(80, 500, seed=7)
+    state_path = tmp_path / "state.json"
+    first = match_grocery_stores_incremental(stores1, stores2, state_path=state_path)
+
+    # move a matched store away from its SNAP retailer, correct the
+    # coordinates of another and change the casing of a third store's name
+    matched = first.index[first["is_snap"]][0]
+    stores1.loc[matched, "latitude"] += 1
+    stores1.loc[3, "longitude"] += 0.0001
+    stores1.loc[4, "store_name"] = "  " + stores1.loc[4, "store_name"].upper()
+
+    refreshed = match_grocery_stores_incremental(
+        stores1, stores2, state_path=state_path
+    )
+    assert list(refreshed["store_id"]) == list(first["store_id"])
+    assert not refreshed.loc[matched, "is_snap"]
+    pd.testing.assert_frame_equal(
+        refreshed.drop(columns="store_id"), match_grocery_stores(stores1, stores2)
+    )
+
+
+def test_stable_store_ids_read_the_match_state(tmp_path):
+    stores1, stores2 = synthetic_stores(40, 200, seed=8)
+    state_path = tmp_path / "state.json"
+    assert list(stable_store_ids(stores1, state_path=state_path)) == list(range(1, 41))
+    match_grocery_stores_incremental(stores1, stores2, state_path=state_path)
+    state = state_path.read_text()
+
+    # a store closes, one opens and one moves
+    stores1 = stores1.drop(index=0)
+    stores1.loc[1, "store_name"] = "Renamed"
+    stores1.loc[2, "latitude"] += 0.01
+    store_ids = stable_store_ids(stores1, state_path=state_path)
+
+    assert state_path.read_text() == state
+    refreshed = match_grocery_stores_incremental(
+        stores1, stores2, state_path=state_path
+    )
+    assert list(store_ids) == list(refreshed["store_id"])
+    assert store_ids[0] == 41
+
+
+def test_incremental_empty_inputs(tmp_path):
+    stores1, stores2 = synthetic_stores(20, 50, seed=6)
+    state_path = tmp_path / "state.json"
+
+    no_snap = match_grocery_stores_incremental(
+        stores1, stores2.iloc[:0], state_path=state_path
+    )
+    pd.testing.assert_frame_equal(
+        no_snap.drop(columns="store_id"),
+        match_grocery_stores(stores1, stores2.iloc[:0]),
+    )
+    assert not no_snap["is_snap"].any()
+
+    no_stores = match_grocery_stores_incremental(
+        stores1.iloc[:0], stores2, state_path=state_path
+    )
+    assert no_stores.empty
+    assert row_keys(stores1.iloc[:0]).empty
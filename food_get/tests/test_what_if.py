@@ -0,0 +1,137 @@
+"""
+Project: Analyzing food access and security in Chicago
+Team: food.get
+File Name: test_what_if.py
+
+Description:
+    Tests for the incremental store opening and closure model and the marginal
+    coverage of each store, checked against rebuilding the 2022 metric.
+"""
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+
+from food_get.analysis import generate_metric, what_if
+from food_get.analysis.generate_metric import find_intersections
+from food_get.analysis.access import covered_areas
+from food_get.analysis.what_if import build_access_model, marginal_coverage
+from food_get.tests.tract_grid import (
+    grid_tracts,
+    half_mile_buffers,
+    store_points,
+    use_tracts,
+)
+
+
+@pytest.fixture
+def tracts(monkeypatch):
+    return use_tracts(monkeypatch, grid_tracts(size=5))
+
+
+def rebuilt_metric(stores):
+    return find_intersections(half_mile_buffers(stores))
+
+
+def test_access_model_edits_match_rebuild(tracts):
+    rng = np.random.default_rng(4)
+    stores = store_points(rng.uniform(0, 5000, (8, 2)), range(1, 9))
+    model = build_access_model(stores)
+
+    expected = rebuilt_metric(stores)
+    np.testing.assert_allclose(
+        model.metrics()["lapophalfshare_2022"], expected["ratio"], atol=1e-12
+    )
+
+    closed = model.remove_store(3)
+    point = gpd.GeoSeries(gpd.points_from_xy([2500], [2500]), crs=3174).to_crs(4326)
+    opened = model.add_store(point.x[0], point.y[0])
+
+    stores = pd.concat(
+        [stores[stores["store_id"] != 3], store_points([(2500, 2500)], [9])]
+    )
+    expected = rebuilt_metric(stores)
+    metrics = model.metrics()
+    np.testing.assert_allclose(
+        metrics["lapophalfshare_2022"], expected["ratio"], atol=1e-9
+    )
+    assert metrics["LATracts_half_2022"].tolist() == expected["low_access"].tolist()
+    # only the tracts under the new buffer are returned, the central tract
+    # and its neighbours
+    assert "17031000012" in opened["tract_id"].tolist()
+    assert len(opened) == 9
+    assert 0 < len(closed) < len(tracts)
+    assert list(opened.columns) == [
+        "tract_id",
+        "lapophalfshare_2022",
+        "LATracts_half_2022",
+    ]
+
+
+def test_access_model_rejects_unknown_stores(tracts):
+    model = build_access_model(store_points([(500, 500)], [1]))
+
+    with pytest.raises(KeyError):
+        model.remove_store(2)
+    with pytest.raises(ValueError):
+        model.add_store(-87.6, 41.8, store_id=1)
+
+    model.remove_store(1)
+    assert (model.metrics()["lapophalfshare_2022"] == 0).all()
+
+
+def test_marginal_coverage_matches_removing_each_store(tracts, monkeypatch):
+    rng = np.random.default_rng(5)
+    # the last store duplicates the first, so neither covers anything alone
+    xy = np.vstack([rng.uniform(0, 5000, (9, 2)), [[0, 0]]])
+    xy[0] = (0, 0)
+    stores = store_points(xy, range(1, 11))
+    buffers = half_mile_buffers(stores)
+    population = pd.Series(1000.0, index=tracts["GEOID_TRACT_20"])
+    monkeypatch.setattr(what_if, "tract_population", lambda: population)
+
+    by_tract, by_store = marginal_coverage(buffers)
+
+    projected = tracts.to_crs(4326).to_crs(3174)
+    covered = covered_areas(projected, buffers)
+    for position, store_id in enumerate(stores["store_id"]):
+        without = covered_areas(projected, buffers.drop(index=position))
+        lost = covered - without
+        store_tracts = by_tract[by_tract["store_id"] == store_id]
+        expected = pd.Series(lost, index=tracts["GEOID_TRACT_20"])
+        expected = expected[expected > 1e-6]
+        assert store_tracts["tract_id"].tolist() == expected.index.tolist()
+        np.testing.assert_allclose(store_tracts["unique_area"], expected, rtol=1e-9)
+        store = by_store[by_store["store_id"] == store_id].iloc[0]
+        assert store["unique_area"] == pytest.approx(lost.sum(), rel=1e-9, abs=1e-6)
+        assert store["unique_population"] == pytest.approx(
+            (1000 * lost / projected.area).sum(), rel=1e-9, abs=1e-6
+        )
+
+    assert by_store["store_id"].tolist() == list(range(1, 11))
+    assert by_store.loc[[0, 9], "unique_area"].tolist() == [0, 0]
+
+
+def test_default_stores_keep_matched_store_ids(tracts, monkeypatch):
+    matched = pd.DataFrame(
+        {
+            "store_id": [7, 3, 12],
+            "store_name": ["A", "B", "C"],
+            "latitude": [41.0, 41.0, 41.0],
+            "longitude": [-87.0, -87.0, -87.0],
+            "address": ["1 A St", "2 B St", "3 C St"],
+        }
+    )
+    points = tracts.to_crs(4326).centroid.iloc[[0, 12, 24]]
+    matched["longitude"], matched["latitude"] = points.x.values, points.y.values
+    monkeypatch.setattr(generate_metric, "grocery_stores_with_ids", lambda: matched)
+    monkeypatch.setattr(what_if, "tract_population", lambda: pd.Series(dtype="float64"))
+
+    model = build_access_model()
+    _, by_store = marginal_coverage()
+
+    assert sorted(model.buffers) == [3, 7, 12]
+    assert model.remove_store(3)["tract_id"].tolist()[0] == "17031000006"
+    assert by_store["store_id"].tolist() == [7, 3, 12]
+    assert (by_store["unique_area"] > 0).all()
@@ -0,0 +1,87 @@
+"""
+Project: Analyzing food access and security in Chicago
+Team: food.get
+File Name: tract_grid.py
+
+Description:
+    This file builds the synthetic tracts and stores the access metric tests
+    run on: a grid of square tracts in EPSG:3174 and store points and buffers
+    placed on it.
+"""
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely.geometry import box
+
+from food_get.analysis import generate_metric, what_if
+from food_get.analysis.generate_metric import M_TO_MILES
+
+
+def grid_tracts(size=4, width=1000.0):
+    """
+    Returns a size x size grid of square tracts, width metres wide.
+    """
+    cells = [
+        box(col * width, row * width, (col + 1) * width, (row + 1) * width)
+        for row in range(size)
+        for col in range(size)
+    ]
+    return gpd.GeoDataFrame(
+        {"GEOID_TRACT_20": ["17031{:06d}".format(i) for i in range(len(cells))]},
+        geometry=cells,
+        crs=3174,
+    )
+
+
+def store_points(xy, store_ids=None):
+    """
+    Returns store points at the (x, y) pairs in xy, numbered from 1 unless
+    store_ids are given.
+    """
+    x, y = np.transpose(np.asarray(xy, dtype=np.float64).reshape(-1, 2))
+    if store_ids is None:
+        store_ids = range(1, len(x) + 1)
+    return gpd.GeoDataFrame(
+        {"store_id": store_ids}, geometry=gpd.points_from_xy(x, y), crs=3174
+    )
+
+
+def random_stores(n_stores, seed=0, extent=4000.0):
+    """
+    Returns n_stores store points spread uniformly over [0, extent] squared.
+    """
+    rng = np.random.default_rng(seed)
+    x, y = rng.uniform(0, extent, (2, n_stores))
+    return store_points(np.column_stack((x, y)))
+
+
+def random_buffers(n_stores, seed=0, extent=4000.0, radius=400.0):
+    """
+    Returns buffers of radius metres around random store points.
+    """
+    buffers = random_stores(n_stores, seed, extent)
+    buffers["geometry"] = buffers.buffer(radius)
+    return buffers
+
+
+def half_mile_buffers(stores):
+    """
+    Returns the stores with half mile buffers around them, as create_buffers
+    makes them.
+    """
+    return stores.assign(geometry=stores.buffer(0.5 * M_TO_MILES))
+
+
+def use_tracts(monkeypatch, tracts):
+    """
+    Makes the metric and the access model read tracts in place of the 2020
+    tracts bounded by the shore.
+    """
+    for module in (generate_metric, what_if):
+        monkeypatch.setattr(
+            module,
+            "restrict_tract_to_shore",
+            lambda: pd.DataFrame(tracts.to_crs(4326)),
+        )
+    return tracts